@@ -0,0 +1,121 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.future import select
+
+from backend import changefeed, metrics
+from backend.database import AsyncSessionMaker
+from backend.models import Activity, Scan
+
+
+class ActivityCatalog:
+    # Interns (name, category) pairs to activity ids. Ids never change once
+    # assigned, so entries are never invalidated, only added.
+    def __init__(self):
+        self._ids: Dict[Tuple[str, str], int] = {}
+        self._names: Dict[int, Tuple[str, str]] = {}
+        self._lock = asyncio.Lock()
+        self.stats = {"hits": 0, "misses": 0, "filter_lookups": 0}
+
+    def metrics(self):
+        return {**self.stats, "activities": len(self._ids)}
+
+    def _remember(self, activity_id: int, name: str, category: str):
+        self._ids[(name, category)] = activity_id
+        self._names[activity_id] = (name, category)
+
+    def name_of(self, activity_id: int) -> Optional[Tuple[str, str]]:
+        return self._names.get(activity_id)
+
+    async def describe(self, activity_ids) -> Dict[int, Tuple[str, str]]:
+        missing = [i for i in activity_ids if i not in self._names]
+        if missing:
+            async with AsyncSessionMaker() as db:
+                result = await db.execute(
+                    select(Activity.id, Activity.name, Activity.category).filter(Activity.id.in_(missing))
+                )
+                for activity_id, name, category in result.fetchall():
+                    self._remember(activity_id, name, category)
+        return {i: self._names[i] for i in activity_ids}
+
+    def _cached_ids(self, name: Optional[str], category: Optional[str]) -> List[int]:
+        return [
+            activity_id
+            for (activity_name, activity_category), activity_id in self._ids.items()
+            if (not name or activity_name == name) and (not category or activity_category == category)
+        ]
+
+    async def ids_for(self, name: Optional[str] = None, category: Optional[str] = None) -> List[int]:
+        ids = self._cached_ids(name, category)
+        if ids:
+            return ids
+        # An activity first scanned on another worker may not have arrived
+        # over the change feed yet.
+        self.stats["filter_lookups"] += 1
+        async with AsyncSessionMaker() as db:
+            query = select(Activity.id, Activity.name, Activity.category)
+            if name:
+                query = query.filter(Activity.name == name)
+            if category:
+                query = query.filter(Activity.category == category)
+            for activity_id, activity_name, activity_category in (await db.execute(query)).fetchall():
+                self._remember(activity_id, activity_name, activity_category)
+        return self._cached_ids(name, category)
+
+    def on_activities(self, events: List[changefeed.ChangeEvent]):
+        # Only inserts are published, and a reconnect replays the missed
+        # ones, so a resync needs no extra work.
+        for change in events:
+            if change.op == "insert" and change.row:
+                self._remember(change.id, change.row["name"], change.row["category"])
+
+    async def warm(self):
+        async with AsyncSessionMaker() as db:
+            result = await db.execute(select(Activity.id, Activity.name, Activity.category))
+            for activity_id, name, category in result.fetchall():
+                self._remember(activity_id, name, category)
+
+    async def resolve(self, name: str, category: str) -> int:
+        activity_id = self._ids.get((name, category))
+        if activity_id is not None:
+            self.stats["hits"] += 1
+            return activity_id
+
+        self.stats["misses"] += 1
+        async with self._lock:
+            activity_id = self._ids.get((name, category))
+            if activity_id is not None:
+                return activity_id
+            # Committed in its own transaction so a rolled-back scan can never
+            # leave the cache pointing at a row that does not exist.
+            async with AsyncSessionMaker() as db:
+                result = await db.execute(
+                    insert(Activity)
+                    .values(name=name, category=category)
+                    .on_conflict_do_nothing(index_elements=["name", "category"])
+                    .returning(Activity.id)
+                )
+                activity_id = result.scalar_one_or_none()
+                if activity_id is None:
+                    result = await db.execute(
+                        select(Activity.id).filter(Activity.name == name, Activity.category == category)
+                    )
+                    activity_id = result.scalar_one()
+                await db.commit()
+            self._remember(activity_id, name, category)
+            return activity_id
+
+
+def activity_filter(name: Optional[str] = None, category: Optional[str] = None):
+    query = select(Activity.id)
+    if name:
+        query = query.filter(Activity.name == name)
+    if category:
+        query = query.filter(Activity.category == category)
+    return Scan.activity_id.in_(query)
+
+
+catalog = ActivityCatalog()
+changefeed.subscribe("activities", catalog.on_activities)
+metrics.register("activity_catalog", catalog.metrics)
@@ -1,32 +1,93 @@
+import hashlib
+import os
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from typing import Dict, Optional
 from backend.schemas import TokenData
+from backend.passwords import hash_password, verify_password
 
-SECRET_KEY = "your_secret_key"  
+SECRET_KEY = "your_secret_key"
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+def load_signing_keys() -> Dict[str, str]:
+    # JWT_KEYS="2026a:secret-one,2026b:secret-two"; every listed key is
+    # accepted for verification, only JWT_ACTIVE_KID signs new tokens.
+    raw = os.getenv("JWT_KEYS", "")
+    keys = {}
+    for item in raw.split(","):
+        if ":" in item:
+            kid, secret = item.split(":", 1)
+            keys[kid.strip()] = secret.strip()
+    return keys or {"default": SECRET_KEY}
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+
+SIGNING_KEYS = load_signing_keys()
+ACTIVE_KID = os.getenv("JWT_ACTIVE_KID") or next(iter(SIGNING_KEYS))
+
+# sha256(token) -> (claims, kid); entries are dropped once they expire.
+_token_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+
+def _encode(claims: dict) -> str:
+    from jose import jwt
+    return jwt.encode(claims, SIGNING_KEYS[ACTIVE_KID], algorithm=ALGORITHM, headers={"kid": ACTIVE_KID})
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.update({"exp": expire, "type": "access"})
+    return _encode(to_encode)
 
-def decode_access_token(token: str) -> Optional[str]:
+def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    to_encode = data.copy()
+    expire = datetime.utcnow() + (expires_delta or timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+    to_encode.update({"exp": expire, "type": "refresh", "jti": uuid.uuid4().hex})
+    return _encode(to_encode)
+
+def _verify(token: str):
+    from jose import JWTError, jwt
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get("sub")  
+        kid = jwt.get_unverified_header(token).get("kid")
     except JWTError:
+        return None, None
+    candidates = [kid] if kid in SIGNING_KEYS else ([] if kid else list(SIGNING_KEYS))
+    for candidate in candidates:
+        try:
+            return jwt.decode(token, SIGNING_KEYS[candidate], algorithms=[ALGORITHM]), candidate
+        except JWTError:
+            continue
+    return None, None
+
+def decode_token(token: str, token_type: str = "access") -> Optional[dict]:
+    cache_key = hashlib.sha256(token.encode()).digest()
+    cached = _token_cache.get(cache_key)
+    if cached is not None:
+        claims, kid = cached
+        if claims["exp"] <= time.time() or kid not in SIGNING_KEYS:
+            _token_cache.pop(cache_key, None)
+            return None
+        _token_cache.move_to_end(cache_key)
+    else:
+        claims, kid = _verify(token)
+        if claims is None or "exp" not in claims:
+            return None
+        _token_cache[cache_key] = (claims, kid)
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+
+    if claims.get("type", "access") != token_type:
         return None
+    return claims
 
+def decode_access_token(token: str) -> Optional[str]:
+    claims = decode_token(token, "access")
+    return claims.get("sub") if claims else None
 
+def clear_token_cache():
+    _token_cache.clear()
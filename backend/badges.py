@@ -0,0 +1,142 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.future import select
+
+from backend import changefeed, metrics, queries
+from backend.database import AsyncSessionMaker
+from backend.models import EventRegistration, User
+
+
+class BadgeIndex:
+    # badge_code -> user_id for every user, plus each user's check-in time
+    # per event. Writes in this worker update it directly and other workers'
+    # writes arrive through the change feed, so scanners never read the
+    # users table. The database stays authoritative for check-in itself.
+    def __init__(self):
+        self._by_code: Dict[str, int] = {}
+        self._code_of: Dict[int, str] = {}
+        self._checked_in: Dict[Tuple[int, int], Optional[datetime]] = {}
+        self._lock = asyncio.Lock()
+        self._subscribed = False
+        self.stats = {"hits": 0, "misses": 0, "unknown": 0}
+
+    def metrics(self):
+        return {**self.stats, "badges": len(self._by_code)}
+
+    def remember(self, user_id: int, badge_code: Optional[str]):
+        previous = self._code_of.pop(user_id, None)
+        if previous is not None:
+            self._by_code.pop(previous, None)
+        if badge_code:
+            self._by_code[badge_code] = user_id
+            self._code_of[user_id] = badge_code
+
+    def forget(self, user_id: int):
+        self.remember(user_id, None)
+        for key in [key for key in self._checked_in if key[1] == user_id]:
+            del self._checked_in[key]
+
+    def set_checked_in(self, event_id: int, user_id: int, at: Optional[datetime]):
+        self._checked_in[(event_id, user_id)] = at
+
+    def checked_in_at(self, event_id: int, user_id: int) -> Optional[datetime]:
+        return self._checked_in.get((event_id, user_id))
+
+    async def warm(self):
+        async with AsyncSessionMaker() as db:
+            result = await db.execute(select(User.id, User.badge_code))
+            for user_id, badge_code in result.fetchall():
+                self.remember(user_id, badge_code)
+        await self.warm_check_ins()
+        if not self._subscribed:
+            changefeed.subscribe("users", self.on_users)
+            changefeed.subscribe("event_registrations", self.on_registrations)
+            self._subscribed = True
+
+    async def lookup(self, badge_code: str) -> Optional[int]:
+        user_id = self._by_code.get(badge_code)
+        if user_id is not None:
+            self.stats["hits"] += 1
+            return user_id
+
+        # Covers a user created on another worker whose notification hasn't
+        # arrived yet.
+        self.stats["misses"] += 1
+        async with AsyncSessionMaker() as db:
+            user_id = await queries.user_id_by_badge(db, badge_code)
+        if user_id is None:
+            self.stats["unknown"] += 1
+            return None
+        self.remember(user_id, badge_code)
+        return user_id
+
+    def on_users(self, events: List[changefeed.ChangeEvent]):
+        for change in events:
+            if change.op in ("insert", "update") and change.row:
+                self.remember(change.id, change.row.get("badge_code"))
+            elif change.op == "delete":
+                self.forget(change.id)
+            elif change.op == "resync":
+                asyncio.get_running_loop().create_task(self.warm_codes())
+
+    async def warm_codes(self):
+        async with self._lock:
+            async with AsyncSessionMaker() as db:
+                result = await db.execute(select(User.id, User.badge_code))
+                rows = result.fetchall()
+            self._by_code = {badge_code: user_id for user_id, badge_code in rows if badge_code}
+            self._code_of = {user_id: badge_code for user_id, badge_code in rows if badge_code}
+
+    def on_registrations(self, events: List[changefeed.ChangeEvent]):
+        # Check-ins and check-outs made on other workers.
+        for change in events:
+            if change.op == "resync":
+                asyncio.get_running_loop().create_task(self.warm_check_ins())
+                continue
+            row = change.row
+            if not row:
+                continue
+            at = row.get("checked_in_at") if change.op != "delete" else None
+            self.set_checked_in(row["event_id"], row["user_id"], datetime.fromisoformat(at) if at else None)
+
+    async def warm_check_ins(self):
+        async with AsyncSessionMaker() as db:
+            result = await db.execute(
+                select(EventRegistration.event_id, EventRegistration.user_id, EventRegistration.checked_in_at)
+                .filter(EventRegistration.checked_in_at.isnot(None))
+            )
+            self._checked_in = {(event_id, user_id): at for event_id, user_id, at in result.fetchall()}
+
+
+async def check_in(db, event_id: int, user_id: int) -> Optional[datetime]:
+    # One statement: registers walk-ins and only stamps registrations that
+    # aren't checked in yet. Returns None when the user already was.
+    now = datetime.utcnow()
+    statement = insert(EventRegistration).values(event_id=event_id, user_id=user_id, checked_in_at=now)
+    result = await db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["event_id", "user_id"],
+            set_={"checked_in_at": statement.excluded.checked_in_at},
+            where=EventRegistration.checked_in_at.is_(None),
+        ).returning(EventRegistration.checked_in_at)
+    )
+    checked_in_at = result.scalar_one_or_none()
+    await db.commit()
+    if checked_in_at is not None:
+        badges.set_checked_in(event_id, user_id, checked_in_at)
+    return checked_in_at
+
+
+async def check_out(db, event_id: int, user_id: int):
+    registration = await db.get(EventRegistration, (event_id, user_id))
+    if registration is not None:
+        registration.checked_in_at = None
+        await db.commit()
+    badges.set_checked_in(event_id, user_id, None)
+
+
+badges = BadgeIndex()
+metrics.register("badges", badges.metrics)
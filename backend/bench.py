@@ -0,0 +1,527 @@
+import argparse
+import asyncio
+import re
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+import httpx
+from sqlalchemy import delete, text
+from sqlalchemy.future import select
+from sqlalchemy.sql import func
+
+from backend.activities import activity_filter
+from backend.database import AsyncSessionMaker
+from backend.models import Event, Scan, User
+
+BENCH_ACTIVITY = "bench_retry_storm"
+
+
+def report(title, timings, extra=None):
+    timings = sorted(timings)
+    total = sum(timings)
+    print(f"📊 {title}")
+    print(f"   requests: {len(timings)}")
+    print(f"   p50: {timings[len(timings) // 2] * 1000:.2f} ms")
+    print(f"   p99: {timings[int(len(timings) * 0.99) - 1] * 1000:.2f} ms")
+    print(f"   mean: {statistics.mean(timings) * 1000:.2f} ms (total {total:.2f}s)")
+    for key, value in (extra or {}).items():
+        print(f"   {key}: {value}")
+
+
+async def count_bench_scans():
+    async with AsyncSessionMaker() as db:
+        result = await db.execute(
+            select(func.count()).select_from(Scan).where(activity_filter(BENCH_ACTIVITY))
+        )
+        return result.scalar_one()
+
+
+async def cleanup_bench_scans():
+    async with AsyncSessionMaker() as db:
+        await db.execute(delete(Scan).where(activity_filter(BENCH_ACTIVITY)))
+        await db.commit()
+
+
+async def retry_storm(requests: int, retries: int, concurrency: int):
+    from backend.main import app
+
+    async with AsyncSessionMaker() as db:
+        user_id = (await db.execute(select(User.id).limit(1))).scalar_one_or_none()
+    if user_id is None:
+        print("❌ ERROR: load users first (python -m backend.load_data).")
+        return
+
+    payload = {"activity_name": BENCH_ACTIVITY, "activity_category": "bench"}
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async def storm(use_keys: bool):
+        await cleanup_bench_scans()
+        timings = []
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+            async def one_scan():
+                headers = {"Idempotency-Key": str(uuid.uuid4())} if use_keys else {}
+                for _ in range(retries + 1):
+                    async with semaphore:
+                        started = time.perf_counter()
+                        response = await client.post(f"/scans/{user_id}", json=payload, headers=headers)
+                        timings.append(time.perf_counter() - started)
+                    response.raise_for_status()
+
+            await asyncio.gather(*(one_scan() for _ in range(requests)))
+        rows = await count_bench_scans()
+        await cleanup_bench_scans()
+        return timings, rows
+
+    for use_keys in (False, True):
+        timings, rows = await storm(use_keys)
+        report(
+            f"retry storm, {'with' if use_keys else 'without'} Idempotency-Key",
+            timings,
+            {"logical scans": requests, "rows written": rows, "duplicates": rows - requests},
+        )
+
+
+def cold_start(runs: int, top: int):
+    # Each run is a fresh interpreter, so nothing is shared with the parent.
+    code = "from backend.main import create_app; create_app()"
+    wall = []
+    cumulative = {}
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            capture_output=True, text=True, check=True,
+        )
+        wall.append(time.perf_counter() - started)
+        for line in result.stderr.splitlines():
+            match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)", line)
+            if match:
+                cumulative.setdefault(match.group(3), []).append(int(match.group(1)))
+
+    report(f"cold start (import backend.main + create_app), {runs} runs", wall)
+    slowest = sorted(cumulative.items(), key=lambda item: -statistics.median(item[1]))[:top]
+    print("   slowest imports (median cumulative):")
+    for name, micros in slowest:
+        print(f"     {statistics.median(micros) / 1000:8.1f} ms  {name}")
+
+
+def token_verify(iterations: int, tokens: int):
+    from backend import auth
+
+    issued = [auth.create_access_token({"sub": f"bench{i}@example.com"}) for i in range(tokens)]
+
+    def run(label, warm):
+        auth.clear_token_cache()
+        if warm:
+            for token in issued:
+                auth.decode_access_token(token)
+        timings = []
+        for i in range(iterations):
+            if not warm:
+                auth.clear_token_cache()
+            started = time.perf_counter()
+            assert auth.decode_access_token(issued[i % tokens]) is not None
+            timings.append(time.perf_counter() - started)
+        total = sum(timings)
+        report(label, timings, {"verifications/s": f"{iterations / total:,.0f}"})
+
+    run("token verify, full jose decode", warm=False)
+    run("token verify, cached claims", warm=True)
+
+
+def synthetic_columns(scans: int, users: int, activities: int):
+    import numpy as np
+    from backend import vectorized
+
+    rng = np.random.default_rng(7)
+    start = vectorized.to_micros(datetime.utcnow().replace(minute=0, second=0, microsecond=0))
+    columns = vectorized.ScanColumns()
+    columns.append(
+        np.arange(1, scans + 1),
+        rng.integers(1, users + 1, scans),
+        rng.integers(1, activities + 1, scans),
+        np.sort(rng.integers(start, start + 36 * vectorized.MICROS_PER_HOUR, scans)),
+    )
+    return columns
+
+
+async def seed_sql_scans(scans: int, activities: int):
+    from backend.activities import catalog
+
+    async with AsyncSessionMaker() as db:
+        user_ids = (await db.execute(select(User.id))).scalars().all()
+        event = Event(slug=f"bench-{uuid.uuid4().hex[:8]}", name="Analytics bench", starts_at=datetime.utcnow())
+        db.add(event)
+        await db.commit()
+        await db.refresh(event)
+    activity_ids = [await catalog.resolve(f"bench_activity_{i}", "bench") for i in range(activities)]
+    async with AsyncSessionMaker() as db:
+        await db.execute(
+            text(
+                "INSERT INTO scans (event_id, user_id, activity_id, scanned_at) "
+                "SELECT :event_id, "
+                "(CAST(:users AS int[]))[1 + floor(random() * :user_count)::int], "
+                "(CAST(:activities AS int[]))[1 + floor(random() * :activity_count)::int], "
+                "now() AT TIME ZONE 'utc' + random() * interval '36 hours' "
+                "FROM generate_series(1, :n)"
+            ),
+            {
+                "event_id": event.id, "n": scans,
+                "users": user_ids, "user_count": len(user_ids),
+                "activities": activity_ids, "activity_count": len(activity_ids),
+            },
+        )
+        await db.commit()
+    return event.id, user_ids[0]
+
+
+async def cleanup_sql_scans(event_id: int):
+    async with AsyncSessionMaker() as db:
+        await db.execute(delete(Scan).where(Scan.event_id == event_id))
+        await db.execute(delete(Event).where(Event.id == event_id))
+        await db.commit()
+
+
+async def time_sql_path(event_id: int, user_id: int, repeat: int):
+    queries = [
+        select(Scan.activity_id, func.count()).filter(Scan.event_id == event_id).group_by(Scan.activity_id),
+        select(func.date_trunc("hour", Scan.scanned_at).label("slot"), func.count())
+        .filter(Scan.event_id == event_id).group_by("slot").order_by("slot"),
+        select(Scan.activity_id, Scan.scanned_at)
+        .filter(Scan.event_id == event_id, Scan.user_id == user_id).order_by(Scan.scanned_at, Scan.id),
+    ]
+    timings = []
+    async with AsyncSessionMaker() as db:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for query in queries:
+                (await db.execute(query)).fetchall()
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def analytics_paths(scans: int, users: int, activities: int, repeat: int, sql: bool):
+    # Each timing is one pass over all three aggregates: counts per
+    # activity, an hourly histogram and one user's ordered sequence.
+    try:
+        from backend import vectorized
+        columns = synthetic_columns(scans, users, activities)
+    except ImportError:
+        print("❌ ERROR: the vectorized path needs NumPy (pip install numpy).")
+        return
+    target = int(columns.user_ids[0])
+    rows = list(zip(
+        columns.ids.tolist(), columns.user_ids.tolist(), columns.activity_ids.tolist(),
+        [vectorized.from_micros(at) for at in columns.scanned_at.tolist()],
+    ))
+
+    def python_pass():
+        counts, hours = {}, {}
+        for _, _, activity_id, scanned_at in rows:
+            counts[activity_id] = counts.get(activity_id, 0) + 1
+            slot = scanned_at.replace(minute=0, second=0, microsecond=0)
+            hours[slot] = hours.get(slot, 0) + 1
+        sorted((row for row in rows if row[1] == target), key=lambda row: (row[3], row[0]))
+
+    def vector_pass():
+        vectorized.activity_counts(columns)
+        vectorized.hourly_histogram(columns)
+        vectorized.user_sequence(columns, target)
+
+    for label, run in (("pure Python over row tuples", python_pass), ("NumPy columns", vector_pass)):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+        report(f"analytics, {label}, {scans:,} scans", timings)
+
+    if sql:
+        async def run_sql():
+            event_id, user_id = await seed_sql_scans(scans, activities)
+            try:
+                return await time_sql_path(event_id, user_id, repeat)
+            finally:
+                await cleanup_sql_scans(event_id)
+
+        report(f"analytics, Postgres aggregates, {scans:,} scans", asyncio.run(run_sql()))
+
+
+SEARCH_DOMAIN = "search.bench"
+FIRST_NAMES = ["Avery", "Jordan", "Priya", "Mateo", "Hreem", "Olivia", "Kenji", "Fatima", "Lucas", "Amara"]
+LAST_NAMES = ["Nguyen", "Patel", "Garcia", "Kowalski", "Okafor", "Lindqvist", "Tanaka", "Haddad", "Moreau", "Silva"]
+
+
+async def seed_search_users(users: int):
+    async with AsyncSessionMaker() as db:
+        await db.execute(
+            text(
+                "INSERT INTO users (name, email, phone, badge_code, hashed_password, is_active, is_admin, updated_at) "
+                "SELECT (CAST(:first AS text[]))[1 + i % 10] || ' ' || (CAST(:last AS text[]))[1 + (i / 10) % 10] || ' ' || i, "
+                "'hacker' || i || '@' || :domain, '555-0100', 'bench-' || md5(i::text), 'x', true, false, now() "
+                "FROM generate_series(1, :n) AS i"
+            ),
+            {"first": FIRST_NAMES, "last": LAST_NAMES, "domain": SEARCH_DOMAIN, "n": users},
+        )
+        await db.commit()
+        await db.execute(text("ANALYZE users"))
+        await db.commit()
+
+
+async def cleanup_search_users():
+    async with AsyncSessionMaker() as db:
+        await db.execute(delete(User).where(User.email.like(f"%@{SEARCH_DOMAIN}")))
+        await db.commit()
+
+
+async def user_search(users: int, queries: int):
+    from backend import crud
+
+    await cleanup_search_users()
+    await seed_search_users(users)
+    try:
+        cases = {
+            "prefix": [name[:k] for name in FIRST_NAMES + LAST_NAMES for k in (2, 3, 4)],
+            "fuzzy": ["Priay Patl", "Kowalsky", "Okafr", "Lindquist", "Mattteo Silva", "hacker4242@search", "Tanka"],
+        }
+        for mode, terms in cases.items():
+            timings = []
+            async with AsyncSessionMaker() as db:
+                for i in range(queries):
+                    started = time.perf_counter()
+                    await crud.search_users(db, terms[i % len(terms)], 20, mode)
+                    timings.append(time.perf_counter() - started)
+            report(f"user search, {mode}, {users:,} users", timings)
+    finally:
+        await cleanup_search_users()
+
+
+def synthetic_users_payload(users: int) -> bytes:
+    import json
+    import random
+
+    rng = random.Random(42)
+    activities = [f"Workshop {i}" for i in range(40)] + ["Breakfast", "Lunch", "Dinner", "Midnight Snack"]
+    payload = [
+        {
+            "id": i,
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "email": f"hacker{i}@example.com",
+            "phone": f"+1 (555) {rng.randint(100, 999)}-{rng.randint(1000, 9999)}",
+            "badge_code": uuid.UUID(int=rng.getrandbits(128)).hex[:16],
+            "updated_at": datetime(2025, 9, 12, rng.randint(0, 23), rng.randint(0, 59)).isoformat(),
+            "scans": [
+                {
+                    "activity_name": rng.choice(activities),
+                    "activity_category": rng.choice(["workshop", "meal", "social"]),
+                    "scanned_at": datetime(2025, 9, 13, rng.randint(0, 23), rng.randint(0, 59)).isoformat(),
+                }
+                for _ in range(rng.randint(0, 8))
+            ],
+        }
+        for i in range(users)
+    ]
+    return json.dumps(payload).encode()
+
+
+def compression_costs(users: int, repeat: int, polls: int):
+    from backend import compression
+
+    body = synthetic_users_payload(users)
+    print(f"payload: {len(body):,} bytes for {users:,} users; encoders: {', '.join(compression.ENCODERS)}")
+    levels = {
+        "gzip": (compression.GzipEncoder, (1, 6, 9)),
+        "br": (compression.BrotliEncoder, (1, 5, 11)),
+        "zstd": (compression.ZstdEncoder, (1, 3, 19)),
+    }
+    for name, (encoder_class, settings) in levels.items():
+        if name not in compression.ENCODERS:
+            continue
+        for level in settings:
+            encoder = encoder_class(level)
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                compressed = encoder.compress(body)
+                timings.append(time.perf_counter() - started)
+            mean = statistics.mean(timings)
+            report(f"{name} level {level}", timings, {
+                "bytes": f"{len(compressed):,} ({len(compressed) / len(body):.1%} of original)",
+                "saved per ms of CPU": f"{(len(body) - len(compressed)) / (mean * 1000) / 1024:,.1f} KiB",
+                "throughput": f"{len(body) / mean / 1e6:,.1f} MB/s",
+            })
+
+    # The same dashboard poll answered `polls` times: compressed per request
+    # versus compressed once into a cache entry.
+    encoding = next(iter(compression.ENCODERS))
+    entry = compression.CachedResponse(200, [], body, time.monotonic(), 0)
+    for label, per_request in (("per request", True), ("precompressed", False)):
+        timings = []
+        for _ in range(polls):
+            started = time.perf_counter()
+            if per_request:
+                compression.ENCODERS[encoding].compress(body)
+            else:
+                entry.variant(encoding)
+            timings.append(time.perf_counter() - started)
+        report(f"{polls} polls, {encoding} {label}", timings)
+
+
+def suggestion_index(users: int, activities: int, per_user: int, queries: int, max_size: Optional[int]):
+    import random
+
+    from backend import coattendance
+    from backend.coattendance import EventCoAttendance
+
+    if max_size is not None:
+        coattendance.COATTENDANCE_MAX_ACTIVITY_SIZE = max_size
+    rng = random.Random(7)
+    state = EventCoAttendance()
+    scans = [(user_id, rng.randrange(activities)) for user_id in range(users) for _ in range(per_user)]
+    started = time.perf_counter()
+    for user_id, activity_id in scans:
+        state.attend(user_id, activity_id)
+    elapsed = time.perf_counter() - started
+    pairs = sum(len(row) for row in state.shared.values()) // 2
+    print(f"indexed {len(scans):,} scans in {elapsed:.2f}s ({elapsed / len(scans) * 1e6:.1f} µs/scan), {pairs:,} pairs")
+    if not pairs:
+        raise SystemExit(
+            f"❌ Every activity is a crowd (~{users * per_user // activities} attendees each, cap "
+            f"{coattendance.COATTENDANCE_MAX_ACTIVITY_SIZE}); raise --activities or --max-activity-size"
+        )
+
+    timings = []
+    for _ in range(queries):
+        user_id = rng.randrange(users)
+        started = time.perf_counter()
+        state.suggestions(user_id, 10)
+        timings.append(time.perf_counter() - started)
+    report(f"top-10 suggestions, {users:,} users x {activities} activities", timings, {"crowds": len(state.crowds)})
+
+
+def query_overhead(iterations: int, db: bool):
+    # Python-side cost of getting a hot statement ready to execute: building
+    # the construct and computing the key SQLAlchemy looks it up by. The
+    # compile line is what every call paid before the cache could hit.
+    from sqlalchemy.dialects import postgresql
+
+    from backend import crud, queries
+    from backend.events import EventContext
+
+    event = EventContext(1, "bench", "Bench", datetime(2025, 9, 12), datetime(2025, 9, 15))
+    dialect = postgresql.asyncpg.dialect()
+
+    def adhoc_user():
+        return select(User).filter(User.email == "hacker@example.com")
+
+    def adhoc_leaderboard():
+        query = select(User.id, User.name, func.count(Scan.id).label("scan_count")).join(Scan).group_by(User.id).order_by(func.count(Scan.id).desc()).limit(10)
+        return crud.scoped_scans(query, event, None, None)
+
+    cases = [
+        ("user by email, built per call", lambda: adhoc_user()._generate_cache_key()),
+        ("user by email, prebuilt", lambda: queries.USER_BY_EMAIL._generate_cache_key()),
+        ("leaderboard, built per call", lambda: adhoc_leaderboard()._generate_cache_key()),
+        ("leaderboard, lambda statement", lambda: queries.leaderboard_statement(event)._generate_cache_key()),
+        ("leaderboard, compiled per call", lambda: adhoc_leaderboard().compile(dialect=dialect)),
+    ]
+    for label, run in cases:
+        run()
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+        report(label, timings)
+
+    if db:
+        async def round_trips():
+            async with AsyncSessionMaker() as session:
+                for label, execute in (
+                    ("user by email, built per call, with the database", lambda: session.execute(adhoc_user())),
+                    ("user by email, prebuilt, with the database", lambda: queries.user_by_email(session, "hacker@example.com")),
+                ):
+                    await execute()
+                    timings = []
+                    for _ in range(iterations):
+                        started = time.perf_counter()
+                        await execute()
+                        timings.append(time.perf_counter() - started)
+                    report(label, timings)
+
+        asyncio.run(round_trips())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hack The North backend benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    storm = commands.add_parser("retry-storm", help="Scanner retries with and without idempotency keys")
+    storm.add_argument("--requests", type=int, default=200)
+    storm.add_argument("--retries", type=int, default=4)
+    storm.add_argument("--concurrency", type=int, default=20)
+
+    cold = commands.add_parser("cold-start", help="Time a fresh worker importing and building the app")
+    cold.add_argument("--runs", type=int, default=10)
+    cold.add_argument("--top", type=int, default=15)
+
+    verify = commands.add_parser("token-verify", help="JWT verification throughput, cold vs cached")
+    verify.add_argument("--iterations", type=int, default=20000)
+    verify.add_argument("--tokens", type=int, default=1000)
+
+    vector = commands.add_parser("analytics", help="Scan aggregates in SQL, pure Python and NumPy")
+    vector.add_argument("--scans", type=int, default=1_000_000)
+    vector.add_argument("--users", type=int, default=1000)
+    vector.add_argument("--activities", type=int, default=50)
+    vector.add_argument("--repeat", type=int, default=5)
+    vector.add_argument("--sql", action="store_true", help="Also seed a throwaway event in Postgres and time the SQL path")
+
+    search = commands.add_parser("user-search", help="Latency of /users/search against many synthetic users")
+    search.add_argument("--users", type=int, default=100_000)
+    search.add_argument("--queries", type=int, default=200)
+
+    compress = commands.add_parser("compression", help="CPU cost versus bytes saved for each response encoding")
+    compress.add_argument("--users", type=int, default=5000)
+    compress.add_argument("--repeat", type=int, default=20)
+    compress.add_argument("--polls", type=int, default=200)
+
+    suggest = commands.add_parser("suggestions", help="Co-attendance index build cost and suggestion latency")
+    suggest.add_argument("--users", type=int, default=2000)
+    # ~80 attendees per activity, under the default crowd cap of 150.
+    suggest.add_argument("--activities", type=int, default=300)
+    suggest.add_argument("--per-user", type=int, default=12)
+    suggest.add_argument("--queries", type=int, default=1000)
+    suggest.add_argument("--max-activity-size", type=int, help="Override COATTENDANCE_MAX_ACTIVITY_SIZE")
+
+    overhead = commands.add_parser("queries", help="Per-request Python overhead of hot statements, ad hoc vs cached")
+    overhead.add_argument("--iterations", type=int, default=5000)
+    overhead.add_argument("--db", action="store_true", help="Also time round trips against Postgres")
+
+    args = parser.parse_args()
+    if args.command == "retry-storm":
+        asyncio.run(retry_storm(args.requests, args.retries, args.concurrency))
+    elif args.command == "cold-start":
+        cold_start(args.runs, args.top)
+    elif args.command == "token-verify":
+        token_verify(args.iterations, args.tokens)
+    elif args.command == "analytics":
+        analytics_paths(args.scans, args.users, args.activities, args.repeat, args.sql)
+    elif args.command == "user-search":
+        asyncio.run(user_search(args.users, args.queries))
+    elif args.command == "compression":
+        compression_costs(args.users, args.repeat, args.polls)
+    elif args.command == "suggestions":
+        suggestion_index(args.users, args.activities, args.per_user, args.queries, args.max_activity_size)
+    elif args.command == "queries":
+        query_overhead(args.iterations, args.db)
+
+
+if __name__ == "__main__":
+    main()
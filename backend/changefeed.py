@@ -0,0 +1,232 @@
+import asyncio
+import inspect
+import json
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import asyncpg
+
+from backend.database import ASYNCPG_DSN
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "htn_changes"
+WATCHED_TABLES = ("users", "scans", "connections", "activities")
+# Tables without an id column: notified, but not replayable after a
+# disconnect, so their subscribers only get the resync.
+NOTIFY_ONLY_TABLES = ("event_registrations",)
+
+# Notifications arriving within this window are merged into one dispatch.
+COALESCE_WINDOW = 0.05
+MAX_BATCH = 1000
+CATCHUP_LIMIT = 10000
+HEALTHCHECK_INTERVAL = 30.0
+RECONNECT_MAX_DELAY = 30.0
+
+
+@dataclass
+class ChangeEvent:
+    table: str
+    op: str  # "insert", "update", "delete" or "resync"
+    id: Optional[int] = None
+    row: Dict[str, Any] = field(default_factory=dict)
+
+
+Subscriber = Callable[[List[ChangeEvent]], Any]
+
+_subscribers: Dict[str, List[Subscriber]] = defaultdict(list)
+
+
+def subscribe(table: str, callback: Subscriber):
+    if table not in WATCHED_TABLES + NOTIFY_ONLY_TABLES:
+        raise ValueError(f"Unknown table for change feed: {table}")
+    _subscribers[table].append(callback)
+
+
+def unsubscribe(table: str, callback: Subscriber):
+    if callback in _subscribers[table]:
+        _subscribers[table].remove(callback)
+
+
+def decode(payload: str) -> Optional[ChangeEvent]:
+    try:
+        data = json.loads(payload)
+        return ChangeEvent(
+            table=data["table"],
+            op=data["op"],
+            id=data.get("id"),
+            row=data.get("row") or {},
+        )
+    except (ValueError, KeyError, TypeError):
+        logger.warning("Dropping malformed change notification: %r", payload)
+        return None
+
+
+def coalesce(events: List[ChangeEvent]) -> List[ChangeEvent]:
+    merged: Dict[Any, Optional[ChangeEvent]] = {}
+    for event in events:
+        if event.id is None and event.op != "resync":
+            # Nothing to merge on; keep every change.
+            merged[object()] = event
+            continue
+        key = (event.table, event.id if event.op != "resync" else "resync")
+        previous = merged.get(key)
+        if previous is None:
+            merged[key] = event
+        elif previous.op == "insert" and event.op == "update":
+            merged[key] = ChangeEvent(event.table, "insert", event.id, event.row)
+        elif previous.op == "insert" and event.op == "delete":
+            merged[key] = None
+        else:
+            merged[key] = event
+    return [event for event in merged.values() if event is not None]
+
+
+async def dispatch(events: List[ChangeEvent]):
+    by_table: Dict[str, List[ChangeEvent]] = defaultdict(list)
+    for event in events:
+        by_table[event.table].append(event)
+
+    for table, table_events in by_table.items():
+        for callback in list(_subscribers.get(table, ())):
+            try:
+                result = callback(table_events)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Change feed subscriber %r failed", callback)
+
+
+class ChangeFeed:
+    def __init__(self, dsn: str = ASYNCPG_DSN):
+        self.dsn = dsn
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.last_seen: Dict[str, int] = {}
+        self._connection: Optional[asyncpg.Connection] = None
+        self._lost: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def listen(self):
+        # LISTEN without dispatching: notifications queue up until start(),
+        # so caches built in between miss nothing committed meanwhile. They
+        # may see a change both in their rebuild and on the feed.
+        self._stopping = False
+        try:
+            self._lost = await self._connect()
+            await self._prime_last_seen()
+        except Exception as e:
+            logger.warning("Change feed could not connect (%s), retrying once started", e)
+            await self._close()
+            self._lost = None
+
+    async def start(self):
+        self._stopping = False
+        lost, self._lost = self._lost, None
+        self._tasks = [
+            asyncio.create_task(self._listen_forever(lost), name="changefeed-listener"),
+            asyncio.create_task(self._dispatch_forever(), name="changefeed-dispatcher"),
+        ]
+
+    async def stop(self):
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._close()
+
+    def _on_notify(self, connection, pid, channel, payload):
+        event = decode(payload)
+        if event is not None:
+            self.queue.put_nowait(event)
+
+    async def _close(self):
+        if self._connection is not None and not self._connection.is_closed():
+            try:
+                await self._connection.close()
+            except Exception:
+                pass
+        self._connection = None
+
+    async def _connect(self):
+        connection = await asyncpg.connect(self.dsn)
+        lost = asyncio.Event()
+        connection.add_termination_listener(lambda _: lost.set())
+        await connection.add_listener(CHANNEL, self._on_notify)
+        self._connection = connection
+        return lost
+
+    async def _listen_forever(self, lost: Optional[asyncio.Event] = None):
+        delay = 1.0
+        while not self._stopping:
+            try:
+                if lost is None:
+                    lost = await self._connect()
+                    if self.last_seen:
+                        await self._catch_up()
+                    else:
+                        await self._prime_last_seen()
+                delay = 1.0
+                logger.info("Change feed listening on %s", CHANNEL)
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), HEALTHCHECK_INTERVAL)
+                    except asyncio.TimeoutError:
+                        await self._connection.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Change feed connection lost (%s), retrying in %.0fs", e, delay)
+            lost = None
+            await self._close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _prime_last_seen(self):
+        for table in WATCHED_TABLES:
+            self.last_seen[table] = await self._connection.fetchval(
+                f"SELECT COALESCE(MAX(id), 0) FROM {table}"
+            )
+
+    async def _catch_up(self):
+        # Inserts missed while disconnected are replayed by id; updates and
+        # deletes cannot be recovered that way, so subscribers get a resync.
+        for table in WATCHED_TABLES:
+            rows = await self._connection.fetch(
+                f"SELECT id, (to_jsonb(t) - 'hashed_password')::text AS row "
+                f"FROM {table} t WHERE id > $1 ORDER BY id LIMIT $2",
+                self.last_seen.get(table, 0),
+                CATCHUP_LIMIT,
+            )
+            for record in rows:
+                self.queue.put_nowait(
+                    ChangeEvent(table, "insert", record["id"], json.loads(record["row"]))
+                )
+            self.queue.put_nowait(ChangeEvent(table, "resync"))
+        for table in NOTIFY_ONLY_TABLES:
+            self.queue.put_nowait(ChangeEvent(table, "resync"))
+
+    async def _dispatch_forever(self):
+        while True:
+            events = [await self.queue.get()]
+            deadline = asyncio.get_running_loop().time() + COALESCE_WINDOW
+            while len(events) < MAX_BATCH:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    events.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            for event in events:
+                if event.id is not None and event.op == "insert":
+                    self.last_seen[event.table] = max(self.last_seen.get(event.table, 0), event.id)
+
+            await dispatch(coalesce(events))
+
+
+change_feed = ChangeFeed()
@@ -0,0 +1,224 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.future import select
+from sqlalchemy.sql import func
+
+from backend import changefeed, metrics
+from backend.database import AsyncSessionMaker
+from backend.models import Connection, Scan
+
+logger = logging.getLogger(__name__)
+
+# Activities bigger than this (meals, opening ceremony) say little about who
+# should meet and would make the pair matrix dense, so they don't count.
+COATTENDANCE_MAX_ACTIVITY_SIZE = int(os.getenv("COATTENDANCE_MAX_ACTIVITY_SIZE", "150"))
+# Rebuilds read only this many days of scans, i.e. the recent partitions.
+COATTENDANCE_REBUILD_DAYS = float(os.getenv("COATTENDANCE_REBUILD_DAYS", "7"))
+
+
+class EventCoAttendance:
+    def __init__(self):
+        # The user x activity incidence, with scan counts so a deleted scan
+        # only ends attendance when it was the last one.
+        self.attendance: Dict[int, Dict[int, int]] = defaultdict(dict)
+        self.attendees: Dict[int, Set[int]] = defaultdict(set)
+        # Sparse symmetric user x user matrix of shared activities, one dict
+        # per row so rows can grow as scans arrive.
+        self.shared: Dict[int, Dict[int, int]] = defaultdict(dict)
+        self.crowds: Set[int] = set()
+        self.connected: Dict[int, Set[int]] = defaultdict(set)
+
+    def _add_pairs(self, user_id: int, others, delta: int):
+        row = self.shared[user_id]
+        for other in others:
+            if other == user_id:
+                continue
+            weight = row.get(other, 0) + delta
+            other_row = self.shared[other]
+            if weight > 0:
+                row[other] = other_row[user_id] = weight
+            else:
+                row.pop(other, None)
+                other_row.pop(user_id, None)
+
+    def attend(self, user_id: int, activity_id: int):
+        counts = self.attendance[user_id]
+        counts[activity_id] = counts.get(activity_id, 0) + 1
+        if counts[activity_id] > 1:
+            return
+        attendees = self.attendees[activity_id]
+        attendees.add(user_id)
+        if activity_id in self.crowds:
+            return
+        if len(attendees) > COATTENDANCE_MAX_ACTIVITY_SIZE:
+            # Just became a crowd: take back every pair it contributed.
+            self.crowds.add(activity_id)
+            for member in attendees:
+                if member != user_id:
+                    self._add_pairs(member, (a for a in attendees if a != user_id and a > member), -1)
+            return
+        self._add_pairs(user_id, attendees, 1)
+
+    def leave(self, user_id: int, activity_id: int):
+        counts = self.attendance.get(user_id)
+        if not counts or activity_id not in counts:
+            return
+        counts[activity_id] -= 1
+        if counts[activity_id] > 0:
+            return
+        del counts[activity_id]
+        attendees = self.attendees[activity_id]
+        attendees.discard(user_id)
+        if activity_id not in self.crowds:
+            self._add_pairs(user_id, attendees, -1)
+        # Crowds stay crowds; shrinking back under the limit is rare enough
+        # to leave to the next rebuild.
+
+    def connect(self, user_id1: int, user_id2: int):
+        self.connected[user_id1].add(user_id2)
+        self.connected[user_id2].add(user_id1)
+
+    def disconnect(self, user_id1: int, user_id2: int):
+        self.connected[user_id1].discard(user_id2)
+        self.connected[user_id2].discard(user_id1)
+
+    def suggestions(self, user_id: int, k: int) -> List[Tuple[int, int]]:
+        row = self.shared.get(user_id)
+        if not row:
+            return []
+        skip = self.connected.get(user_id, ())
+        # Most shared activities first, lower ids break ties so results are stable.
+        best = heapq.nsmallest(k, ((-weight, other) for other, weight in row.items() if other not in skip))
+        return [(other, -weight) for weight, other in best]
+
+
+class CoAttendanceIndex:
+    # Per-event "people you should meet" index. Each new (hacker, activity)
+    # pair touches one row per fellow attendee, so updates cost O(activity
+    # size) and a lookup is a top-k over one sparse row.
+    def __init__(self):
+        self._events: Dict[int, EventCoAttendance] = defaultdict(EventCoAttendance)
+        # Changes that arrive while the first build runs, applied after it.
+        self._backlog: Optional[List[tuple]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"scans": 0, "rebuilds": 0, "last_rebuild_ms": 0.0}
+
+    @property
+    def ready(self) -> bool:
+        return self.stats["rebuilds"] > 0
+
+    def metrics(self):
+        return {
+            **self.stats,
+            "ready": self.ready,
+            "events": len(self._events),
+            "pairs": sum(len(row) for state in self._events.values() for row in state.shared.values()) // 2,
+            "crowds": sum(len(state.crowds) for state in self._events.values()),
+        }
+
+    def event(self, event_id: int) -> EventCoAttendance:
+        return self._events[event_id]
+
+    async def rebuild(self):
+        started = time.perf_counter()
+        events: Dict[int, EventCoAttendance] = defaultdict(EventCoAttendance)
+        cutoff = datetime.utcnow() - timedelta(days=COATTENDANCE_REBUILD_DAYS)
+        async with AsyncSessionMaker() as db:
+            result = await db.execute(
+                select(Scan.event_id, Scan.activity_id, Scan.user_id, func.count())
+                .filter(Scan.scanned_at >= cutoff)
+                .group_by(Scan.event_id, Scan.activity_id, Scan.user_id)
+            )
+            for event_id, activity_id, user_id, count in result.fetchall():
+                state = events[event_id]
+                state.attendance[user_id][activity_id] = count
+                state.attendees[activity_id].add(user_id)
+            result = await db.execute(select(Connection.event_id, Connection.user_id1, Connection.user_id2))
+            for event_id, user_id1, user_id2 in result.fetchall():
+                events[event_id].connect(user_id1, user_id2)
+        for state in events.values():
+            for activity_id, attendees in state.attendees.items():
+                if len(attendees) > COATTENDANCE_MAX_ACTIVITY_SIZE:
+                    state.crowds.add(activity_id)
+                    continue
+                members = sorted(attendees)
+                for i, member in enumerate(members):
+                    state._add_pairs(member, members[i + 1:], 1)
+        # Swapped in whole so requests never see a half-built index.
+        self._events = events
+        self.stats["rebuilds"] += 1
+        self.stats["last_rebuild_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    async def on_scans(self, events: List[changefeed.ChangeEvent]):
+        if self._backlog is not None:
+            self._backlog.append((self.on_scans, events))
+            return
+        for change in events:
+            if change.op == "resync":
+                # Deletes missed while disconnected can't be replayed.
+                await self.rebuild()
+                return
+            row = change.row
+            if not row:
+                continue
+            if change.op == "insert":
+                self._events[row["event_id"]].attend(row["user_id"], row["activity_id"])
+                self.stats["scans"] += 1
+            elif change.op == "delete":
+                self._events[row["event_id"]].leave(row["user_id"], row["activity_id"])
+
+    async def on_connections(self, events: List[changefeed.ChangeEvent]):
+        if self._backlog is not None:
+            self._backlog.append((self.on_connections, events))
+            return
+        for change in events:
+            if change.op == "resync":
+                await self.rebuild()
+                return
+            row = change.row
+            if not row:
+                continue
+            if change.op == "insert":
+                self._events[row["event_id"]].connect(row["user_id1"], row["user_id2"])
+            elif change.op == "delete":
+                self._events[row["event_id"]].disconnect(row["user_id1"], row["user_id2"])
+
+    async def start(self):
+        # Built in the background so a new worker takes traffic right away;
+        # suggestions are empty until the build is done.
+        self._backlog = []
+        changefeed.subscribe("scans", self.on_scans)
+        changefeed.subscribe("connections", self.on_connections)
+        self._task = asyncio.create_task(self._build(), name="coattendance-build")
+
+    async def _build(self):
+        try:
+            await self.rebuild()
+        except Exception:
+            logger.exception("Co-attendance index build failed; waiting for the next resync")
+        backlog, self._backlog = self._backlog, None
+        for handler, events in backlog:
+            await handler(events)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        changefeed.unsubscribe("scans", self.on_scans)
+        changefeed.unsubscribe("connections", self.on_connections)
+
+    def suggestions(self, event_id: int, user_id: int, k: int) -> List[Tuple[int, int]]:
+        if not self.ready:
+            return []
+        return self._events[event_id].suggestions(user_id, k)
+
+
+coattendance = CoAttendanceIndex()
+metrics.register("coattendance", coattendance.metrics)
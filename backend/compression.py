@@ -0,0 +1,332 @@
+import gzip
+import os
+import time
+import zlib
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+from starlette.requests import Request
+
+from backend import changefeed, metrics
+from backend.database import read_router
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+# Precompressed entries are cached this long; after a scan or user change,
+# a stale entry is still served for ANALYTICS_CACHE_STALE_SECONDS so a busy
+# write stream doesn't turn every read into a miss.
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "30"))
+ANALYTICS_CACHE_STALE_SECONDS = float(os.getenv("ANALYTICS_CACHE_STALE_SECONDS", "1"))
+ANALYTICS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "512"))
+CACHED_PATHS = (
+    "/scan-stats", "/scan-timeline", "/peak-times", "/popular-activities", "/leaderboard",
+    "/analytics/unique-hackers", "/analytics/dwell",
+)
+COMPRESSIBLE_TYPES = (
+    b"application/json", b"application/x-ndjson", b"application/msgpack", b"text/", b"application/javascript",
+)
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int = GZIP_LEVEL):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return gzip.compress(data, compresslevel=self.level)
+
+    def stream(self):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return (
+            lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH),
+            compressor.flush,
+        )
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, quality: int = BROTLI_QUALITY):
+        self.quality = quality
+
+    def compress(self, data: bytes) -> bytes:
+        return brotli.compress(data, quality=self.quality)
+
+    def stream(self):
+        compressor = brotli.Compressor(quality=self.quality)
+        return (lambda chunk: compressor.process(chunk) + compressor.flush(), compressor.finish)
+
+
+class ZstdEncoder:
+    name = "zstd"
+
+    def __init__(self, level: int = ZSTD_LEVEL):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def stream(self):
+        compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        return (
+            lambda chunk: compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+            compressor.flush,
+        )
+
+
+# Server preference when the client weights several encodings equally.
+ENCODERS = {
+    encoder.name: encoder
+    for encoder, available in (
+        (ZstdEncoder(), zstandard is not None),
+        (BrotliEncoder(), brotli is not None),
+        (GzipEncoder(), True),
+    )
+    if available
+}
+
+stats = {"compressed": 0, "skipped_small": 0, "bytes_in": 0, "bytes_out": 0, "compress_ms": 0.0}
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[token.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for name in ENCODERS:
+        quality = weights.get(name, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def _header(headers, name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _compressible(headers) -> bool:
+    if _header(headers, b"content-encoding") is not None:
+        return False
+    content_type = _header(headers, b"content-type") or b""
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    # Buffers the first body message: a small, complete body goes out as is;
+    # anything else is compressed, chunk by chunk for streamed responses.
+    def __init__(self, app, min_bytes: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.min_bytes = min_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate((_header(scope["headers"], b"accept-encoding") or b"").decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        stream = None
+
+        async def send_compressed(message):
+            nonlocal start, stream
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if start is not None:
+                headers = list(start.get("headers", []))
+                if not _compressible(headers) or (not more and len(body) < self.min_bytes):
+                    if _compressible(headers):
+                        stats["skipped_small"] += 1
+                    await send(start)
+                    start = None
+                    stream = False
+                    return await send(message)
+                headers = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode()))
+                headers.append((b"vary", b"Accept-Encoding"))
+                await send({**start, "headers": headers})
+                start = None
+                stream = ENCODERS[encoding].stream()
+                stats["compressed"] += 1
+            if not stream:
+                return await send(message)
+
+            started = time.perf_counter()
+            compress_chunk, finish = stream
+            out = compress_chunk(body) if body else b""
+            if not more:
+                out += finish()
+            stats["compress_ms"] += (time.perf_counter() - started) * 1000
+            stats["bytes_in"] += len(body)
+            stats["bytes_out"] += len(out)
+            await send({"type": "http.response.body", "body": out, "more_body": more})
+
+        await self.app(scope, receive, send_compressed)
+
+
+@dataclass
+class CachedResponse:
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+    created_at: float
+    generation: int
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+    def variant(self, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+        if encoding is None or len(self.body) < COMPRESSION_MIN_BYTES:
+            return self.body, None
+        if encoding not in self.variants:
+            self.variants[encoding] = ENCODERS[encoding].compress(self.body)
+        return self.variants[encoding], encoding
+
+
+class AnalyticsResponseCache:
+    # Caches GET responses of the analytics endpoints with every encoding
+    # produced at most once per entry, so a hot dashboard payload is
+    # serialized and compressed once rather than on every poll.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"] not in CACHED_PATHS:
+            return await self.app(scope, receive, send)
+        if read_router.recently_wrote(Request(scope)):
+            # Read-your-writes clients skip the cache along with the replica.
+            response_cache.stats["bypassed"] += 1
+            return await self.app(scope, receive, send)
+
+        event = (_header(scope["headers"], b"x-event") or b"").decode("latin-1")
+        key = (scope["path"], scope.get("query_string", b""), event)
+        encoding = negotiate((_header(scope["headers"], b"accept-encoding") or b"").decode("latin-1"))
+        entry = response_cache.get(key)
+        if entry is None:
+            entry = await self._capture(scope, receive, key)
+        else:
+            response_cache.stats["hits"] += 1
+
+        body, used = entry.variant(encoding)
+        headers = [(k, v) for k, v in entry.headers if k.lower() not in (b"content-length", b"content-encoding")]
+        headers.append((b"content-length", str(len(body)).encode()))
+        if used:
+            headers.append((b"content-encoding", used.encode()))
+        headers.append((b"vary", b"Accept-Encoding"))
+        await send({"type": "http.response.start", "status": entry.status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _capture(self, scope, receive, key) -> CachedResponse:
+        response_cache.stats["misses"] += 1
+        generation = response_cache.generation
+        start = {}
+        chunks: List[bytes] = []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        entry = CachedResponse(
+            start.get("status", 500), list(start.get("headers", [])), b"".join(chunks), time.monotonic(), generation
+        )
+        if entry.status == 200:
+            response_cache.put(key, entry)
+        return entry
+
+
+class ResponseCache:
+    def __init__(self):
+        self._entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self.generation = 0
+        # (generation, when it started), oldest first. Entries never outlive
+        # the TTL, so invalidations older than that are dropped.
+        self._invalidated_at: Deque[Tuple[int, float]] = deque()
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0, "invalidations": 0}
+
+    def metrics(self):
+        return {**self.stats, "entries": len(self._entries)}
+
+    def stale_since(self, generation: int) -> Optional[float]:
+        # When the first change after the entry was captured arrived.
+        if generation == self.generation:
+            return None
+        if not self._invalidated_at:
+            return 0.0
+        index = generation + 1 - self._invalidated_at[0][0]
+        return self._invalidated_at[index][1] if index >= 0 else 0.0
+
+    def get(self, key) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        expired = now - entry.created_at > ANALYTICS_CACHE_TTL
+        stale_since = self.stale_since(entry.generation)
+        stale = stale_since is not None and now - stale_since > ANALYTICS_CACHE_STALE_SECONDS
+        if expired or stale:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry: CachedResponse):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > ANALYTICS_CACHE_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, events=None):
+        self.generation += 1
+        now = time.monotonic()
+        self._invalidated_at.append((self.generation, now))
+        while now - self._invalidated_at[0][1] > ANALYTICS_CACHE_TTL:
+            self._invalidated_at.popleft()
+        self.stats["invalidations"] += 1
+
+    def clear(self):
+        self._entries.clear()
+
+
+response_cache = ResponseCache()
+changefeed.subscribe("scans", response_cache.invalidate)
+changefeed.subscribe("users", response_cache.invalidate)
+metrics.register("compression", lambda: {
+    **stats,
+    "encoders": list(ENCODERS),
+    "ratio": round(stats["bytes_out"] / stats["bytes_in"], 4) if stats["bytes_in"] else None,
+})
+metrics.register("analytics_cache", response_cache.metrics)
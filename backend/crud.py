@@ -1,13 +1,19 @@
+import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.sql import func
+from sqlalchemy import case, delete, exists, literal, or_, tuple_, update
 from sqlalchemy.orm import selectinload 
 from sqlalchemy.exc import IntegrityError
-from backend.models import User, Scan
-from backend.schemas import UserCreate, UserUpdate, ScanCreate
-from backend.auth import hash_password, verify_password
+from backend.models import User, Scan, Connection, EventRegistration
+from backend.schemas import UserCreate, UserUpdate, ScanCreate, UserSelector, naive_utc
+from backend.auth import hash_password, verify_password, clear_token_cache
+from backend.passwords import password_service
+from backend.activities import catalog, activity_filter
+from backend.badges import badges
+from backend import queries
 from datetime import datetime
-from passlib.context import CryptContext
+import base64
 from typing import List, Optional
 from fastapi import HTTPException
 
@@ -28,11 +34,46 @@ async def get_user(db: AsyncSession, user_id: int):
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")  
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 
-async def create_user(db: AsyncSession, user: UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+async def search_users(db: AsyncSession, q: str, limit: int = 20, mode: str = "fuzzy"):
+    # Both modes are served by the trigram GIN indexes on name, email and
+    # badge_code. "prefix" is typeahead: substring matches, with prefix hits
+    # ranked first. "fuzzy" tolerates typos via word similarity.
+    q = q.strip()
+    if mode == "prefix":
+        contains, prefix = f"%{escape_like(q)}%", f"{escape_like(q)}%"
+        condition = or_(User.name.ilike(contains), User.email.ilike(contains), User.badge_code.ilike(contains))
+        score = case(
+            (User.name.ilike(prefix), 1.0),
+            (or_(User.email.ilike(prefix), User.badge_code.ilike(prefix)), 0.9),
+            else_=func.word_similarity(q, User.name) * 0.8,
+        )
+    else:
+        condition = or_(
+            literal(q).op("<%")(User.name),
+            literal(q).op("<%")(User.email),
+            User.badge_code.op("%")(q),
+        )
+        score = func.greatest(
+            func.word_similarity(q, User.name),
+            func.word_similarity(q, User.email),
+            func.similarity(User.badge_code, q),
+        )
+
+    result = await db.execute(
+        select(User.id, User.name, User.email, User.badge_code, score.label("score"))
+        .filter(condition)
+        .order_by(score.desc(), User.name, User.id)
+        .limit(limit)
+    )
+    return [row._asdict() for row in result.fetchall()]
+
+
+async def create_user(db: AsyncSession, user: UserCreate, event_id: Optional[int] = None):
+    hashed_password = hash_password(user.password)
 
     
     result = await db.execute(select(func.count()).where(User.id >= 101))
@@ -50,8 +91,12 @@ async def create_user(db: AsyncSession, user: UserCreate):
 
     db.add(db_user)
     try:
+        if event_id is not None:
+            await db.flush()
+            db.add(EventRegistration(event_id=event_id, user_id=db_user.id))
         await db.commit()
         await db.refresh(db_user)
+        badges.remember(db_user.id, db_user.badge_code)
 
         user_with_scans = await db.execute(
             select(User).options(selectinload(User.scans)).filter(User.id == db_user.id)
@@ -67,57 +112,216 @@ async def create_user(db: AsyncSession, user: UserCreate):
         raise HTTPException(status_code=500, detail=str(e))
     
 async def authenticate_user(db: AsyncSession, email: str, password: str):
-    result = await db.execute(select(User).filter(User.email == email))
-    user = result.scalars().first()
-    if not user or not verify_password(password, user.hashed_password):
+    user = await queries.user_by_email(db, email)
+    if not user or user.is_active is False:
+        return None
+    verified, new_hash = await asyncio.to_thread(
+        password_service.verify_and_update, password, user.hashed_password
+    )
+    if not verified:
         return None
+    if new_hash:
+        # Scheme or cost changed since this hash was made; upgrade it now
+        # that we have the plaintext.
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
 async def update_user(db: AsyncSession, user_id: int, user_update: UserUpdate):
-    result = await db.execute(select(User).filter(User.id == user_id))
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(**user_update.dict(exclude_unset=True), updated_at=datetime.utcnow())
+        .returning(User)
+    )
     db_user = result.scalars().first()
-
-    if db_user:
-        for key, value in user_update.dict(exclude_unset=True).items():
-            setattr(db_user, key, value)
-        db_user.updated_at = datetime.utcnow()
-        await db.commit()
-        await db.refresh(db_user)
+    await db.commit()
     return db_user
 
 
 async def delete_user(db: AsyncSession, user_id: int):
-    result = await db.execute(select(User).filter(User.id == user_id))
-    db_user = result.scalars().first()
+    rows = await delete_users(db, [User.id == user_id])
+    return rows[0] if rows else None
 
-    if db_user:
-        await db.delete(db_user)
-        await db.commit()
-    return db_user
+
+def user_filters(selector: UserSelector) -> list:
+    filters = []
+    if selector.ids is not None:
+        filters.append(User.id.in_(selector.ids))
+    if selector.emails is not None:
+        filters.append(User.email.in_(selector.emails))
+    if selector.email_domain:
+        filters.append(User.email.ilike(f"%@{escape_like(selector.email_domain)}"))
+    if selector.is_active is not None:
+        filters.append(User.is_active.is_(selector.is_active))
+    if selector.is_admin is not None:
+        filters.append(User.is_admin.is_(selector.is_admin))
+    if selector.event_id is not None:
+        filters.append(User.id.in_(
+            select(EventRegistration.user_id).filter(EventRegistration.event_id == selector.event_id)
+        ))
+    if selector.without_scans:
+        filters.append(~exists().where(Scan.user_id == User.id))
+    if not filters:
+        raise HTTPException(status_code=400, detail="At least one user filter is required")
+    return filters
+
+
+def invalidate_users(user_ids, deleted: bool = False):
+    # Bulk changes bypass the ORM, so caches keyed by user are fixed up here
+    # once for the whole batch.
+    if deleted:
+        for user_id in user_ids:
+            badges.forget(user_id)
+    clear_token_cache()
+
+
+async def delete_users(db: AsyncSession, filters: list):
+    # Scans and registrations cascade; connections don't, so they go first.
+    targets = select(User.id).where(*filters)
+    await db.execute(
+        delete(Connection)
+        .where(or_(Connection.user_id1.in_(targets), Connection.user_id2.in_(targets)))
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(
+        delete(User).where(*filters).returning(User.id, User.email).execution_options(synchronize_session=False)
+    )
+    rows = result.fetchall()
+    await db.commit()
+    invalidate_users([row.id for row in rows], deleted=True)
+    return rows
+
+
+async def update_users(db: AsyncSession, filters: list, values: dict):
+    result = await db.execute(
+        update(User)
+        .where(*filters)
+        .values(**values, updated_at=datetime.utcnow())
+        .returning(User.id, User.name)
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.fetchall()
+    await db.commit()
+    invalidate_users([row.id for row in rows])
+    return rows
 
 
-async def create_scan(db: AsyncSession, user_id: int, scan: ScanCreate):
+async def create_scan(db: AsyncSession, user_id: int, scan: ScanCreate, event_id: int):
     db_scan = Scan(
+        event_id=event_id,
         user_id=user_id,
-        activity_name=scan.activity_name,
-        activity_category=scan.activity_category,
+        activity_id=await catalog.resolve(scan.activity_name, scan.activity_category),
         scanned_at=datetime.utcnow()
     )
     db.add(db_scan)
     await db.commit()
-    await db.refresh(db_scan)
+    await db.refresh(db_scan, ["id", "scanned_at", "activity"])
     return db_scan
 
 
-async def get_scans(db: AsyncSession, min_frequency: int = 0, activity_category: Optional[str] = None):
-    query = select(Scan)
+def in_time_window(query, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    # Bounds on scanned_at let Postgres prune scans partitions outside the window.
+    if since:
+        query = query.filter(Scan.scanned_at >= since)
+    if until:
+        query = query.filter(Scan.scanned_at < until)
+    return query
+
+
+def scoped_scans(query, event, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    # Restricts a scans query to one event; the event's own dates are the
+    # default window so partition pruning applies even without since/until.
+    query = query.filter(Scan.event_id == event.id)
+    return in_time_window(query, since or event.starts_at, until or event.ends_at)
+
+
+async def get_scans(
+    db: AsyncSession,
+    event,
+    min_frequency: int = 0,
+    activity_category: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    query = scoped_scans(select(Scan), event, since, until)
 
     if activity_category:
-        query = query.filter(Scan.activity_category == activity_category)
+        query = query.filter(activity_filter(category=activity_category))
 
     result = await db.execute(query)
     return result.scalars().all()  
 
-async def get_user_scans(db: AsyncSession, user_id: int):
-    result = await db.execute(select(Scan).filter(Scan.user_id == user_id))
+async def get_user_scans(db: AsyncSession, event, user_id: int):
+    result = await db.execute(
+        select(Scan)
+        .filter(Scan.event_id == event.id, Scan.user_id == user_id)
+        .order_by(Scan.scanned_at, Scan.id)
+    )
     return result.scalars().all()
+
+
+HISTORY_FIELDS = ("id", "activity_name", "activity_category", "scanned_at")
+
+
+def encode_history_cursor(scanned_at: datetime, scan_id: int) -> str:
+    raw = f"{scanned_at.isoformat()}|{scan_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        scanned_at, scan_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return naive_utc(datetime.fromisoformat(scanned_at)), int(scan_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def get_user_history(
+    db: AsyncSession,
+    event,
+    user_id: int,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    activity_name: Optional[str] = None,
+    activity_category: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+):
+    # Every filter and the sort key live in ix_scans_user_history, so a page
+    # is one forward range scan on (event_id, user_id, scanned_at, id).
+    unknown = set(fields or ()) - set(HISTORY_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    fields = [f for f in HISTORY_FIELDS if f in (fields or HISTORY_FIELDS)]
+    query = select(Scan.id, Scan.scanned_at, Scan.activity_id).filter(
+        Scan.event_id == event.id, Scan.user_id == user_id
+    )
+    if cursor:
+        after_at, after_id = decode_history_cursor(cursor)
+        query = query.filter(
+            Scan.scanned_at >= after_at,
+            tuple_(Scan.scanned_at, Scan.id) > tuple_(after_at, after_id),
+        )
+    if since:
+        query = query.filter(Scan.scanned_at >= since)
+    if activity_name or activity_category:
+        query = query.filter(activity_filter(activity_name, activity_category))
+    query = query.order_by(Scan.scanned_at, Scan.id).limit(limit + 1)
+
+    rows = (await db.execute(query)).mappings().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_history_cursor(rows[-1]["scanned_at"], rows[-1]["id"])
+
+    # Names come from the interned catalog rather than a join, keeping the
+    # scan side of the read inside the index.
+    names = await catalog.describe({row["activity_id"] for row in rows})
+    items = []
+    for row in rows:
+        name, category = names[row["activity_id"]]
+        full = {"id": row["id"], "activity_name": name, "activity_category": category, "scanned_at": row["scanned_at"]}
+        items.append({field: full[field] for field in fields})
+    return {"items": items, "next_cursor": next_cursor}
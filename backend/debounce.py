@@ -0,0 +1,90 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+from fastapi import HTTPException
+
+from backend import metrics
+
+# Repeat taps of the same badge at the same activity within this many seconds
+# are treated as one scan. 0 disables debouncing.
+SCAN_DEBOUNCE_SECONDS = float(os.getenv("SCAN_DEBOUNCE_SECONDS", "10"))
+# "merge" answers a duplicate with the scan already recorded, "reject" with 409.
+SCAN_DEBOUNCE_MODE = os.getenv("SCAN_DEBOUNCE_MODE", "merge")
+SCAN_DEBOUNCE_MAX_KEYS = int(os.getenv("SCAN_DEBOUNCE_MAX_KEYS", "100000"))
+
+
+class ScanDebouncer:
+    # Entries are only ever appended with the current time, so the
+    # OrderedDict is also sorted by age: expiry and capacity eviction both pop
+    # from the front, and every operation is amortized O(1).
+    def __init__(self, window: float = SCAN_DEBOUNCE_SECONDS, mode: str = SCAN_DEBOUNCE_MODE, max_keys: int = SCAN_DEBOUNCE_MAX_KEYS):
+        self.window = window
+        self.mode = mode
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[Hashable, tuple[float, asyncio.Future]]" = OrderedDict()
+        self.stats = {"seen": 0, "dropped": 0, "evicted": 0}
+
+    def metrics(self):
+        seen = self.stats["seen"]
+        return {
+            **self.stats,
+            "drop_rate": round(self.stats["dropped"] / seen, 4) if seen else 0.0,
+            "keys": len(self._entries),
+            "window_seconds": self.window,
+            "mode": self.mode,
+        }
+
+    def _expire(self, now: float):
+        while self._entries:
+            at, _ = next(iter(self._entries.values()))
+            if now - at < self.window:
+                break
+            self._entries.popitem(last=False)
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    async def record(self, key: Hashable, create: Callable[[], Awaitable[Any]]):
+        if self.window <= 0:
+            return await create()
+
+        self._expire(time.monotonic())
+        self.stats["seen"] += 1
+        while key in self._entries:
+            first = self._entries[key][1]
+            self.stats["dropped"] += 1
+            if self.mode == "reject":
+                raise HTTPException(status_code=409, detail="Duplicate scan ignored")
+            # The first tap may still be writing; share its outcome.
+            try:
+                return await asyncio.shield(first)
+            except asyncio.CancelledError:
+                if not first.cancelled():
+                    raise
+                # The first tap's request went away before it finished, so
+                # this one takes its place.
+                self.stats["dropped"] -= 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = (time.monotonic(), future)
+        try:
+            result = await create()
+        except BaseException as e:
+            # A failed write must not swallow the retry that follows it.
+            if self._entries.get(key, (None, None))[1] is future:
+                del self._entries[key]
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()
+            raise
+        future.set_result(result)
+        return result
+
+
+scan_debouncer = ScanDebouncer()
+metrics.register("scan_debounce", scan_debouncer.metrics)
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Query, Request
+from sqlalchemy.future import select
+
+from backend.database import AsyncSessionMaker
+from backend.models import Event
+
+DEFAULT_EVENT_SLUG = os.getenv("DEFAULT_EVENT", "default")
+EVENT_HEADER = "x-event"
+EVENT_CACHE_TTL = float(os.getenv("EVENT_CACHE_TTL", "60"))
+
+
+@dataclass(frozen=True)
+class EventContext:
+    id: int
+    slug: str
+    name: str
+    starts_at: Optional[datetime]
+    ends_at: Optional[datetime]
+
+
+class EventRegistry:
+    # Events change rarely, so they are re-read at most every EVENT_CACHE_TTL
+    # seconds, or right away when an unknown slug is requested.
+    def __init__(self):
+        self._by_slug: Dict[str, EventContext] = {}
+        self._by_id: Dict[int, EventContext] = {}
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def refresh(self):
+        async with AsyncSessionMaker() as db:
+            result = await db.execute(select(Event))
+            events = [
+                EventContext(e.id, e.slug, e.name, e.starts_at, e.ends_at)
+                for e in result.scalars().all()
+            ]
+        self._by_slug = {e.slug: e for e in events}
+        self._by_id = {e.id: e for e in events}
+        self._loaded_at = time.monotonic()
+
+    async def get(self, slug: str) -> Optional[EventContext]:
+        stale = time.monotonic() - self._loaded_at > EVENT_CACHE_TTL
+        if stale or slug not in self._by_slug:
+            async with self._lock:
+                if time.monotonic() - self._loaded_at > 1.0:
+                    await self.refresh()
+        return self._by_slug.get(slug)
+
+    def by_id(self, event_id: int) -> Optional[EventContext]:
+        return self._by_id.get(event_id)
+
+    def all(self):
+        return list(self._by_id.values())
+
+
+registry = EventRegistry()
+
+
+async def current_event(
+    request: Request,
+    event: Optional[str] = Query(None, description="Event slug; defaults to the X-Event header, then the default event"),
+) -> EventContext:
+    slug = event or request.headers.get(EVENT_HEADER) or DEFAULT_EVENT_SLUG
+    context = await registry.get(slug)
+    if context is None:
+        raise HTTPException(status_code=404, detail=f"Unknown event: {slug}")
+    return context
+
+
+async def default_event() -> EventContext:
+    context = await registry.get(DEFAULT_EVENT_SLUG)
+    if context is None:
+        raise RuntimeError(f"Default event '{DEFAULT_EVENT_SLUG}' does not exist")
+    return context
@@ -0,0 +1,271 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.future import select
+
+from backend import metrics
+from backend.database import AsyncSessionMaker
+from backend.events import DEFAULT_EVENT_SLUG
+from backend.models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+EVENT_HEADER = b"x-event"
+AUTHORIZATION_HEADER = b"authorization"
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "100000"))
+# Persist keys in the idempotency_keys table so they survive restarts and
+# are shared between workers.
+IDEMPOTENCY_DB = os.getenv("IDEMPOTENCY_DB", "0") == "1"
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Credentials are checked on every attempt, never replayed.
+UNKEYED_PATHS = {"/login", "/token/refresh"}
+# Transient answers, and auth failures the caller can fix by logging in
+# again, are not remembered so the client can really retry.
+UNCACHED_STATUSES = {401, 403, 429, 503}
+
+
+@dataclass
+class StoredResponse:
+    fingerprint: str
+    status: int
+    content_type: bytes
+    body: bytes
+    expires_at: float
+
+
+class IdempotencyStore:
+    def __init__(self, max_keys: int = IDEMPOTENCY_MAX_KEYS, ttl: int = IDEMPOTENCY_TTL_SECONDS):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0, "mismatches": 0, "waited": 0}
+
+    def metrics(self):
+        return {**self.stats, "keys": len(self._entries), "in_flight": len(self._in_flight)}
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: StoredResponse):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self.stats["stored"] += 1
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        return len(expired)
+
+    async def lookup(self, key: str) -> Optional[StoredResponse]:
+        entry = self.get(key)
+        if entry is None and IDEMPOTENCY_DB:
+            entry = await load_key(key)
+            if entry is not None:
+                self.put(key, entry)
+        return entry
+
+    async def save(self, key: str, entry: StoredResponse):
+        self.put(key, entry)
+        if IDEMPOTENCY_DB:
+            try:
+                await save_key(key, entry)
+            except Exception:
+                logger.exception("Could not persist idempotency key %s", key)
+
+
+async def load_key(key: str) -> Optional[StoredResponse]:
+    async with AsyncSessionMaker() as db:
+        result = await db.execute(
+            select(IdempotencyKey).filter(
+                IdempotencyKey.key == key, IdempotencyKey.expires_at > datetime.utcnow()
+            )
+        )
+        row = result.scalars().first()
+    if row is None:
+        return None
+    return StoredResponse(
+        fingerprint=row.fingerprint,
+        status=row.status_code,
+        content_type=row.content_type.encode(),
+        body=row.body,
+        expires_at=row.expires_at.timestamp(),
+    )
+
+
+async def save_key(key: str, entry: StoredResponse):
+    async with AsyncSessionMaker() as db:
+        await db.execute(
+            insert(IdempotencyKey)
+            .values(
+                key=key,
+                fingerprint=entry.fingerprint,
+                status_code=entry.status,
+                content_type=entry.content_type.decode(),
+                body=entry.body,
+                expires_at=datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+            )
+            .on_conflict_do_nothing(index_elements=["key"])
+        )
+        await db.commit()
+
+
+async def purge_expired_keys() -> int:
+    removed = store.purge_expired()
+    if IDEMPOTENCY_DB:
+        async with AsyncSessionMaker() as db:
+            result = await db.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow())
+            )
+            await db.commit()
+            removed += result.rowcount or 0
+    return removed
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value
+    return None
+
+
+def _event_slug(scope) -> str:
+    # Same precedence as events.current_event: ?event=, X-Event, the default.
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if query.get("event"):
+        return query["event"][0]
+    return (_header(scope, EVENT_HEADER) or b"").decode("latin-1") or DEFAULT_EVENT_SLUG
+
+
+async def _replay(send, entry: StoredResponse):
+    await send({
+        "type": "http.response.start",
+        "status": entry.status,
+        "headers": [
+            (b"content-type", entry.content_type),
+            (b"content-length", str(len(entry.body)).encode()),
+            (b"idempotent-replayed", b"true"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": entry.body})
+
+
+async def _reject(send, status: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await _replay(send, StoredResponse("", status, b"application/json", body, 0))
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, store: Optional[IdempotencyStore] = None):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS or scope["path"] in UNKEYED_PATHS:
+            return await self.app(scope, receive, send)
+        header = _header(scope, IDEMPOTENCY_HEADER)
+        if not header:
+            return await self.app(scope, receive, send)
+
+        idem_store = self.store or store
+        # Keys are scoped per event so scanners at different events can't
+        # collide, and per caller so nobody is replayed another's response.
+        event = _event_slug(scope)
+        caller = hashlib.sha256(_header(scope, AUTHORIZATION_HEADER) or b"").hexdigest()[:16]
+        key = f"{scope['method']} {scope['path']} {event} {caller} {header.decode('latin-1')}"
+
+        # Buffer the request body so it can be fingerprinted and replayed.
+        chunks: List[bytes] = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        fingerprint = hashlib.sha256(scope.get("query_string", b"") + b"\0" + body).hexdigest()
+
+        entry = await idem_store.lookup(key)
+        if entry is None and key in idem_store._in_flight:
+            idem_store.stats["waited"] += 1
+            await asyncio.shield(idem_store._in_flight[key])
+            entry = idem_store.get(key)
+
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                idem_store.stats["mismatches"] += 1
+                return await _reject(send, 422, "Idempotency-Key was already used with a different request")
+            idem_store.stats["hits"] += 1
+            return await _replay(send, entry)
+
+        idem_store.stats["misses"] += 1
+        in_flight = asyncio.get_running_loop().create_future()
+        idem_store._in_flight[key] = in_flight
+
+        replayed = False
+
+        async def replay_receive():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        captured: Tuple[int, bytes] = (500, b"application/json")
+        response_body: List[bytes] = []
+
+        async def capture_send(message):
+            nonlocal captured
+            if message["type"] == "http.response.start":
+                content_type = b"application/json"
+                for name, value in message.get("headers", ()):
+                    if name.lower() == b"content-type":
+                        content_type = value
+                captured = (message["status"], content_type)
+            elif message["type"] == "http.response.body":
+                response_body.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+            status, content_type = captured
+            if status < 500 and status not in UNCACHED_STATUSES:
+                await idem_store.save(key, StoredResponse(
+                    fingerprint=fingerprint,
+                    status=status,
+                    content_type=content_type,
+                    body=b"".join(response_body),
+                    expires_at=time.time() + idem_store.ttl,
+                ))
+        finally:
+            idem_store._in_flight.pop(key, None)
+            in_flight.set_result(None)
+
+
+store = IdempotencyStore()
+metrics.register("idempotency", store.metrics)
@@ -7,11 +7,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.exc import SQLAlchemyError
 from backend.database import AsyncSessionMaker
-from backend.models import User, Scan
+from backend.models import User, Scan, EventRegistration
 from datetime import datetime, timezone
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from backend.auth import hash_password
+from backend.activities import catalog
+from backend.events import default_event
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -46,6 +46,9 @@ async def load_users():
                 return  
 
             print("🔄 Loading users into database from users.json...")
+            event = await default_event()
+            # One read up front instead of a query per badge code.
+            taken_badges = set((await db.execute(select(User.badge_code))).scalars().all())
 
             for user in users_data:
                 if "email" not in user or "name" not in user or "phone" not in user:
@@ -56,11 +59,9 @@ async def load_users():
                 if not badge_code:
                     badge_code = generate_random_badge_code()
 
-               
-                existing_badge = await db.execute(select(User).where(User.badge_code == badge_code))
-                while existing_badge.scalars().first():
+                while badge_code in taken_badges:
                     badge_code = generate_random_badge_code()
-                    existing_badge = await db.execute(select(User).where(User.badge_code == badge_code))
+                taken_badges.add(badge_code)
 
                 updated_at_naive = datetime.now(timezone.utc).replace(tzinfo=None)
 
@@ -69,18 +70,19 @@ async def load_users():
                     email=user["email"],
                     phone=user["phone"],
                     badge_code=badge_code,
-                    hashed_password=pwd_context.hash("defaultpassword"),
+                    hashed_password=hash_password("defaultpassword"),
                     updated_at=updated_at_naive,
                     is_admin=user.get("is_admin", False)
                 )
                 db.add(new_user)
                 await db.flush()
+                db.add(EventRegistration(event_id=event.id, user_id=new_user.id))
 
                 for scan in user.get("scans", []):
                     new_scan = Scan(
+                        event_id=event.id,
                         user_id=new_user.id,
-                        activity_name=scan["activity_name"],
-                        activity_category=scan["activity_category"],
+                        activity_id=await catalog.resolve(scan["activity_name"], scan["activity_category"]),
                         scanned_at=datetime.fromisoformat(scan["scanned_at"]).replace(tzinfo=None)
                     )
                     db.add(new_scan)
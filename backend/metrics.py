@@ -0,0 +1,11 @@
+from typing import Any, Callable, Dict
+
+_sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register(name: str, source: Callable[[], Dict[str, Any]]):
+    _sources[name] = source
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    return {name: source() for name, source in _sources.items()}
@@ -0,0 +1,81 @@
+"""Add events and per-event scoping
+
+Revision ID: 2b8d5f9a1e37
+Revises: 9f3c1a7e2d64
+Create Date: 2026-10-19 14:02:33.465190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b8d5f9a1e37'
+down_revision: Union[str, None] = '9f3c1a7e2d64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('slug', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('starts_at', sa.DateTime(), nullable=True),
+    sa.Column('ends_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_events_id'), 'events', ['id'], unique=False)
+    op.create_index(op.f('ix_events_slug'), 'events', ['slug'], unique=True)
+
+    # Everything recorded so far belongs to a single default event.
+    op.execute(
+        """
+        INSERT INTO events (id, slug, name, starts_at)
+        SELECT 1, 'default', 'Hack The North', date_trunc('day', min(scanned_at)) FROM scans
+        """
+    )
+    op.execute("SELECT setval('events_id_seq', 1)")
+
+    op.create_table('event_registrations',
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('registered_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.Column('checked_in_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['event_id'], ['events.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('event_id', 'user_id')
+    )
+    op.create_index(op.f('ix_event_registrations_user_id'), 'event_registrations', ['user_id'], unique=False)
+    op.execute("INSERT INTO event_registrations (event_id, user_id) SELECT 1, id FROM users")
+
+    # A constant default makes the new column a catalog-only change, even on
+    # the partitioned scans table; it is dropped once existing rows carry it.
+    for table in ('scans', 'connections'):
+        op.add_column(table, sa.Column('event_id', sa.Integer(), server_default='1', nullable=False))
+        op.alter_column(table, 'event_id', server_default=None)
+        op.create_foreign_key(f'{table}_event_id_fkey', table, 'events', ['event_id'], ['id'])
+
+    op.create_index('ix_scans_event_scanned_at', 'scans', ['event_id', 'scanned_at'], unique=False)
+    op.create_index('ix_scans_event_activity', 'scans', ['event_id', 'activity_id'], unique=False)
+    op.create_index('ix_scans_event_user', 'scans', ['event_id', 'user_id'], unique=False)
+    op.create_index('ix_connections_event_user1', 'connections', ['event_id', 'user_id1'], unique=False)
+    op.create_index('ix_connections_event_user2', 'connections', ['event_id', 'user_id2'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_connections_event_user2', table_name='connections')
+    op.drop_index('ix_connections_event_user1', table_name='connections')
+    op.drop_index('ix_scans_event_user', table_name='scans')
+    op.drop_index('ix_scans_event_activity', table_name='scans')
+    op.drop_index('ix_scans_event_scanned_at', table_name='scans')
+    for table in ('scans', 'connections'):
+        op.drop_constraint(f'{table}_event_id_fkey', table, type_='foreignkey')
+        op.drop_column(table, 'event_id')
+    op.drop_index(op.f('ix_event_registrations_user_id'), table_name='event_registrations')
+    op.drop_table('event_registrations')
+    op.drop_index(op.f('ix_events_slug'), table_name='events')
+    op.drop_index(op.f('ix_events_id'), table_name='events')
+    op.drop_table('events')
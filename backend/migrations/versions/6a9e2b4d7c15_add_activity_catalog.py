@@ -0,0 +1,80 @@
+"""Add activity catalog
+
+Revision ID: 6a9e2b4d7c15
+Revises: d4a6e0f3c8b7
+Create Date: 2026-10-19 12:21:40.318846
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6a9e2b4d7c15'
+down_revision: Union[str, None] = 'd4a6e0f3c8b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('activities',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('category', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name', 'category', name='uq_activities_name_category')
+    )
+    op.create_index(op.f('ix_activities_id'), 'activities', ['id'], unique=False)
+
+    op.execute(
+        """
+        INSERT INTO activities (name, category)
+        SELECT DISTINCT activity_name, activity_category FROM scans
+        """
+    )
+    op.add_column('scans', sa.Column('activity_id', sa.Integer(), nullable=True))
+    op.execute(
+        """
+        UPDATE scans s SET activity_id = a.id
+        FROM activities a
+        WHERE a.name = s.activity_name AND a.category = s.activity_category
+        """
+    )
+    op.alter_column('scans', 'activity_id', nullable=False)
+    op.create_foreign_key('scans_activity_id_fkey', 'scans', 'activities', ['activity_id'], ['id'])
+    op.create_index(op.f('ix_scans_activity_id'), 'scans', ['activity_id'], unique=False)
+
+    op.drop_index('ix_scans_user_history', table_name='scans')
+    op.create_index(
+        'ix_scans_user_history', 'scans', ['user_id', 'scanned_at', 'id'], unique=False,
+        postgresql_include=['activity_id']
+    )
+    op.drop_column('scans', 'activity_name')
+    op.drop_column('scans', 'activity_category')
+
+
+def downgrade() -> None:
+    op.add_column('scans', sa.Column('activity_category', sa.String(), nullable=True))
+    op.add_column('scans', sa.Column('activity_name', sa.String(), nullable=True))
+    op.execute(
+        """
+        UPDATE scans s SET activity_name = a.name, activity_category = a.category
+        FROM activities a
+        WHERE a.id = s.activity_id
+        """
+    )
+    op.alter_column('scans', 'activity_name', nullable=False)
+    op.alter_column('scans', 'activity_category', nullable=False)
+
+    op.drop_index('ix_scans_user_history', table_name='scans')
+    op.create_index(
+        'ix_scans_user_history', 'scans', ['user_id', 'scanned_at', 'id'], unique=False,
+        postgresql_include=['activity_name', 'activity_category']
+    )
+    op.drop_index(op.f('ix_scans_activity_id'), table_name='scans')
+    op.drop_constraint('scans_activity_id_fkey', 'scans', type_='foreignkey')
+    op.drop_column('scans', 'activity_id')
+    op.drop_index(op.f('ix_activities_id'), table_name='activities')
+    op.drop_table('activities')
@@ -0,0 +1,33 @@
+"""Add analytics sketches
+
+Revision ID: 7d2e8b1f4a90
+Revises: 2b8d5f9a1e37
+Create Date: 2026-10-19 14:41:08.219374
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2e8b1f4a90'
+down_revision: Union[str, None] = '2b8d5f9a1e37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('analytics_sketches',
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('last_scan_id', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.ForeignKeyConstraint(['event_id'], ['events.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('event_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('analytics_sketches')
@@ -0,0 +1,65 @@
+"""Add change feed triggers
+
+Revision ID: 8c2f4e1a9b3d
+Revises: f1a38861940f
+Create Date: 2026-10-19 09:12:44.183021
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c2f4e1a9b3d'
+down_revision: Union[str, None] = 'f1a38861940f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("users", "scans", "connections")
+
+
+def upgrade() -> None:
+    # TG_ARGV[0] carries the logical table name so the payload stays stable
+    # even if a table is later split into partitions.
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION htn_notify_change() RETURNS trigger AS $$
+        DECLARE
+            row_data jsonb;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                row_data := to_jsonb(OLD);
+            ELSE
+                row_data := to_jsonb(NEW);
+            END IF;
+            row_data := row_data - 'hashed_password';
+            PERFORM pg_notify(
+                'htn_changes',
+                json_build_object(
+                    'table', TG_ARGV[0],
+                    'op', lower(TG_OP),
+                    'id', row_data->'id',
+                    'row', row_data
+                )::text
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    for table in TABLES:
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_notify_change
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION htn_notify_change('{table}');
+            """
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_change ON {table};")
+    op.execute("DROP FUNCTION IF EXISTS htn_notify_change();")
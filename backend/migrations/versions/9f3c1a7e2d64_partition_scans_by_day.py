@@ -0,0 +1,110 @@
+"""Partition scans by day
+
+Revision ID: 9f3c1a7e2d64
+Revises: 6a9e2b4d7c15
+Create Date: 2026-10-19 13:05:12.774203
+
+"""
+from datetime import datetime, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f3c1a7e2d64'
+down_revision: Union[str, None] = '6a9e2b4d7c15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DAYS_AHEAD = 3
+LEGACY_INDEXES = ("ix_scans_id", "ix_scans_user_id", "ix_scans_activity_id", "ix_scans_user_history")
+
+
+def create_indexes() -> None:
+    op.create_index('ix_scans_id', 'scans', ['id'], unique=False)
+    op.create_index('ix_scans_user_id', 'scans', ['user_id'], unique=False)
+    op.create_index('ix_scans_activity_id', 'scans', ['activity_id'], unique=False)
+    op.create_index(
+        'ix_scans_user_history', 'scans', ['user_id', 'scanned_at', 'id'], unique=False,
+        postgresql_include=['activity_id']
+    )
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    op.execute("UPDATE scans SET scanned_at = now() WHERE scanned_at IS NULL")
+
+    op.execute("DROP TRIGGER IF EXISTS scans_notify_change ON scans")
+    op.execute("ALTER TABLE scans RENAME TO scans_legacy")
+    op.execute("ALTER TABLE scans_legacy RENAME CONSTRAINT scans_pkey TO scans_legacy_pkey")
+    for index in LEGACY_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {index}")
+
+    # The partition key has to be part of the primary key.
+    op.execute(
+        """
+        CREATE TABLE scans (
+            id INTEGER NOT NULL DEFAULT nextval('scans_id_seq'),
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            activity_id INTEGER NOT NULL REFERENCES activities(id),
+            scanned_at TIMESTAMP NOT NULL DEFAULT now(),
+            CONSTRAINT scans_pkey PRIMARY KEY (id, scanned_at)
+        ) PARTITION BY RANGE (scanned_at)
+        """
+    )
+    op.execute("CREATE TABLE scans_default PARTITION OF scans DEFAULT")
+
+    # One partition per day that already has scans, plus the next few days.
+    days = {row[0] for row in bind.execute(sa.text("SELECT DISTINCT scanned_at::date FROM scans_legacy"))}
+    today = datetime.utcnow().date()
+    days.update(today + timedelta(days=offset) for offset in range(DAYS_AHEAD + 1))
+    for day in sorted(days):
+        op.execute(
+            f"CREATE TABLE scans_p{day:%Y%m%d} PARTITION OF scans "
+            f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+        )
+
+    op.execute(
+        "INSERT INTO scans (id, user_id, activity_id, scanned_at) "
+        "SELECT id, user_id, activity_id, scanned_at FROM scans_legacy"
+    )
+    op.execute("ALTER SEQUENCE scans_id_seq OWNED BY scans.id")
+    op.execute("DROP TABLE scans_legacy")
+    create_indexes()
+    op.execute(
+        "CREATE TRIGGER scans_notify_change AFTER INSERT OR UPDATE OR DELETE ON scans "
+        "FOR EACH ROW EXECUTE FUNCTION htn_notify_change('scans')"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS scans_notify_change ON scans")
+    op.execute("ALTER TABLE scans RENAME TO scans_partitioned")
+    op.execute("ALTER TABLE scans_partitioned RENAME CONSTRAINT scans_pkey TO scans_partitioned_pkey")
+    for index in LEGACY_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {index}")
+
+    op.execute(
+        """
+        CREATE TABLE scans (
+            id INTEGER NOT NULL DEFAULT nextval('scans_id_seq'),
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            activity_id INTEGER NOT NULL REFERENCES activities(id),
+            scanned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT scans_pkey PRIMARY KEY (id)
+        )
+        """
+    )
+    op.execute(
+        "INSERT INTO scans (id, user_id, activity_id, scanned_at) "
+        "SELECT id, user_id, activity_id, scanned_at FROM scans_partitioned"
+    )
+    op.execute("ALTER SEQUENCE scans_id_seq OWNED BY scans.id")
+    op.execute("DROP TABLE scans_partitioned CASCADE")
+    create_indexes()
+    op.execute(
+        "CREATE TRIGGER scans_notify_change AFTER INSERT OR UPDATE OR DELETE ON scans "
+        "FOR EACH ROW EXECUTE FUNCTION htn_notify_change('scans')"
+    )
@@ -0,0 +1,34 @@
+"""Add trigram indexes for user search
+
+Revision ID: a3c5e7f9b1d2
+Revises: 7d2e8b1f4a90
+Create Date: 2026-10-19 15:20:44.903118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c5e7f9b1d2'
+down_revision: Union[str, None] = '7d2e8b1f4a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = ('name', 'email', 'badge_code')
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for column in COLUMNS:
+        op.create_index(
+            f'ix_users_{column}_trgm', 'users', [column], unique=False,
+            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'}
+        )
+
+
+def downgrade() -> None:
+    for column in COLUMNS:
+        op.drop_index(f'ix_users_{column}_trgm', table_name='users')
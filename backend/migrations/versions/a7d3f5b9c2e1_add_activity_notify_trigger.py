@@ -0,0 +1,30 @@
+"""Add change feed trigger on activities
+
+Revision ID: a7d3f5b9c2e1
+Revises: e8b4a2d6f1c3
+Create Date: 2026-10-19 21:12:40.518734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3f5b9c2e1'
+down_revision: Union[str, None] = 'e8b4a2d6f1c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Activity ids never change once assigned, so only inserts are published;
+    # every worker's catalog learns activities first scanned elsewhere.
+    op.execute(
+        "CREATE TRIGGER activities_notify_change AFTER INSERT ON activities "
+        "FOR EACH ROW EXECUTE FUNCTION htn_notify_change('activities')"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS activities_notify_change ON activities")
@@ -0,0 +1,29 @@
+"""Add covering index for scan history
+
+Revision ID: b5d1c7e8f402
+Revises: 3e7b9d2c5a10
+Create Date: 2026-10-19 10:48:02.114530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d1c7e8f402'
+down_revision: Union[str, None] = '3e7b9d2c5a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_scans_user_history', 'scans', ['user_id', 'scanned_at', 'id'], unique=False,
+        postgresql_include=['activity_name', 'activity_category']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_scans_user_history', table_name='scans')
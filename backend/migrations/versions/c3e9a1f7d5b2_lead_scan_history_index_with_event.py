@@ -0,0 +1,34 @@
+"""Lead scan history index with event_id
+
+Revision ID: c3e9a1f7d5b2
+Revises: a7d3f5b9c2e1
+Create Date: 2026-10-19 22:04:17.336912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e9a1f7d5b2'
+down_revision: Union[str, None] = 'a7d3f5b9c2e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # History is read per event, so event_id leads and a page stays one range.
+    op.drop_index('ix_scans_user_history', table_name='scans')
+    op.create_index(
+        'ix_scans_user_history', 'scans', ['event_id', 'user_id', 'scanned_at', 'id'], unique=False,
+        postgresql_include=['activity_id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_scans_user_history', table_name='scans')
+    op.create_index(
+        'ix_scans_user_history', 'scans', ['user_id', 'scanned_at', 'id'], unique=False,
+        postgresql_include=['activity_id']
+    )
@@ -0,0 +1,39 @@
+"""Add rate limit counters
+
+Revision ID: d4a6e0f3c8b7
+Revises: b5d1c7e8f402
+Create Date: 2026-10-19 11:36:51.902775
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a6e0f3c8b7'
+down_revision: Union[str, None] = 'b5d1c7e8f402'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Counters are disposable, so skip the WAL.
+    op.execute(
+        """
+        CREATE UNLOGGED TABLE rate_limit_counters (
+            key VARCHAR NOT NULL,
+            slot BIGINT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (key, slot)
+        )
+        """
+    )
+    op.create_index('ix_rate_limit_counters_updated_at', 'rate_limit_counters', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_rate_limit_counters_updated_at', table_name='rate_limit_counters')
+    op.drop_table('rate_limit_counters')
@@ -0,0 +1,43 @@
+"""Add activity capacity and check-in notifications
+
+Revision ID: e8b4a2d6f1c3
+Revises: c6f1d8a2e4b9
+Create Date: 2026-10-19 18:24:51.307192
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b4a2d6f1c3'
+down_revision: Union[str, None] = 'c6f1d8a2e4b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Only changes to whether someone is checked in matter to the occupancy
+# engine, so the triggers fire on those and stay quiet otherwise.
+REGISTRATION_TRIGGERS = {
+    "event_registrations_notify_insert": "AFTER INSERT ON event_registrations FOR EACH ROW "
+                                         "WHEN (NEW.checked_in_at IS NOT NULL)",
+    "event_registrations_notify_update": "AFTER UPDATE OF checked_in_at ON event_registrations FOR EACH ROW "
+                                         "WHEN ((OLD.checked_in_at IS NULL) <> (NEW.checked_in_at IS NULL))",
+    "event_registrations_notify_delete": "AFTER DELETE ON event_registrations FOR EACH ROW "
+                                         "WHEN (OLD.checked_in_at IS NOT NULL)",
+}
+
+
+def upgrade() -> None:
+    op.add_column('activities', sa.Column('capacity', sa.Integer(), nullable=True))
+    for name, timing in REGISTRATION_TRIGGERS.items():
+        op.execute(
+            f"CREATE TRIGGER {name} {timing} EXECUTE FUNCTION htn_notify_change('event_registrations')"
+        )
+
+
+def downgrade() -> None:
+    for name in REGISTRATION_TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON event_registrations")
+    op.drop_column('activities', 'capacity')
@@ -1,10 +1,8 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, Boolean, LargeBinary, Index, UniqueConstraint, text
 from sqlalchemy.orm import relationship
 from backend.database import Base
 from datetime import datetime
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from backend import auth
 
 class User(Base):
     __tablename__ = "users"
@@ -19,30 +17,131 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
     is_admin = Column(Boolean, default=False)
+    # Bumped by a trigger whenever a roster field changes; see backend.roster.
+    change_seq = Column(BigInteger, server_default=text("nextval('users_change_seq')"), nullable=False, index=True)
 
     scans = relationship("Scan", back_populates="user", cascade="all, delete-orphan")
 
+    # Trigram indexes back fuzzy and substring search (/users/search).
+    __table_args__ = (
+        Index("ix_users_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_users_email_trgm", "email", postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"}),
+        Index("ix_users_badge_code_trgm", "badge_code", postgresql_using="gin", postgresql_ops={"badge_code": "gin_trgm_ops"}),
+    )
+
     def set_password(self, password: str):
-        self.hashed_password = pwd_context.hash(password)
+        self.hashed_password = auth.hash_password(password)
 
     def verify_password(self, password: str) -> bool:
-        return pwd_context.verify(password, self.hashed_password)
+        return auth.verify_password(password, self.hashed_password)
+
+
+class UserTombstone(Base):
+    __tablename__ = "user_tombstones"
+
+    user_id = Column(Integer, primary_key=True)
+    change_seq = Column(BigInteger, nullable=False, index=True)
+    deleted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class Event(Base):
+    __tablename__ = "events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    slug = Column(String, unique=True, nullable=False, index=True)
+    name = Column(String, nullable=False)
+    starts_at = Column(DateTime, nullable=True)
+    ends_at = Column(DateTime, nullable=True)
+
+
+class EventRegistration(Base):
+    __tablename__ = "event_registrations"
+
+    event_id = Column(Integer, ForeignKey("events.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, index=True)
+    registered_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    checked_in_at = Column(DateTime, nullable=True)
+
+
+class Activity(Base):
+    __tablename__ = "activities"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    category = Column(String, nullable=False)
+    # Room capacity for occupancy alerts; NULL means unlimited.
+    capacity = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("name", "category", name="uq_activities_name_category"),
+    )
 
 
 class Scan(Base):
     __tablename__ = "scans"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # scans is range-partitioned by day on scanned_at, so the partition key
+    # is part of the primary key.
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    event_id = Column(Integer, ForeignKey("events.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    activity_name = Column(String, nullable=False)
-    activity_category = Column(String, nullable=False)
-    scanned_at = Column(DateTime, default=datetime.utcnow)
+    activity_id = Column(Integer, ForeignKey("activities.id"), nullable=False, index=True)
+    scanned_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
 
    
     user = relationship("User", back_populates="scans")
+    activity = relationship("Activity", lazy="joined")
+
+    __table_args__ = (
+        Index(
+            "ix_scans_user_history",
+            "event_id", "user_id", "scanned_at", "id",
+            postgresql_include=["activity_id"],
+        ),
+        # Per-event analytics lead on event_id so each event reads only its slice.
+        Index("ix_scans_event_scanned_at", "event_id", "scanned_at"),
+        Index("ix_scans_event_activity", "event_id", "activity_id"),
+        Index("ix_scans_event_user", "event_id", "user_id"),
+        {"postgresql_partition_by": "RANGE (scanned_at)"},
+    )
+
+    @property
+    def activity_name(self) -> str:
+        return self.activity.name
+
+    @property
+    def activity_category(self) -> str:
+        return self.activity.category
 
 class Connection(Base):
     __tablename__ = "connections"
     id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(Integer, ForeignKey("events.id"), nullable=False)
     user_id1 = Column(Integer, ForeignKey("users.id"), nullable=False)
     user_id2 = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    __table_args__ = (
+        Index("ix_connections_event_user1", "event_id", "user_id1"),
+        Index("ix_connections_event_user2", "event_id", "user_id2"),
+    )
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=False)
+    content_type = Column(String, nullable=False)
+    body = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class AnalyticsSketch(Base):
+    __tablename__ = "analytics_sketches"
+
+    event_id = Column(Integer, ForeignKey("events.id", ondelete="CASCADE"), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    last_scan_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
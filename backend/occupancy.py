@@ -0,0 +1,242 @@
+import heapq
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.future import select
+
+from backend import changefeed, metrics
+from backend.database import AsyncSessionMaker
+from backend.models import Activity, EventRegistration, Scan
+
+logger = logging.getLogger(__name__)
+
+# Nobody scans out of a room, so a hacker counts as present at their latest
+# scan until they scan somewhere else, check out, or this long has passed.
+OCCUPANCY_WINDOW_SECONDS = float(os.getenv("OCCUPANCY_WINDOW_SECONDS", "5400"))
+# Share of capacity at which an activity is reported as "near" capacity.
+OCCUPANCY_ALERT_RATIO = float(os.getenv("OCCUPANCY_ALERT_RATIO", "0.9"))
+EPOCH = datetime(1970, 1, 1)
+
+
+def _seconds(value) -> float:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return (value.replace(tzinfo=None) - EPOCH).total_seconds()
+
+
+class EventOccupancy:
+    def __init__(self):
+        # user_id -> (activity_id, seconds since epoch of the scan that put them there)
+        self.location: Dict[int, Tuple[int, float]] = {}
+        self.counts: Dict[int, int] = defaultdict(int)
+        self.alerts: Dict[int, str] = {}
+        # Who is checked in, rather than a count, so a check-in seen both in
+        # load_venue() and on the change feed is counted once.
+        self.checked_in: Set[int] = set()
+        # (at, user_id, activity_id); entries for hackers who have since moved
+        # are left in place and skipped when they surface.
+        self._expiry: List[Tuple[float, int, int]] = []
+
+    @property
+    def in_venue(self) -> int:
+        return len(self.checked_in)
+
+
+class OccupancyTracker:
+    # Counters are maintained per event as scans and check-outs arrive on the
+    # change feed, so reading an activity's occupancy or the alert list never
+    # touches the database.
+    def __init__(self, window: float = OCCUPANCY_WINDOW_SECONDS, alert_ratio: float = OCCUPANCY_ALERT_RATIO):
+        self.window = window
+        self.alert_ratio = alert_ratio
+        self._events: Dict[int, EventOccupancy] = defaultdict(EventOccupancy)
+        self.capacities: Dict[int, int] = {}
+        self.stats = {"scans": 0, "late_scans": 0, "exits": 0, "expired": 0, "rebuilds": 0, "last_rebuild_ms": 0.0}
+
+    def metrics(self):
+        return {
+            **self.stats,
+            "events": len(self._events),
+            "present": sum(len(state.location) for state in self._events.values()),
+            "alerts": sum(len(state.alerts) for state in self._events.values()),
+        }
+
+    def _level(self, activity_id: int, count: int) -> Optional[str]:
+        capacity = self.capacities.get(activity_id)
+        if not capacity:
+            return None
+        if count >= capacity:
+            return "full"
+        if count >= capacity * self.alert_ratio:
+            return "near"
+        return None
+
+    def _adjust(self, state: EventOccupancy, activity_id: int, delta: int):
+        count = state.counts[activity_id] + delta
+        if count > 0:
+            state.counts[activity_id] = count
+        else:
+            state.counts.pop(activity_id, None)
+        level = self._level(activity_id, count)
+        previous = state.alerts.get(activity_id)
+        if level == previous:
+            return
+        if level is None:
+            del state.alerts[activity_id]
+        else:
+            state.alerts[activity_id] = level
+            if level == "full":
+                logger.warning("Activity %s is at capacity (%s/%s)", activity_id, count, self.capacities[activity_id])
+
+    def _leave(self, state: EventOccupancy, user_id: int):
+        previous = state.location.pop(user_id, None)
+        if previous is not None:
+            self._adjust(state, previous[0], -1)
+
+    def _expire(self, state: EventOccupancy, now: float):
+        cutoff = now - self.window
+        while state._expiry and state._expiry[0][0] < cutoff:
+            at, user_id, activity_id = heapq.heappop(state._expiry)
+            if state.location.get(user_id) == (activity_id, at):
+                self._leave(state, user_id)
+                self.stats["expired"] += 1
+
+    def observe(self, event_id: int, user_id: int, activity_id: int, scanned_at):
+        at = _seconds(scanned_at)
+        now = time.time()
+        if at < now - self.window:
+            return
+        state = self._events[event_id]
+        previous = state.location.get(user_id)
+        if previous is not None and at <= previous[1]:
+            # A late upload from an offline scanner; the hacker has moved on.
+            self.stats["late_scans"] += 1
+            return
+        self.stats["scans"] += 1
+        if previous is None or previous[0] != activity_id:
+            if previous is not None:
+                self._adjust(state, previous[0], -1)
+            self._adjust(state, activity_id, 1)
+        state.location[user_id] = (activity_id, at)
+        heapq.heappush(state._expiry, (at, user_id, activity_id))
+        self._expire(state, now)
+
+    def check_in(self, event_id: int, user_id: int):
+        self._events[event_id].checked_in.add(user_id)
+
+    def check_out(self, event_id: int, user_id: int):
+        state = self._events[event_id]
+        state.checked_in.discard(user_id)
+        if user_id in state.location:
+            self._leave(state, user_id)
+            self.stats["exits"] += 1
+
+    def on_scans(self, events: List[changefeed.ChangeEvent]):
+        # Catch-up after a reconnect replays missed inserts, so a scan resync
+        # needs no extra work; replays of scans already seen are no-ops.
+        for change in events:
+            if change.op == "insert" and change.row:
+                row = change.row
+                self.observe(row["event_id"], row["user_id"], row["activity_id"], row["scanned_at"])
+
+    async def on_registrations(self, events: List[changefeed.ChangeEvent]):
+        for change in events:
+            if change.op == "resync":
+                await self.load_venue()
+                continue
+            row = change.row
+            if not row:
+                continue
+            if change.op != "delete" and row.get("checked_in_at"):
+                self.check_in(row["event_id"], row["user_id"])
+            elif change.op in ("update", "delete"):
+                # A check-in cleared or a registration removed. A new
+                # registration without a check-in changes nothing.
+                self.check_out(row["event_id"], row["user_id"])
+
+    async def load_capacities(self):
+        async with AsyncSessionMaker() as db:
+            result = await db.execute(select(Activity.id, Activity.capacity).filter(Activity.capacity.isnot(None)))
+            self.capacities = dict(result.fetchall())
+        for state in self._events.values():
+            for activity_id in set(state.counts) | set(state.alerts):
+                self._adjust(state, activity_id, 0)
+
+    def set_capacity(self, activity_id: int, capacity: Optional[int]):
+        if capacity:
+            self.capacities[activity_id] = capacity
+        else:
+            self.capacities.pop(activity_id, None)
+        for state in self._events.values():
+            self._adjust(state, activity_id, 0)
+
+    async def load_venue(self):
+        async with AsyncSessionMaker() as db:
+            result = await db.execute(
+                select(EventRegistration.event_id, EventRegistration.user_id)
+                .filter(EventRegistration.checked_in_at.isnot(None))
+            )
+            checked_in: Dict[int, Set[int]] = defaultdict(set)
+            for event_id, user_id in result.fetchall():
+                checked_in[event_id].add(user_id)
+        for event_id, state in self._events.items():
+            state.checked_in = checked_in.pop(event_id, set())
+        for event_id, users in checked_in.items():
+            self._events[event_id].checked_in = users
+
+    async def rebuild(self):
+        # Each hacker's latest scan inside the window. The scanned_at bound
+        # keeps the read to the recent partitions, so the DISTINCT ON sort
+        # only covers the window's scans. Who checked out since isn't
+        # recorded, so those hackers age out with the window.
+        started = time.perf_counter()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.window)
+        self._events.clear()
+        await self.load_capacities()
+        async with AsyncSessionMaker() as db:
+            result = await db.execute(
+                select(Scan.event_id, Scan.user_id, Scan.activity_id, Scan.scanned_at)
+                .filter(Scan.scanned_at >= cutoff)
+                .distinct(Scan.event_id, Scan.user_id)
+                .order_by(Scan.event_id, Scan.user_id, Scan.scanned_at.desc())
+            )
+            for row in result.fetchall():
+                self.observe(*row)
+        await self.load_venue()
+        self.stats["rebuilds"] += 1
+        self.stats["last_rebuild_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    async def start(self):
+        # Runs after the change feed starts listening but before it
+        # dispatches, so scans and check-ins committed during the rebuild
+        # arrive after it; replaying one the rebuild already saw is a no-op.
+        await self.rebuild()
+        changefeed.subscribe("scans", self.on_scans)
+        changefeed.subscribe("event_registrations", self.on_registrations)
+
+    def stop(self):
+        changefeed.unsubscribe("scans", self.on_scans)
+        changefeed.unsubscribe("event_registrations", self.on_registrations)
+
+    def expire(self):
+        now = time.time()
+        for state in self._events.values():
+            self._expire(state, now)
+
+    def count(self, event_id: int, activity_id: int) -> int:
+        state = self._events[event_id]
+        self._expire(state, time.time())
+        return state.counts.get(activity_id, 0)
+
+    def snapshot(self, event_id: int) -> EventOccupancy:
+        state = self._events[event_id]
+        self._expire(state, time.time())
+        return state
+
+
+occupancy = OccupancyTracker()
+metrics.register("occupancy", occupancy.metrics)
@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+
+from backend.database import AsyncSessionMaker
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "scans"
+PARTITION_PREFIX = "scans_p"
+PARTITION_DAYS_AHEAD = int(os.getenv("PARTITION_DAYS_AHEAD", "3"))
+# Unset means partitions are never dropped automatically.
+PARTITION_RETENTION_DAYS = os.getenv("PARTITION_RETENTION_DAYS")
+# Arbitrary key for the transaction-level advisory lock that keeps workers
+# starting together from racing on CREATE TABLE / ATTACH.
+PARTITION_LOCK_KEY = 4607003
+
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def parse_partition_name(name: str) -> Optional[date]:
+    match = re.fullmatch(rf"{PARTITION_PREFIX}(\d{{8}})", name)
+    return datetime.strptime(match.group(1), "%Y%m%d").date() if match else None
+
+
+async def list_partitions(db) -> List[Tuple[str, Optional[date]]]:
+    result = await db.execute(
+        text(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = :parent
+            ORDER BY child.relname
+            """
+        ),
+        {"parent": PARENT_TABLE},
+    )
+    return [(name, parse_partition_name(name)) for (name,) in result.fetchall()]
+
+
+async def lock(db):
+    # Held until commit; the loser then lists the winner's partitions.
+    await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+
+
+async def create_partition(db, day: date):
+    name = partition_name(day)
+    start, end = day.isoformat(), (day + timedelta(days=1)).isoformat()
+    # Rows for this day may already sit in the default partition; Postgres
+    # refuses to attach over them, so they are moved into the new table first.
+    # The move is not a change: the default partition's copy of the change
+    # feed trigger is off for it, or subscribers would see every moved scan
+    # as deleted. Disabling is transactional and locks out concurrent inserts
+    # into the default partition, so no other session loses a notification.
+    await db.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS)"))
+    await db.execute(text(f"ALTER TABLE {PARENT_TABLE}_default DISABLE TRIGGER {PARENT_TABLE}_notify_change"))
+    await db.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {PARENT_TABLE}_default "
+            f"WHERE scanned_at >= :start AND scanned_at < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        {"start": datetime.fromisoformat(start), "end": datetime.fromisoformat(end)},
+    )
+    await db.execute(text(f"ALTER TABLE {PARENT_TABLE}_default ENABLE TRIGGER {PARENT_TABLE}_notify_change"))
+    await db.execute(
+        text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+    )
+
+
+async def ensure_partitions(days_ahead: int = PARTITION_DAYS_AHEAD, start: Optional[date] = None) -> List[str]:
+    start = start or datetime.utcnow().date()
+    created = []
+    async with AsyncSessionMaker() as db:
+        await lock(db)
+        existing = {day for _, day in await list_partitions(db) if day}
+        for offset in range(days_ahead + 1):
+            day = start + timedelta(days=offset)
+            if day not in existing:
+                await create_partition(db, day)
+                created.append(partition_name(day))
+        await db.commit()
+    for name in created:
+        logger.info("Created scan partition %s", name)
+    return created
+
+
+async def drop_partitions(older_than_days: int) -> List[str]:
+    cutoff = datetime.utcnow().date() - timedelta(days=older_than_days)
+    dropped = []
+    async with AsyncSessionMaker() as db:
+        await lock(db)
+        for name, day in await list_partitions(db):
+            if day is not None and day < cutoff:
+                await db.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+                await db.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+        await db.commit()
+    for name in dropped:
+        logger.info("Dropped scan partition %s", name)
+    return dropped
+
+
+async def maintain():
+    created = await ensure_partitions()
+    dropped = []
+    if PARTITION_RETENTION_DAYS:
+        dropped = await drop_partitions(int(PARTITION_RETENTION_DAYS))
+    return created, dropped
+
+
+async def show():
+    async with AsyncSessionMaker() as db:
+        for name, _ in await list_partitions(db):
+            rows = (await db.execute(text(f"SELECT count(*) FROM {name}"))).scalar_one()
+            print(f"   {name:<20} {rows:>10} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage daily partitions of the scans table")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure = commands.add_parser("ensure", help="Create partitions from a day onwards")
+    ensure.add_argument("--days-ahead", type=int, default=PARTITION_DAYS_AHEAD)
+    ensure.add_argument("--start", type=date.fromisoformat, default=None, help="YYYY-MM-DD, defaults to today")
+    prune = commands.add_parser("prune", help="Drop partitions older than N days")
+    prune.add_argument("--older-than", type=int, required=True)
+    commands.add_parser("list", help="List partitions and their row counts")
+    args = parser.parse_args()
+
+    if args.command == "ensure":
+        created = asyncio.run(ensure_partitions(args.days_ahead, args.start))
+        print(f"✅ Created {len(created)} partition(s): {', '.join(created) or '-'}")
+    elif args.command == "prune":
+        dropped = asyncio.run(drop_partitions(args.older_than))
+        print(f"🗑️ Dropped {len(dropped)} partition(s): {', '.join(dropped) or '-'}")
+    else:
+        asyncio.run(show())
+
+
+if __name__ == "__main__":
+    main()
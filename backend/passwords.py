@@ -0,0 +1,174 @@
+import argparse
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+# The first scheme hashes new passwords; the rest are only accepted and get
+# rehashed on the next successful login. "argon2" needs argon2-cffi.
+PASSWORD_SCHEMES = [s.strip() for s in os.getenv("PASSWORD_SCHEMES", "bcrypt").split(",") if s.strip()]
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "19456"))
+PASSWORD_TARGET_MS = float(os.getenv("PASSWORD_TARGET_MS", "250"))
+# Stored bcrypt hashes this many rounds either side of BCRYPT_ROUNDS are kept.
+# Workers calibrating on their own can land a round apart, and without the
+# slack each would rehash every login the other had just rehashed.
+PASSWORD_ROUNDS_TOLERANCE = int(os.getenv("PASSWORD_ROUNDS_TOLERANCE", "1"))
+PASSWORD_CALIBRATE = os.getenv("PASSWORD_CALIBRATE", "0") == "1"
+
+CALIBRATION_PASSWORD = "calibration-password"
+
+
+def _available(scheme: str) -> bool:
+    from passlib import registry
+    try:
+        return registry.get_crypt_handler(scheme).has_backend()
+    except (KeyError, AttributeError):
+        return False
+
+
+class PasswordService:
+    def __init__(self, schemes: List[str] = PASSWORD_SCHEMES):
+        self.schemes = schemes
+        self.bcrypt_rounds = BCRYPT_ROUNDS
+        self.argon2_time_cost = ARGON2_TIME_COST
+        self._context = None
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    @property
+    def context(self):
+        if self._context is None:
+            self._context = self._build()
+        return self._context
+
+    def _build(self):
+        from passlib.context import CryptContext
+
+        schemes = [s for s in self.schemes if _available(s)]
+        for missing in set(self.schemes) - set(schemes):
+            logger.warning("Password scheme %s has no backend installed, skipping it", missing)
+        if not schemes:
+            schemes = ["bcrypt"]
+        # Bounding min and max around the target cost makes needs_update()
+        # flag hashes made well off it, so turning the dial either way
+        # converges on the next login.
+        return CryptContext(
+            schemes=schemes,
+            deprecated="auto",
+            bcrypt__rounds=self.bcrypt_rounds,
+            bcrypt__min_rounds=max(4, self.bcrypt_rounds - PASSWORD_ROUNDS_TOLERANCE),
+            bcrypt__max_rounds=min(31, self.bcrypt_rounds + PASSWORD_ROUNDS_TOLERANCE),
+            argon2__time_cost=self.argon2_time_cost,
+            argon2__memory_cost=ARGON2_MEMORY_COST,
+        )
+
+    def configure(self, bcrypt_rounds: Optional[int] = None, argon2_time_cost: Optional[int] = None):
+        if bcrypt_rounds is not None:
+            self.bcrypt_rounds = bcrypt_rounds
+        if argon2_time_cost is not None:
+            self.argon2_time_cost = argon2_time_cost
+        self._context = None
+
+    def _record(self, operation: str, started: float):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        stat = self.stats.setdefault(operation, {"count": 0, "total_ms": 0.0, "last_ms": 0.0, "max_ms": 0.0})
+        stat["count"] += 1
+        stat["total_ms"] += elapsed_ms
+        stat["last_ms"] = round(elapsed_ms, 3)
+        stat["max_ms"] = max(stat["max_ms"], round(elapsed_ms, 3))
+
+    def metrics(self):
+        return {
+            "default_scheme": self.context.default_scheme(),
+            "bcrypt_rounds": self.bcrypt_rounds,
+            "argon2_time_cost": self.argon2_time_cost,
+            "operations": {
+                name: {**stat, "avg_ms": round(stat["total_ms"] / stat["count"], 3)}
+                for name, stat in self.stats.items()
+            },
+        }
+
+    def hash(self, password: str) -> str:
+        started = time.perf_counter()
+        try:
+            return self.context.hash(password)
+        finally:
+            self._record("hash", started)
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        started = time.perf_counter()
+        try:
+            return self.context.verify(password, hashed_password)
+        finally:
+            self._record("verify", started)
+
+    def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        started = time.perf_counter()
+        try:
+            return self.context.verify_and_update(password, hashed_password)
+        finally:
+            self._record("verify", started)
+
+    def calibrate(self, target_ms: float = PASSWORD_TARGET_MS) -> Dict[str, int]:
+        from passlib.hash import argon2, bcrypt
+
+        def measure(handler) -> float:
+            started = time.perf_counter()
+            handler.hash(CALIBRATION_PASSWORD)
+            return (time.perf_counter() - started) * 1000
+
+        chosen = {}
+        # Each extra bcrypt round doubles the cost, so stop at the last one
+        # that still fits the target.
+        rounds = 4
+        while rounds < 31 and measure(bcrypt.using(rounds=rounds + 1)) <= target_ms:
+            rounds += 1
+        chosen["bcrypt_rounds"] = rounds
+
+        if _available("argon2"):
+            time_cost = 1
+            while time_cost < 50 and measure(argon2.using(time_cost=time_cost + 1, memory_cost=ARGON2_MEMORY_COST)) <= target_ms:
+                time_cost += 1
+            chosen["argon2_time_cost"] = time_cost
+
+        self.configure(chosen["bcrypt_rounds"], chosen.get("argon2_time_cost"))
+        logger.info("Password hashing calibrated to %.0f ms: %s", target_ms, chosen)
+        return chosen
+
+
+password_service = PasswordService()
+metrics.register("passwords", password_service.metrics)
+
+
+def hash_password(password: str) -> str:
+    return password_service.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return password_service.verify(plain_password, hashed_password)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Password hashing cost calibration")
+    parser.add_argument("command", choices=["calibrate"])
+    parser.add_argument("--target-ms", type=float, default=PASSWORD_TARGET_MS)
+    args = parser.parse_args()
+
+    chosen = password_service.calibrate(args.target_ms)
+    print(f"✅ Hash cost for ~{args.target_ms:.0f} ms on this host:")
+    for key, value in chosen.items():
+        print(f"   {key.upper()}={value}")
+    timings = []
+    for _ in range(5):
+        password_service.hash(CALIBRATION_PASSWORD)
+        timings.append(password_service.stats["hash"]["last_ms"])
+    print(f"   measured: {', '.join(f'{t:.0f} ms' for t in timings)}")
+
+
+if __name__ == "__main__":
+    main()
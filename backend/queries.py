@@ -0,0 +1,116 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import bindparam, lambda_stmt
+from sqlalchemy.future import select
+from sqlalchemy.sql import func
+
+from backend.models import Activity, Scan, User
+
+# The hot statements of the request path. Fixed-shape lookups are built once
+# at import and executed with bound parameters, so a request neither rebuilds
+# the construct nor recomputes its cache key. Queries whose shape depends on
+# optional filters are lambda statements: SQLAlchemy keys them on the
+# lambdas' code and lifts closure variables into parameters, skipping the
+# construction on every call after the first. Either way the SQL text is
+# stable, which is what lets asyncpg reuse its prepared statements on each
+# pooled connection.
+
+USER_BY_EMAIL = select(User).where(User.email == bindparam("email"))
+ACTIVE_USER_ID_BY_EMAIL = select(User.id).where(User.email == bindparam("email"), User.is_active.is_(True))
+USER_ID_BY_BADGE = select(User.id).where(User.badge_code == bindparam("badge_code"))
+
+
+async def user_by_email(db, email: str) -> Optional[User]:
+    result = await db.execute(USER_BY_EMAIL, {"email": email})
+    return result.scalars().first()
+
+
+async def active_user_id_by_email(db, email: str) -> Optional[int]:
+    result = await db.execute(ACTIVE_USER_ID_BY_EMAIL, {"email": email})
+    return result.scalar_one_or_none()
+
+
+async def user_id_by_badge(db, badge_code: str) -> Optional[int]:
+    result = await db.execute(USER_ID_BY_BADGE, {"badge_code": badge_code})
+    return result.scalar_one_or_none()
+
+
+def _scoped(statement, event, since: Optional[datetime], until: Optional[datetime]):
+    # Lambda counterpart of crud.scoped_scans. Closures capture plain values
+    # only; the event object itself would make every event a new cache entry.
+    event_id = event.id
+    start = since or event.starts_at
+    end = until or event.ends_at
+    statement += lambda s: s.where(Scan.event_id == event_id)
+    if start:
+        statement += lambda s: s.where(Scan.scanned_at >= start)
+    if end:
+        statement += lambda s: s.where(Scan.scanned_at < end)
+    return statement
+
+
+def _by_activity(statement, activity_name: Optional[str], activity_category: Optional[str]):
+    # Same rows as activities.activity_filter, one branch per filter so the
+    # statement shape follows which filters were given.
+    if activity_name:
+        statement += lambda s: s.where(Scan.activity_id.in_(select(Activity.id).where(Activity.name == activity_name)))
+    if activity_category:
+        statement += lambda s: s.where(
+            Scan.activity_id.in_(select(Activity.id).where(Activity.category == activity_category))
+        )
+    return statement
+
+
+def activity_counts_statement(
+    event,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    activity_name: Optional[str] = None,
+    activity_category: Optional[str] = None,
+    min_frequency: int = 0,
+    max_frequency: Optional[int] = None,
+):
+    # Index-only over ix_scans_event_activity; names come from the catalog.
+    statement = lambda_stmt(lambda: select(Scan.activity_id, func.count()).group_by(Scan.activity_id))
+    statement = _by_activity(_scoped(statement, event, since, until), activity_name, activity_category)
+    if min_frequency > 0:
+        statement += lambda s: s.having(func.count() >= min_frequency)
+    if max_frequency is not None:
+        statement += lambda s: s.having(func.count() <= max_frequency)
+    return statement
+
+
+async def activity_counts(db, event, *args) -> List[Tuple[int, int]]:
+    return (await db.execute(activity_counts_statement(event, *args))).fetchall()
+
+
+def leaderboard_statement(event, since: Optional[datetime] = None, until: Optional[datetime] = None, limit: int = 10):
+    statement = lambda_stmt(
+        lambda: select(User.id, User.name, func.count(Scan.id).label("scan_count"))
+        .join(Scan)
+        .group_by(User.id)
+        .order_by(func.count(Scan.id).desc())
+    )
+    statement = _scoped(statement, event, since, until)
+    statement += lambda s: s.limit(limit)
+    return statement
+
+
+async def leaderboard(db, event, *args):
+    return (await db.execute(leaderboard_statement(event, *args))).fetchall()
+
+
+def hourly_counts_statement(
+    event, since: Optional[datetime] = None, until: Optional[datetime] = None, activity_name: Optional[str] = None
+):
+    statement = lambda_stmt(
+        lambda: select(func.date_trunc("hour", Scan.scanned_at).label("time_slot"), func.count(Scan.id).label("scan_count"))
+        .group_by("time_slot")
+        .order_by("time_slot")
+    )
+    return _by_activity(_scoped(statement, event, since, until), activity_name, None)
+
+
+async def hourly_counts(db, event, *args):
+    return (await db.execute(hourly_counts_statement(event, *args))).fetchall()
@@ -0,0 +1,214 @@
+import asyncio
+import math
+import os
+import time
+from typing import Dict, List, Tuple
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import text
+
+from backend import metrics
+from backend.database import AsyncSessionMaker
+
+
+def parse_rate(value: str) -> Tuple[int, float]:
+    # "20/60" -> 20 attempts per 60 seconds
+    limit, window = value.split("/")
+    return int(limit), float(window)
+
+
+LOGIN_RATE_PER_IP = parse_rate(os.getenv("LOGIN_RATE_PER_IP", "30/60"))
+# Counted per (account, client IP), so nobody can lock an account out by
+# guessing at it from elsewhere.
+LOGIN_RATE_PER_ACCOUNT = parse_rate(os.getenv("LOGIN_RATE_PER_ACCOUNT", "10/60"))
+# Failed logins per account from all addresses; high enough that only a
+# distributed guessing run reaches it.
+LOGIN_FAILURES_PER_ACCOUNT = parse_rate(os.getenv("LOGIN_FAILURES_PER_ACCOUNT", "100/60"))
+# "memory" keeps counters per worker; "postgres" shares them between workers.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+MAX_INFLIGHT_HASHES = int(os.getenv("MAX_INFLIGHT_HASHES", str((os.cpu_count() or 2) * 2)))
+HASH_QUEUE_TIMEOUT = float(os.getenv("HASH_QUEUE_TIMEOUT", "0.25"))
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0") == "1"
+
+stats = {"allowed": 0, "limited_ip": 0, "limited_account": 0, "shed": 0}
+
+
+def estimate(previous: int, current: int, window: float, now: float) -> float:
+    # Sliding-window counter: the previous fixed window is weighted by how
+    # much of it still overlaps the trailing window.
+    elapsed = now % window
+    return previous * (1 - elapsed / window) + current
+
+
+class MemoryWindowStore:
+    def __init__(self, purge_every: int = 10000):
+        self._counters: Dict[Tuple[str, float, int], int] = {}
+        self._hits = 0
+        self._purge_every = purge_every
+
+    async def hit(self, key: str, window: float, now: float, amount: int = 1) -> Tuple[int, int]:
+        slot = int(now // window)
+        current = self._counters.get((key, window, slot), 0) + amount
+        if amount:
+            self._counters[(key, window, slot)] = current
+            self._hits += 1
+            if self._hits % self._purge_every == 0:
+                self.purge(now)
+        return self._counters.get((key, window, slot - 1), 0), current
+
+    async def hit_many(self, hits: List[Tuple[str, float, int]], now: float) -> List[Tuple[int, int]]:
+        return [await self.hit(key, window, now, amount) for key, window, amount in hits]
+
+    def purge(self, now: float):
+        stale = [k for k in self._counters if k[2] < int(now // k[1]) - 1]
+        for counter_key in stale:
+            del self._counters[counter_key]
+
+
+class PostgresWindowStore:
+    async def hit_many(self, hits: List[Tuple[str, float, int]], now: float) -> List[Tuple[int, int]]:
+        # One round trip for all of a request's counters. Hits with amount 0
+        # only read; when nothing is counted the statement is a plain SELECT.
+        params = {
+            "keys": [key for key, _, _ in hits],
+            "slots": [int(now // window) for _, window, _ in hits],
+            "amounts": [amount for _, _, amount in hits],
+        }
+        counted = any(amount for _, _, amount in hits)
+        upsert = (
+            """,
+            upserted AS (
+                INSERT INTO rate_limit_counters (key, slot, count)
+                SELECT key, slot, amount FROM hits WHERE amount > 0
+                ON CONFLICT (key, slot) DO UPDATE
+                SET count = rate_limit_counters.count + EXCLUDED.count, updated_at = now()
+                RETURNING key, slot, count
+            )
+            """
+            if counted
+            else ""
+        )
+        # The main query sees the table as it was before the upsert, so
+        # counted hits take their new count from the upsert's RETURNING.
+        current = "(SELECT u.count FROM upserted u WHERE u.key = h.key AND u.slot = h.slot), " if counted else ""
+        async with AsyncSessionMaker() as db:
+            result = await db.execute(
+                text(
+                    f"""
+                    WITH hits AS (
+                        SELECT * FROM unnest(CAST(:keys AS varchar[]), CAST(:slots AS bigint[]), CAST(:amounts AS int[]))
+                        WITH ORDINALITY AS h(key, slot, amount, n)
+                    ){upsert}
+                    SELECT
+                        COALESCE((SELECT c.count FROM rate_limit_counters c WHERE c.key = h.key AND c.slot = h.slot - 1), 0),
+                        COALESCE({current}(SELECT c.count FROM rate_limit_counters c WHERE c.key = h.key AND c.slot = h.slot), 0)
+                    FROM hits h
+                    ORDER BY h.n
+                    """
+                ),
+                params,
+            )
+            rows = [tuple(row) for row in result.fetchall()]
+            if counted:
+                await db.commit()
+        return rows
+
+    async def purge(self, max_age_seconds: int = 3600):
+        async with AsyncSessionMaker() as db:
+            await db.execute(
+                text("DELETE FROM rate_limit_counters WHERE updated_at < now() - make_interval(secs => :age)"),
+                {"age": max_age_seconds},
+            )
+            await db.commit()
+
+
+window_store = PostgresWindowStore() if RATE_LIMIT_BACKEND == "postgres" else MemoryWindowStore()
+
+
+async def check_all(checks: List[Tuple[str, int, float, int]]) -> List[float]:
+    # (key, limit, window, amount) each; amount=0 reads the counter without
+    # counting an attempt. Returns, per check, 0 when allowed, otherwise
+    # seconds until the next window opens.
+    now = time.time()
+    counts = await window_store.hit_many(
+        [(f"{key}:{int(window)}", window, amount) for key, _, window, amount in checks], now
+    )
+    return [
+        window - (now % window) if estimate(previous, current, window, now) > limit else 0.0
+        for (_, limit, window, _), (previous, current) in zip(checks, counts)
+    ]
+
+
+async def check(key: str, limit: int, window: float, amount: int = 1) -> float:
+    return (await check_all([(key, limit, window, amount)]))[0]
+
+
+def too_many(retry_after: float, detail: str):
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def enforce_login_limits(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    ip = client_ip(request)
+    account = form_data.username.lower()
+    by_ip, by_account, by_failures = await check_all([
+        (f"login:ip:{ip}", *LOGIN_RATE_PER_IP, 1),
+        (f"login:account:{account}:{ip}", *LOGIN_RATE_PER_ACCOUNT, 1),
+        (f"login:failures:{account}", *LOGIN_FAILURES_PER_ACCOUNT, 0),
+    ])
+    if by_ip:
+        stats["limited_ip"] += 1
+        raise too_many(by_ip, "Too many login attempts from this address")
+    retry_after = by_account or by_failures
+    if retry_after:
+        stats["limited_account"] += 1
+        raise too_many(retry_after, "Too many login attempts for this account")
+    stats["allowed"] += 1
+
+
+async def record_login_failure(username: str):
+    await check(f"login:failures:{username.lower()}", *LOGIN_FAILURES_PER_ACCOUNT)
+
+
+class HashGate:
+    # Caps concurrent password hashes across the worker; callers that can't
+    # get a slot quickly are shed instead of queueing behind bcrypt.
+    def __init__(self, limit: int = MAX_INFLIGHT_HASHES, timeout: float = HASH_QUEUE_TIMEOUT):
+        self.limit = limit
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+
+    async def __aenter__(self):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            stats["shed"] += 1
+            raise too_many(1, "Login service is busy, retry shortly")
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+hash_gate = HashGate()
+metrics.register("login_rate_limit", lambda: {
+    **stats,
+    "backend": RATE_LIMIT_BACKEND,
+    "hash_in_flight": hash_gate.in_flight,
+    "hash_in_flight_limit": hash_gate.limit,
+})
@@ -0,0 +1,72 @@
+import json
+import os
+from typing import List, Optional, Tuple
+
+from fastapi import Response
+from sqlalchemy.future import select
+
+from backend.models import User, UserTombstone
+
+try:
+    import msgpack
+except ImportError:  # optional; NDJSON is always available
+    msgpack = None
+
+ROSTER_PAGE_SIZE = int(os.getenv("ROSTER_PAGE_SIZE", "5000"))
+VERSION_HEADER = "X-Roster-Version"
+MSGPACK_TYPE = "application/msgpack"
+NDJSON_TYPE = "application/x-ndjson"
+
+# Positional rather than keyed so every record stays small on the wire.
+ROSTER_FIELDS = ("id", "name", "badge_code", "is_active")
+
+
+async def fetch_changes(db, since: int, limit: int = ROSTER_PAGE_SIZE) -> Tuple[List[tuple], List[int], int, bool]:
+    # Users and tombstones share one sequence, so merging both streams by
+    # change_seq gives a single ordered log a device can resume from.
+    users = await db.execute(
+        select(User.change_seq, User.id, User.name, User.badge_code, User.is_active)
+        .filter(User.change_seq > since)
+        .order_by(User.change_seq)
+        .limit(limit + 1)
+    )
+    tombstones = await db.execute(
+        select(UserTombstone.change_seq, UserTombstone.user_id)
+        .filter(UserTombstone.change_seq > since)
+        .order_by(UserTombstone.change_seq)
+        .limit(limit + 1)
+    )
+    log = sorted(
+        [("upsert", row) for row in users.fetchall()] + [("delete", row) for row in tombstones.fetchall()],
+        key=lambda entry: entry[1][0],
+    )
+    more = len(log) > limit
+    page = log[:limit]
+
+    upserts = [tuple(row[1:]) for kind, row in page if kind == "upsert"]
+    deletes = [row[1] for kind, row in page if kind == "delete"]
+    version = page[-1][1][0] if page else since
+    return upserts, deletes, version, more
+
+
+def encode_ndjson(upserts, deletes, version: int, more: bool) -> bytes:
+    lines = [json.dumps({"version": str(version), "more": more, "fields": ROSTER_FIELDS}, separators=(",", ":"))]
+    lines.extend(json.dumps(["u", *row], separators=(",", ":")) for row in upserts)
+    lines.extend(json.dumps(["d", user_id]) for user_id in deletes)
+    return ("\n".join(lines) + "\n").encode()
+
+
+def encode_msgpack(upserts, deletes, version: int, more: bool) -> bytes:
+    return msgpack.packb(
+        {"version": str(version), "more": more, "fields": ROSTER_FIELDS, "upserts": upserts, "deletes": deletes}
+    )
+
+
+def roster_response(upserts, deletes, version: int, more: bool, accept: Optional[str]) -> Response:
+    # Compression is negotiated by CompressionMiddleware.
+    headers = {VERSION_HEADER: str(version), "Vary": "Accept"}
+    if msgpack is not None and accept and MSGPACK_TYPE in accept:
+        body, media_type = encode_msgpack(upserts, deletes, version, more), MSGPACK_TYPE
+    else:
+        body, media_type = encode_ndjson(upserts, deletes, version, more), NDJSON_TYPE
+    return Response(content=body, media_type=media_type, headers=headers)
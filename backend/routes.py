@@ -1,18 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from backend import crud, schemas, database
 from typing import List, Optional
 from sqlalchemy.future import select
 from sqlalchemy.sql import func
 from datetime import datetime
-from backend.schemas import Token, UserAuth
-from backend.models import Scan, User, Connection
-from backend.auth import create_access_token, decode_access_token
+from backend.schemas import Token, UserAuth, UtcDateTime
+from backend.models import Scan, User, Connection, Activity, Event
+from backend.events import EventContext, current_event, registry as event_registry
+from backend.activities import catalog
+from backend.auth import create_access_token, create_refresh_token, decode_access_token, decode_token
 from backend.crud import authenticate_user
 from backend.database import AsyncSessionMaker
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi import status
-from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from backend import metrics, queries, roster
+from backend.sketches import analytics
+from backend import badges as badge_ops
+from backend.badges import badges
+from backend import vectorized
+from backend.vectorized import vector_analytics
+from backend.scan_buffer import scan_buffer, SCAN_WRITE_MODE
+from backend.debounce import scan_debouncer
+from backend.occupancy import occupancy
+from backend.coattendance import coattendance
+from backend.ratelimit import enforce_login_limits, hash_gate, record_login_failure
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
@@ -26,6 +39,16 @@ async def get_db():
 async def read_users(db: AsyncSession = Depends(get_db)):
     return await crud.get_users(db)
 
+# Registered before /users/{user_id} so "search" isn't parsed as an id.
+@router.get("/users/search", response_model=List[schemas.UserSearchResult], summary="Search Users")
+async def search_users(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    mode: str = Query("fuzzy", pattern="^(fuzzy|prefix)$"),
+    db: AsyncSession = Depends(database.get_read_db),
+):
+    return await crud.search_users(db, q, limit, mode)
+
 @router.get("/users/{user_id}", response_model=schemas.User,  summary="Retrieve User Details")
 async def read_user(user_id: int, db: AsyncSession = Depends(get_db)):
     user = await crud.get_user(db, user_id)
@@ -34,8 +57,8 @@ async def read_user(user_id: int, db: AsyncSession = Depends(get_db)):
     return user
 
 @router.post("/users", response_model=schemas.User, summary="Register a New User")
-async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
-    return await crud.create_user(db, user)
+async def create_user(user: schemas.UserCreate, event: EventContext = Depends(current_event), db: AsyncSession = Depends(get_db)):
+    return await crud.create_user(db, user, event.id)
 
 async def get_current_admin(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
 
@@ -43,10 +66,9 @@ async def get_current_admin(token: str = Depends(oauth2_scheme), db: AsyncSessio
     if email is None:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    result = await db.execute(select(User).filter(User.email == email))
-    user = result.scalars().first()
+    user = await queries.user_by_email(db, email)
 
-    if not user or not user.is_admin:
+    if not user or not user.is_admin or user.is_active is False:
         raise HTTPException(status_code=403, detail="Admin access required")
     
     return user
@@ -58,16 +80,11 @@ async def delete_user(
     admin: User = Depends(get_current_admin) 
 ):
     
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalars().first()
+    user = await crud.delete_user(db, user_id)
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    await db.execute(delete(Scan).where(Scan.user_id == user_id))
-    await db.execute(delete(User).where(User.id == user_id))
-    await db.commit()
-
     return {"message": f"User {user.email} deleted successfully"}
 
 
@@ -80,17 +97,77 @@ async def update_user(user_id: int, user_update: schemas.UserUpdate, db: AsyncSe
 
 
 @router.post("/scans/{user_id}", response_model=schemas.Scan)
-async def add_scan(user_id: int, scan: schemas.ScanCreate, db: AsyncSession = Depends(get_db)):
-    return await crud.create_scan(db, user_id, scan)
+async def add_scan(user_id: int, scan: schemas.ScanCreate, event: EventContext = Depends(current_event), db: AsyncSession = Depends(get_db)):
+    return await record_scan(db, user_id, scan, event)
+
+
+async def record_scan(db: AsyncSession, user_id: int, scan: schemas.ScanCreate, event: EventContext):
+    async def write():
+        if SCAN_WRITE_MODE == "buffered":
+            return await scan_buffer.submit(user_id, scan, event.id)
+        return await crud.create_scan(db, user_id, scan, event.id)
+
+    # Double taps and scanner retries collapse here, before any DB work.
+    key = (event.id, user_id, scan.activity_name, scan.activity_category)
+    return await scan_debouncer.record(key, write)
 
 
 @router.get("/scans", response_model=List[schemas.Scan])
-async def read_scans(min_frequency: int = 0, activity_category: Optional[str] = None, db: AsyncSession = Depends(get_db)):
-    return await crud.get_scans(db, min_frequency, activity_category)
+async def read_scans(
+    min_frequency: int = 0,
+    activity_category: Optional[str] = None,
+    since: Optional[UtcDateTime] = None,
+    until: Optional[UtcDateTime] = None,
+    event: EventContext = Depends(current_event),
+    db: AsyncSession = Depends(get_db)
+):
+    return await crud.get_scans(db, event, min_frequency, activity_category, since, until)
 
 @router.get("/users/{user_id}/scans", response_model=List[schemas.Scan])
-async def read_user_scans(user_id: int, db: AsyncSession = Depends(get_db)):
-    return await crud.get_user_scans(db, user_id)
+async def read_user_scans(
+    user_id: int,
+    event: EventContext = Depends(current_event),
+    db: AsyncSession = Depends(get_db)
+):
+    return await crud.get_user_scans(db, event, user_id)
+
+@router.get("/users/{user_id}/suggestions", response_model=List[schemas.Suggestion], summary="People You Should Meet")
+async def read_user_suggestions(
+    user_id: int,
+    limit: int = Query(10, ge=1, le=100),
+    event: EventContext = Depends(current_event),
+    db: AsyncSession = Depends(database.get_read_db),
+):
+    # Ranked in memory; the database only supplies names and drops
+    # deactivated accounts, so ask for a few spare candidates.
+    ranked = coattendance.suggestions(event.id, user_id, limit * 2)
+    if not ranked:
+        return []
+    result = await db.execute(
+        select(User.id, User.name).filter(User.id.in_([i for i, _ in ranked]), User.is_active.isnot(False))
+    )
+    names = dict(result.fetchall())
+    return [
+        {"user_id": i, "name": names[i], "shared_activities": shared}
+        for i, shared in ranked if i in names
+    ][:limit]
+
+@router.get("/users/{user_id}/history", response_model=schemas.ScanHistoryPage, summary="Paginated Scan History")
+async def read_user_history(
+    user_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    since: Optional[UtcDateTime] = None,
+    activity_name: Optional[str] = None,
+    activity_category: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated subset of id,activity_name,activity_category,scanned_at"),
+    event: EventContext = Depends(current_event),
+    db: AsyncSession = Depends(get_db)
+):
+    return await crud.get_user_history(
+        db, event, user_id, limit, cursor, since, activity_name, activity_category,
+        fields.split(",") if fields else None
+    )
 
 @router.get("/scan-stats")
 async def scan_stats(
@@ -98,47 +175,47 @@ async def scan_stats(
     max_frequency: Optional[int] = None,
     activity_name: Optional[str] = None,
     activity_category: Optional[str] = None,
-    db: AsyncSession = Depends(get_db)
+    since: Optional[UtcDateTime] = None,
+    until: Optional[UtcDateTime] = None,
+    event: EventContext = Depends(current_event),
+    db: AsyncSession = Depends(database.get_read_db)
 ):
-    query = select(
-        Scan.activity_name,
-        Scan.activity_category,
-        func.count(Scan.id).label("frequency")
-    ).group_by(Scan.activity_name, Scan.activity_category)
-
-    if min_frequency > 0:
-        query = query.having(func.count(Scan.id) >= min_frequency)
-
-    if max_frequency is not None:
-        query = query.having(func.count(Scan.id) <= max_frequency)
-
-    if activity_name:
-        query = query.filter(Scan.activity_name == activity_name)
-
-    if activity_category:
-        query = query.filter(Scan.activity_category == activity_category)
-
-    result = await db.execute(query)
-    raw_data = result.fetchall()
-
-
-    scan_data = [
-        {"activity_name": row[0], "activity_category": row[1], "frequency": row[2]} 
-        for row in raw_data
+    if vectorized.enabled():
+        columns = await vector_analytics.snapshot(event.id)
+        mask = vectorized.window_mask(columns, since or event.starts_at, until or event.ends_at)
+        counts = vectorized.activity_counts(columns, mask)
+        if activity_name or activity_category:
+            wanted = set(await catalog.ids_for(activity_name, activity_category))
+            counts = {i: n for i, n in counts.items() if i in wanted}
+        counts = {
+            i: n for i, n in counts.items()
+            if n >= min_frequency and (max_frequency is None or n <= max_frequency)
+        }
+        names = await catalog.describe(list(counts))
+        return [
+            {"activity_name": names[i][0], "activity_category": names[i][1], "frequency": n}
+            for i, n in counts.items()
+        ]
+
+    counts = await queries.activity_counts(
+        db, event, since, until, activity_name, activity_category, min_frequency, max_frequency
+    )
+    names = await catalog.describe([row[0] for row in counts])
+    return [
+        {"activity_name": names[i][0], "activity_category": names[i][1], "frequency": n}
+        for i, n in counts
     ]
 
-    return scan_data 
-
 
 @router.get("/scan-timeline")
-async def scan_timeline(activity_name: str, db: AsyncSession = Depends(get_db)):
-    query = select(
-        func.date_trunc('hour', Scan.scanned_at).label("time_slot"),
-        func.count(Scan.id).label("scan_count")
-    ).where(Scan.activity_name == activity_name).group_by("time_slot")
-
-    result = await db.execute(query)
-    raw_data = result.fetchall()
+async def scan_timeline(
+    activity_name: str,
+    since: Optional[UtcDateTime] = None,
+    until: Optional[UtcDateTime] = None,
+    event: EventContext = Depends(current_event),
+    db: AsyncSession = Depends(database.get_read_db)
+):
+    raw_data = await queries.hourly_counts(db, event, since, until, activity_name)
 
     
     timeline_data = [
@@ -151,88 +228,119 @@ async def scan_timeline(activity_name: str, db: AsyncSession = Depends(get_db)):
     return timeline_data
 
 
-@router.post("/check-in")
-async def check_in(badge_code: str, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(User).filter(User.badge_code == badge_code))
-    user = result.scalars().first()
-    if not user:
+async def badge_user(badge_code: str) -> int:
+    user_id = await badges.lookup(badge_code)
+    if user_id is None:
         raise HTTPException(status_code=404, detail="User not found")
-    if user.updated_at:
+    return user_id
+
+
+@router.post("/check-in")
+async def check_in(badge_code: str, event: EventContext = Depends(current_event), db: AsyncSession = Depends(get_db)):
+    user_id = await badge_user(badge_code)
+    if await badge_ops.check_in(db, event.id, user_id) is None:
         raise HTTPException(status_code=400, detail="User already checked in")
-    user.updated_at = datetime.utcnow()
-    await db.commit()
     return {"message": "User checked in successfully"}
 
 
 @router.post("/check-out")
-async def check_out(badge_code: str, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(User).filter(User.badge_code == badge_code))
-    user = result.scalars().first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    user.updated_at = None  
-    await db.commit()
+async def check_out(badge_code: str, event: EventContext = Depends(current_event), db: AsyncSession = Depends(get_db)):
+    user_id = await badge_user(badge_code)
+    await badge_ops.check_out(db, event.id, user_id)
     return {"message": "User checked out successfully"}
 
 
+@router.post("/badges/{badge_code}/check-in", response_model=schemas.BadgeState, summary="Check In by Badge")
+async def badge_check_in(badge_code: str, event: EventContext = Depends(current_event), db: AsyncSession = Depends(get_db)):
+    user_id = await badge_user(badge_code)
+    checked_in_at = await badge_ops.check_in(db, event.id, user_id)
+    if checked_in_at is None:
+        raise HTTPException(status_code=400, detail="User already checked in")
+    return {"user_id": user_id, "badge_code": badge_code, "checked_in_at": checked_in_at}
+
+
+@router.post("/badges/{badge_code}/scan", response_model=schemas.BadgeScan, summary="Record a Scan by Badge")
+async def badge_scan(badge_code: str, scan: schemas.ScanCreate, event: EventContext = Depends(current_event), db: AsyncSession = Depends(get_db)):
+    user_id = await badge_user(badge_code)
+    recorded = await record_scan(db, user_id, scan, event)
+    return {"scan": recorded, "checked_in_at": badges.checked_in_at(event.id, user_id)}
+
+
 @router.post("/connect/{user_id1}/{user_id2}")
-async def connect_users(user_id1: int, user_id2: int, db: AsyncSession = Depends(get_db)):
+async def connect_users(user_id1: int, user_id2: int, event: EventContext = Depends(current_event), db: AsyncSession = Depends(get_db)):
     if user_id1 == user_id2:
         raise HTTPException(status_code=400, detail="Cannot connect a user to themselves")
-    new_connection = Connection(user_id1=user_id1, user_id2=user_id2)
+    new_connection = Connection(event_id=event.id, user_id1=user_id1, user_id2=user_id2)
     db.add(new_connection)
     await db.commit()
     return {"message": "Users connected successfully"}
 
 
 @router.post("/snacks/{user_id}")
-async def claim_snack(user_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Scan).filter(Scan.user_id == user_id, Scan.activity_name == "Midnight Snack"))
+async def claim_snack(user_id: int, event: EventContext = Depends(current_event), db: AsyncSession = Depends(get_db)):
+    snack_id = await catalog.resolve("Midnight Snack", "Food")
+    result = await db.execute(select(Scan.id).filter(Scan.event_id == event.id, Scan.user_id == user_id, Scan.activity_id == snack_id))
     existing_snack = result.scalars().first()
     if existing_snack:
         raise HTTPException(status_code=403, detail="You have already claimed your midnight snack")
-    new_snack_scan = Scan(user_id=user_id, activity_name="Midnight Snack", activity_category="Food", scanned_at=datetime.utcnow())
+    new_snack_scan = Scan(event_id=event.id, user_id=user_id, activity_id=snack_id, scanned_at=datetime.utcnow())
     db.add(new_snack_scan)
     await db.commit()
     return {"message": "Midnight snack claimed!"}
 
 @router.get("/leaderboard")
-async def leaderboard(db: AsyncSession = Depends(get_db)):
-    query = select(User.id, User.name, func.count(Scan.id).label("scan_count")).join(Scan).group_by(User.id).order_by(func.count(Scan.id).desc()).limit(10)
-    result = await db.execute(query)
-    raw_data = result.fetchall()
+async def leaderboard(since: Optional[UtcDateTime] = None, until: Optional[UtcDateTime] = None, event: EventContext = Depends(current_event), db: AsyncSession = Depends(database.get_read_db)):
+    raw_data = await queries.leaderboard(db, event, since, until)
 
     return [{"user_id": row[0], "name": row[1], "scans": row[2]} for row in raw_data]
 
 @router.get("/popular-activities")
-async def popular_activities(db: AsyncSession = Depends(get_db)):
-    query = select(Scan.activity_name, func.count(Scan.id).label("scan_count")).group_by(Scan.activity_name).order_by(func.count(Scan.id).desc())
-    result = await db.execute(query)
-    raw_data = result.fetchall()
-
-    return [{"activity_name": row[0], "scans": row[1]} for row in raw_data]
+async def popular_activities(since: Optional[UtcDateTime] = None, until: Optional[UtcDateTime] = None, event: EventContext = Depends(current_event), db: AsyncSession = Depends(database.get_read_db)):
+    # Counting per activity_id is an index-only scan of ix_scans_event_activity;
+    # names come from the catalog, merged across categories afterwards.
+    counts = await queries.activity_counts(db, event, since, until)
+    names = await catalog.describe([row[0] for row in counts])
+    by_name = {}
+    for activity_id, n in counts:
+        name = names[activity_id][0]
+        by_name[name] = by_name.get(name, 0) + n
+    return [
+        {"activity_name": name, "scans": n}
+        for name, n in sorted(by_name.items(), key=lambda item: item[1], reverse=True)
+    ]
 
 @router.get("/peak-times")
-async def peak_times(db: AsyncSession = Depends(get_db)):
-    query = select(func.date_trunc('hour', Scan.scanned_at).label("time_slot"), func.count(Scan.id).label("scan_count")).group_by("time_slot").order_by("time_slot")
-    result = await db.execute(query)
-    raw_data = result.fetchall()
+async def peak_times(since: Optional[UtcDateTime] = None, until: Optional[UtcDateTime] = None, event: EventContext = Depends(current_event), db: AsyncSession = Depends(database.get_read_db)):
+    if vectorized.enabled():
+        columns = await vector_analytics.snapshot(event.id)
+        mask = vectorized.window_mask(columns, since or event.starts_at, until or event.ends_at)
+        return {slot.strftime("%I %p - %I %p"): count for slot, count in vectorized.hourly_histogram(columns, mask)}
+    raw_data = await queries.hourly_counts(db, event, since, until)
 
     return {row[0].strftime("%I %p - %I %p"): row[1] for row in raw_data}
 
 @router.get("/users/{user_id}/activity-log")
-async def activity_log(user_id: int, db: AsyncSession = Depends(get_db)):
-    query = select(Scan.activity_name, Scan.scanned_at).filter(Scan.user_id == user_id).order_by(Scan.scanned_at.asc())
+async def activity_log(user_id: int, event: EventContext = Depends(current_event), db: AsyncSession = Depends(get_db)):
+    if vectorized.enabled():
+        sequence = vectorized.user_sequence(await vector_analytics.snapshot(event.id), user_id)
+        names = await catalog.describe({activity_id for activity_id, _ in sequence})
+        return [{"activity": names[activity_id][0], "time": at.strftime("%I:%M %p")} for activity_id, at in sequence]
+
+    query = select(
+        Activity.name,
+        func.to_char(Scan.scanned_at, "HH12:MI AM")
+    ).join(Activity, Activity.id == Scan.activity_id).filter(Scan.event_id == event.id, Scan.user_id == user_id).order_by(Scan.scanned_at.asc(), Scan.id.asc())
     result = await db.execute(query)
     raw_data = result.fetchall()
 
-    return [{"activity": row[0], "time": row[1].strftime("%I:%M %p")} for row in raw_data]
+    return [{"activity": row[0], "time": row[1]} for row in raw_data]
 
 import random
 
 @router.get("/random-winner")
-async def random_winner(db: AsyncSession = Depends(get_db)):
+async def random_winner(since: Optional[UtcDateTime] = None, until: Optional[UtcDateTime] = None, event: EventContext = Depends(current_event), db: AsyncSession = Depends(database.get_read_db)):
     query = select(User.id, User.name, User.badge_code).join(Scan).group_by(User.id).having(func.count(Scan.id) >= 3)
+    query = crud.scoped_scans(query, event, since, until)
     result = await db.execute(query)
     eligible_users = result.fetchall()
 
@@ -244,24 +352,43 @@ async def random_winner(db: AsyncSession = Depends(get_db)):
     return {"winner": winner[1], "badge_code": winner[2]}
 
 
-@router.post("/login", response_model=Token)
+@router.post("/login", response_model=Token, dependencies=[Depends(enforce_login_limits)])
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
-    user = await authenticate_user(db, form_data.username, form_data.password)
+    async with hash_gate:
+        user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
+        await record_login_failure(form_data.username)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     
     access_token = create_access_token({"sub": user.email})
-    return {"access_token": access_token, "token_type": "bearer"}
+    refresh_token = create_refresh_token({"sub": user.email})
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/token/refresh", response_model=Token)
+async def refresh_access_token(body: schemas.RefreshRequest, db: AsyncSession = Depends(get_db)):
+    claims = decode_token(body.refresh_token, "refresh")
+    if claims is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+
+    if await queries.active_user_id_by_email(db, claims["sub"]) is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+
+    return {
+        "access_token": create_access_token({"sub": claims["sub"]}),
+        "token_type": "bearer",
+        "refresh_token": create_refresh_token({"sub": claims["sub"]}),
+    }
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     email = decode_access_token(token)
     if email is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     
-    result = await db.execute(select(User).filter(User.email == email))
-    user = result.scalars().first()
+    user = await queries.user_by_email(db, email)
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    if user.is_active is False:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Account is deactivated")
     
     return user
 
@@ -271,17 +398,173 @@ async def protected_route(user: UserAuth = Depends(get_current_user)):
 
 @router.put("/promote-admin/{user_id}")
 async def promote_admin(user_id: int, current_admin: User = Depends(get_current_admin), db: AsyncSession = Depends(get_db)):
-   
-    result = await db.execute(select(User).filter(User.id == user_id))
-    user = result.scalars().first()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    if user.is_admin:
+    rows = await crud.update_users(db, [User.id == user_id, User.is_admin.isnot(True)], {"is_admin": True})
+    if not rows:
+        # Only the failure path pays for telling the two cases apart.
+        if await db.get(User, user_id) is None:
+            raise HTTPException(status_code=404, detail="User not found")
         raise HTTPException(status_code=400, detail="User is already an admin")
+    return {"message": f"User {rows[0].name} has been promoted to admin."}
+
+
+def bulk_result(rows):
+    return {"affected": len(rows), "ids": [row.id for row in rows]}
+
+
+@router.post("/admin/users/delete", response_model=schemas.BulkResult, summary="Bulk Delete Users")
+async def bulk_delete_users(selector: schemas.UserSelector, admin: User = Depends(get_current_admin), db: AsyncSession = Depends(get_db)):
+    filters = crud.user_filters(selector) + [User.id != admin.id]
+    return bulk_result(await crud.delete_users(db, filters))
+
+
+@router.post("/admin/users/deactivate", response_model=schemas.BulkResult, summary="Bulk Deactivate Users")
+async def bulk_deactivate_users(selector: schemas.UserSelector, admin: User = Depends(get_current_admin), db: AsyncSession = Depends(get_db)):
+    filters = crud.user_filters(selector) + [User.id != admin.id, User.is_active.isnot(False)]
+    return bulk_result(await crud.update_users(db, filters, {"is_active": False}))
+
 
-    user.is_admin = True  
+@router.post("/admin/users/promote", response_model=schemas.BulkResult, summary="Bulk Promote Users to Admin")
+async def bulk_promote_users(selector: schemas.UserSelector, admin: User = Depends(get_current_admin), db: AsyncSession = Depends(get_db)):
+    filters = crud.user_filters(selector) + [User.is_admin.isnot(True)]
+    return bulk_result(await crud.update_users(db, filters, {"is_admin": True}))
+
+
+@router.patch("/admin/users", response_model=schemas.BulkResult, summary="Bulk Update User Fields")
+async def bulk_patch_users(body: schemas.BulkUserPatch, admin: User = Depends(get_current_admin), db: AsyncSession = Depends(get_db)):
+    changes = body.changes.dict(exclude_unset=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="No changes given")
+    filters = crud.user_filters(body.selector)
+    if changes.get("is_active") is False or changes.get("is_admin") is False:
+        # Admins can't lock themselves out through a broad filter.
+        filters.append(User.id != admin.id)
+    return bulk_result(await crud.update_users(db, filters, changes))
+
+
+@router.get("/sync/roster", summary="Delta Roster Sync for Scanner Devices")
+async def sync_roster(
+    request: Request,
+    since: int = Query(0, ge=0, description="Version token from the previous sync; 0 for a full roster"),
+    limit: int = Query(roster.ROSTER_PAGE_SIZE, ge=1, le=50000),
+    db: AsyncSession = Depends(database.get_read_db),
+):
+    upserts, deletes, version, more = await roster.fetch_changes(db, since, limit)
+    return roster.roster_response(upserts, deletes, version, more, request.headers.get("accept"))
+
+
+@router.get("/events", response_model=List[schemas.Event], summary="List Events")
+async def read_events(db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(Event).order_by(Event.id))
+    return result.scalars().all()
+
+
+@router.post("/events", response_model=schemas.Event, summary="Create an Event")
+async def create_event(event: schemas.EventCreate, admin: User = Depends(get_current_admin), db: AsyncSession = Depends(get_db)):
+    db_event = Event(**event.dict())
+    db.add(db_event)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="An event with this slug already exists")
+    await db.refresh(db_event)
+    await event_registry.refresh()
+    return db_event
+
+
+@router.get("/analytics/unique-hackers", summary="Approximate Unique Hackers per Activity")
+async def unique_hackers(activity_category: Optional[str] = None, event: EventContext = Depends(current_event)):
+    activity_ids = await catalog.ids_for(category=activity_category) if activity_category else None
+    counts = analytics.unique_hackers(event.id, activity_ids)
+    names = await catalog.describe(list(counts))
+    return {
+        "unique_hackers": analytics.event(event.id).hackers.count(),
+        "relative_error": round(analytics.event(event.id).hackers.relative_error, 4),
+        "activities": sorted(
+            (
+                {"activity_name": names[i][0], "activity_category": names[i][1], "unique_hackers": count}
+                for i, count in counts.items()
+            ),
+            key=lambda row: row["unique_hackers"],
+            reverse=True,
+        ),
+    }
+
+
+@router.get("/analytics/users/{user_id}/unique-activities", summary="Approximate Unique Activities for a Hacker")
+async def unique_activities(user_id: int, event: EventContext = Depends(current_event)):
+    return {"user_id": user_id, "unique_activities": analytics.unique_activities(event.id, user_id)}
+
+
+@router.get("/analytics/dwell", summary="Dwell Time Percentiles")
+async def dwell_percentiles(
+    activity_name: Optional[str] = None,
+    activity_category: Optional[str] = None,
+    event: EventContext = Depends(current_event),
+):
+    activity_ids = await catalog.ids_for(activity_name, activity_category) if activity_name or activity_category else None
+    sketch = analytics.dwell(event.id, activity_ids)
+    return {
+        "samples": sketch.count,
+        "relative_accuracy": sketch.relative_accuracy,
+        "seconds": {f"p{int(q * 100)}": sketch.quantile(q) for q in (0.5, 0.9, 0.99)},
+    }
+
+
+def occupancy_row(activity_id: int, count: int, name: tuple, level: Optional[str]):
+    capacity = occupancy.capacities.get(activity_id)
+    return {
+        "activity_id": activity_id,
+        "activity_name": name[0],
+        "activity_category": name[1],
+        "occupancy": count,
+        "capacity": capacity,
+        "utilization": round(count / capacity, 3) if capacity else None,
+        "alert": level,
+    }
+
+
+@router.get("/activities/occupancy", summary="People in Each Activity Right Now")
+async def activity_occupancy(activity_category: Optional[str] = None, event: EventContext = Depends(current_event)):
+    state = occupancy.snapshot(event.id)
+    counts = dict(state.counts)
+    if activity_category:
+        wanted = set(await catalog.ids_for(category=activity_category))
+        counts = {i: count for i, count in counts.items() if i in wanted}
+    names = await catalog.describe(list(counts))
+    return {
+        "in_venue": state.in_venue,
+        "window_seconds": occupancy.window,
+        "activities": sorted(
+            (occupancy_row(i, count, names[i], state.alerts.get(i)) for i, count in counts.items()),
+            key=lambda row: row["occupancy"],
+            reverse=True,
+        ),
+    }
+
+
+@router.get("/activities/occupancy/alerts", summary="Activities Near or at Capacity")
+async def occupancy_alerts(event: EventContext = Depends(current_event)):
+    state = occupancy.snapshot(event.id)
+    alerts = dict(state.alerts)
+    names = await catalog.describe(list(alerts))
+    return [occupancy_row(i, state.counts.get(i, 0), names[i], level) for i, level in alerts.items()]
+
+
+@router.put("/activities/{activity_id}/capacity", summary="Set an Activity's Capacity")
+async def set_activity_capacity(activity_id: int, body: schemas.ActivityCapacity, admin: User = Depends(get_current_admin), db: AsyncSession = Depends(get_db)):
+    if body.capacity is not None and body.capacity < 1:
+        raise HTTPException(status_code=400, detail="Capacity must be at least 1")
+    activity = await db.get(Activity, activity_id)
+    if activity is None:
+        raise HTTPException(status_code=404, detail="Activity not found")
+    activity.capacity = body.capacity
     await db.commit()
-    return {"message": f"User {user.name} has been promoted to admin."}
+    # Other workers pick it up on their next occupancy-capacities run.
+    occupancy.set_capacity(activity_id, body.capacity)
+    return {"activity_id": activity_id, "capacity": body.capacity}
+
 
+@router.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    return metrics.snapshot()
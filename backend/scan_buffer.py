@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import insert, text
+from sqlalchemy.exc import IntegrityError
+
+from backend import metrics, schemas
+from backend.activities import catalog
+from backend.database import AsyncSessionMaker
+from backend.models import Scan
+
+logger = logging.getLogger(__name__)
+
+# "direct" keeps the one-commit-per-scan path, "buffered" enables write-behind.
+SCAN_WRITE_MODE = os.getenv("SCAN_WRITE_MODE", "direct")
+# "enqueue" acknowledges as soon as the scan is queued, "commit" waits for
+# the group commit that contains it.
+SCAN_DURABILITY = os.getenv("SCAN_DURABILITY", "commit")
+SCAN_QUEUE_SIZE = int(os.getenv("SCAN_QUEUE_SIZE", "10000"))
+SCAN_FLUSH_INTERVAL_MS = float(os.getenv("SCAN_FLUSH_INTERVAL_MS", "5"))
+SCAN_FLUSH_MAX_ROWS = int(os.getenv("SCAN_FLUSH_MAX_ROWS", "500"))
+SCAN_ID_BLOCK = int(os.getenv("SCAN_ID_BLOCK", "1000"))
+
+
+@dataclass
+class PendingScan:
+    id: int
+    event_id: int
+    user_id: int
+    activity_id: int
+    activity_name: str
+    activity_category: str
+    scanned_at: datetime
+    future: Optional[asyncio.Future] = None
+
+    def as_row(self):
+        return {
+            "id": self.id,
+            "event_id": self.event_id,
+            "user_id": self.user_id,
+            "activity_id": self.activity_id,
+            "scanned_at": self.scanned_at,
+        }
+
+    def as_schema(self):
+        return schemas.Scan(
+            id=self.id,
+            user_id=self.user_id,
+            activity_name=self.activity_name,
+            activity_category=self.activity_category,
+            scanned_at=self.scanned_at,
+        )
+
+
+class ScanBuffer:
+    def __init__(self, maxsize: int = SCAN_QUEUE_SIZE, durability: str = SCAN_DURABILITY):
+        self.maxsize = maxsize
+        self.durability = durability
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._ids: List[int] = []
+        self._id_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.stats = {
+            "enqueued": 0,
+            "flushed_rows": 0,
+            "flushes": 0,
+            "rejected_full": 0,
+            "failed_rows": 0,
+            "last_batch_size": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+        }
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def metrics(self):
+        return {
+            **self.stats,
+            "mode": SCAN_WRITE_MODE,
+            "durability": self.durability,
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.maxsize,
+        }
+
+    async def start(self):
+        self._closing = False
+        self._task = asyncio.create_task(self._run(), name="scan-buffer-flusher")
+
+    async def stop(self):
+        # Stop accepting new scans and let the flusher drain what is queued.
+        self._closing = True
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _next_id(self) -> int:
+        async with self._id_lock:
+            if not self._ids:
+                async with AsyncSessionMaker() as db:
+                    result = await db.execute(
+                        text("SELECT nextval('scans_id_seq') FROM generate_series(1, :n)"),
+                        {"n": SCAN_ID_BLOCK},
+                    )
+                    self._ids = [row[0] for row in result.fetchall()]
+                    self._ids.reverse()
+            return self._ids.pop()
+
+    async def submit(self, user_id: int, scan: schemas.ScanCreate, event_id: int) -> schemas.Scan:
+        if self._closing or not self.running:
+            raise HTTPException(status_code=503, detail="Scan buffer is shutting down")
+        if self.queue.full():
+            self.stats["rejected_full"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Scan queue is full, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+
+        pending = PendingScan(
+            id=await self._next_id(),
+            event_id=event_id,
+            user_id=user_id,
+            activity_id=await catalog.resolve(scan.activity_name, scan.activity_category),
+            activity_name=scan.activity_name,
+            activity_category=scan.activity_category,
+            scanned_at=datetime.utcnow(),
+        )
+        if self.durability == "commit":
+            pending.future = asyncio.get_running_loop().create_future()
+
+        # stop() may have begun while the id or activity was being looked up;
+        # with no await from here to the put, a scan that gets in is drained.
+        if self._closing or not self.running:
+            raise HTTPException(status_code=503, detail="Scan buffer is shutting down")
+        try:
+            self.queue.put_nowait(pending)
+        except asyncio.QueueFull:
+            self.stats["rejected_full"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Scan queue is full, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.stats["enqueued"] += 1
+
+        if pending.future is not None:
+            await pending.future
+        return pending.as_schema()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        interval = SCAN_FLUSH_INTERVAL_MS / 1000
+        while True:
+            try:
+                first = await asyncio.wait_for(self.queue.get(), interval)
+            except asyncio.TimeoutError:
+                if self._closing:
+                    return
+                continue
+
+            batch = [first]
+            deadline = loop.time() + interval
+            while len(batch) < SCAN_FLUSH_MAX_ROWS:
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0 or self._closing:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                # The flusher must outlive any one batch, or every waiter
+                # after it hangs and the queue fills up.
+                logger.exception("Scan flush failed")
+                for pending in batch:
+                    self._resolve(pending, HTTPException(status_code=500, detail=str(e)))
+
+    async def _flush(self, batch: List[PendingScan]):
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionMaker() as db:
+                await db.execute(insert(Scan), [pending.as_row() for pending in batch])
+                await db.commit()
+            for pending in batch:
+                self._resolve(pending)
+            flushed = len(batch)
+        except IntegrityError:
+            # One bad row (e.g. unknown user) must not sink the whole batch.
+            flushed = 0
+            for pending in batch:
+                if await self._flush_one(pending):
+                    flushed += 1
+        except Exception as e:
+            logger.exception("Scan group commit failed")
+            for pending in batch:
+                self._resolve(pending, HTTPException(status_code=500, detail=str(e)))
+            self.stats["failed_rows"] += len(batch)
+            flushed = 0
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats["flushes"] += 1
+        self.stats["flushed_rows"] += flushed
+        self.stats["last_batch_size"] = len(batch)
+        self.stats["last_flush_ms"] = round(elapsed_ms, 3)
+        self.stats["max_flush_ms"] = max(self.stats["max_flush_ms"], round(elapsed_ms, 3))
+
+    async def _flush_one(self, pending: PendingScan) -> bool:
+        try:
+            async with AsyncSessionMaker() as db:
+                await db.execute(insert(Scan), [pending.as_row()])
+                await db.commit()
+        except IntegrityError:
+            self.stats["failed_rows"] += 1
+            self._resolve(pending, HTTPException(status_code=400, detail="Scan rejected: unknown user"))
+            return False
+        except Exception as e:
+            logger.exception("Scan insert failed")
+            self.stats["failed_rows"] += 1
+            self._resolve(pending, HTTPException(status_code=500, detail=str(e)))
+            return False
+        self._resolve(pending)
+        return True
+
+    def _resolve(self, pending: PendingScan, error: Optional[Exception] = None):
+        if pending.future is None or pending.future.done():
+            return
+        if error is None:
+            pending.future.set_result(None)
+        else:
+            pending.future.set_exception(error)
+
+
+scan_buffer = ScanBuffer()
+metrics.register("scan_buffer", scan_buffer.metrics)
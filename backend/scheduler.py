@@ -0,0 +1,212 @@
+import asyncio
+import inspect
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import asyncpg
+
+from backend import metrics
+from backend.database import ASYNCPG_DSN
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+# Arbitrary key for the session-level advisory lock that elects the leader.
+SCHEDULER_LOCK_KEY = int(os.getenv("SCHEDULER_LOCK_KEY", "4607002"))
+SCHEDULER_THREADS = int(os.getenv("SCHEDULER_THREADS", "2"))
+LEADER_RETRY_SECONDS = 15.0
+
+
+class Cron:
+    # Standard five fields (minute hour day month weekday) in UTC, with
+    # "*", "a-b", "a,b" and "/step". Sunday is 0.
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse(value, low, high) for value, (low, high) in zip(fields, self.RANGES)
+        )
+
+    @staticmethod
+    def _parse(value: str, low: int, high: int) -> Set[int]:
+        allowed = set()
+        for part in value.split(","):
+            step = 1
+            if "/" in part:
+                part, step_text = part.split("/")
+                step = int(step_text)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(bound) for bound in part.split("-"))
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or step < 1:
+                raise ValueError(f"Cron field out of range: {value!r}")
+            allowed.update(range(start, end + 1, step))
+        return allowed
+
+    def next_after(self, moment: datetime) -> datetime:
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366)
+        while candidate < limit:
+            if (
+                candidate.month not in self.months
+                or candidate.day not in self.days
+                or candidate.isoweekday() % 7 not in self.weekdays
+            ):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression never fires: {self.expression!r}")
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[], Any]
+    every: Optional[float] = None
+    cron: Optional[Cron] = None
+    jitter: float = 0.0
+    # Run in the scheduler's thread pool; for blocking or CPU-bound work.
+    thread: bool = False
+    # Only the elected leader runs it; per-worker cache work sets this False.
+    leader_only: bool = True
+    run_at_start: bool = False
+    stats: Dict[str, Any] = field(default_factory=lambda: {
+        "runs": 0, "failures": 0, "skipped": 0,
+        "last_ms": 0.0, "max_ms": 0.0, "total_ms": 0.0,
+        "last_started_at": None, "last_error": None,
+    })
+
+    def delay(self) -> float:
+        if self.cron is not None:
+            now = datetime.utcnow()
+            base = (self.cron.next_after(now) - now).total_seconds()
+        else:
+            base = self.every
+        return base + random.uniform(0, self.jitter)
+
+
+class Scheduler:
+    # Runs maintenance jobs on the event loop. With several workers, each
+    # worker schedules every job but only the one holding the advisory lock
+    # runs leader_only jobs, so database-wide work happens once.
+    def __init__(self, dsn: str = ASYNCPG_DSN):
+        self.dsn = dsn
+        self.jobs: Dict[str, Job] = {}
+        self.is_leader = False
+        self._connection: Optional[asyncpg.Connection] = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def metrics(self):
+        return {
+            "leader": self.is_leader,
+            "jobs": {name: dict(job.stats) for name, job in self.jobs.items()},
+        }
+
+    def add(self, name: str, func: Callable[[], Any], every: Optional[float] = None, cron: Optional[str] = None,
+            jitter: float = 0.0, thread: bool = False, leader_only: bool = True, run_at_start: bool = False):
+        if (every is None) == (cron is None):
+            raise ValueError("A job needs exactly one of every= or cron=")
+        self.jobs[name] = Job(
+            name, func, every, Cron(cron) if cron else None, jitter, thread, leader_only, run_at_start
+        )
+
+    async def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=SCHEDULER_THREADS, thread_name_prefix="scheduler")
+        self._tasks.append(asyncio.create_task(self._elect_forever(), name="scheduler-election"))
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(self._run_forever(job), name=f"job-{job.name}"))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._release()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _release(self):
+        self.is_leader = False
+        if self._connection is not None:
+            # Closing the session releases the advisory lock with it.
+            await self._connection.close()
+            self._connection = None
+
+    async def _elect_forever(self):
+        while True:
+            try:
+                if self._connection is None or self._connection.is_closed():
+                    self._connection = await asyncpg.connect(self.dsn)
+                if self.is_leader:
+                    await self._connection.fetchval("SELECT 1")
+                else:
+                    self.is_leader = await self._connection.fetchval(
+                        "SELECT pg_try_advisory_lock($1)", SCHEDULER_LOCK_KEY
+                    )
+                    if self.is_leader:
+                        logger.info("This worker is now the scheduler leader")
+            except (OSError, asyncpg.PostgresError):
+                if self.is_leader:
+                    logger.warning("Lost scheduler leadership with the database connection")
+                try:
+                    await self._release()
+                except (OSError, asyncpg.PostgresError):
+                    self._connection = None
+            await asyncio.sleep(LEADER_RETRY_SECONDS)
+
+    async def _run_forever(self, job: Job):
+        if not job.run_at_start:
+            await asyncio.sleep(job.delay())
+        while True:
+            if job.leader_only and not self.is_leader:
+                job.stats["skipped"] += 1
+            else:
+                await self.run(job)
+            await asyncio.sleep(job.delay())
+
+    async def run(self, job: Job):
+        started = time.perf_counter()
+        job.stats["last_started_at"] = datetime.utcnow().isoformat()
+        try:
+            if job.thread:
+                result = await asyncio.get_running_loop().run_in_executor(self._executor, job.func)
+            else:
+                result = job.func()
+            if inspect.isawaitable(result):
+                await result
+            job.stats["last_error"] = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.stats["failures"] += 1
+            job.stats["last_error"] = repr(e)
+            logger.exception("Scheduled job %s failed", job.name)
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+        job.stats["runs"] += 1
+        job.stats["last_ms"] = elapsed_ms
+        job.stats["total_ms"] = round(job.stats["total_ms"] + elapsed_ms, 3)
+        job.stats["max_ms"] = max(job.stats["max_ms"], elapsed_ms)
+
+
+scheduler = Scheduler()
+metrics.register("scheduler", scheduler.metrics)
@@ -1,6 +1,16 @@
-from pydantic import BaseModel, EmailStr
-from datetime import datetime
-from typing import List, Optional
+from pydantic import AfterValidator, BaseModel, EmailStr
+from datetime import datetime, timezone
+from typing import Annotated, Any, Dict, List, Optional
+
+
+def naive_utc(value: datetime) -> datetime:
+    # Columns are naive UTC; an offset from the client is converted, not kept.
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+UtcDateTime = Annotated[datetime, AfterValidator(naive_utc)]
 
 
 class ScanBase(BaseModel):
@@ -21,6 +31,11 @@ class Scan(ScanBase):
         from_attributes = True   
 
 
+class ScanHistoryPage(BaseModel):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+
 class UserBase(BaseModel):
     name: str
     email: EmailStr  
@@ -34,6 +49,45 @@ class UserUpdate(BaseModel):
     name: Optional[str] = None
     phone: Optional[str] = None
 
+class UserSearchResult(BaseModel):
+    id: int
+    name: str
+    email: str
+    badge_code: str
+    score: float
+
+class Suggestion(BaseModel):
+    user_id: int
+    name: str
+    shared_activities: int
+
+class UserSelector(BaseModel):
+    ids: Optional[List[int]] = None
+    emails: Optional[List[str]] = None
+    email_domain: Optional[str] = None
+    is_active: Optional[bool] = None
+    is_admin: Optional[bool] = None
+    event_id: Optional[int] = None
+    without_scans: bool = False
+
+class UserPatch(BaseModel):
+    name: Optional[str] = None
+    phone: Optional[str] = None
+    is_active: Optional[bool] = None
+    is_admin: Optional[bool] = None
+
+class BulkUserPatch(BaseModel):
+    selector: UserSelector
+    changes: UserPatch
+
+class ActivityCapacity(BaseModel):
+    # None removes the limit.
+    capacity: Optional[int] = None
+
+class BulkResult(BaseModel):
+    affected: int
+    ids: List[int]
+
 class UserResponse(BaseModel):
     id: int
     name: str
@@ -55,6 +109,27 @@ class User(UserBase):
     class Config:
         from_attributes = True  
 
+class EventCreate(BaseModel):
+    slug: str
+    name: str
+    starts_at: Optional[UtcDateTime] = None
+    ends_at: Optional[UtcDateTime] = None
+
+class Event(EventCreate):
+    id: int
+
+    class Config:
+        from_attributes = True
+
+class BadgeState(BaseModel):
+    user_id: int
+    badge_code: str
+    checked_in_at: Optional[datetime] = None
+
+class BadgeScan(BaseModel):
+    scan: Scan
+    checked_in_at: Optional[datetime] = None
+
 class ConnectionBase(BaseModel):
     user_id1: int
     user_id2: int
@@ -91,6 +166,10 @@ class RandomWinner(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     email: Optional[str] = None
@@ -0,0 +1,324 @@
+import base64
+import hashlib
+import json
+import math
+import os
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.future import select
+
+from backend import changefeed, metrics
+from backend.database import AsyncSessionMaker
+from backend.models import AnalyticsSketch, Scan
+
+SKETCH_PERSIST_SECONDS = float(os.getenv("SKETCH_PERSIST_SECONDS", "60"))
+# Gaps longer than this mean the hacker left, not that they dwelled.
+DWELL_MAX_GAP_SECONDS = float(os.getenv("DWELL_MAX_GAP_SECONDS", str(4 * 3600)))
+DWELL_RELATIVE_ACCURACY = 0.01
+# Scan ids are drawn before commit (in blocks, by the scan buffer), so a scan
+# can commit after a persist that already covers higher ids. On restart, scans
+# stamped this close to the last persist are replayed whatever their id.
+SKETCH_REPLAY_MARGIN_SECONDS = float(os.getenv("SKETCH_REPLAY_MARGIN_SECONDS", "600"))
+REPLAY_CHUNK = 10000
+EPOCH = datetime(1970, 1, 1)
+
+
+def _hash64(value) -> int:
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    # Distinct counter in 2**precision one-byte registers. Relative error is
+    # about 1.04 / sqrt(2**precision): 1.6% at 12, 6.5% at 8.
+    def __init__(self, precision: int = 12, registers: Optional[bytearray] = None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else bytearray(self.m)
+        self._estimate: Optional[int] = None
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, value):
+        x = _hash64(value)
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            self._estimate = None
+
+    def merge(self, other: "HyperLogLog"):
+        for i, rank in enumerate(other.registers):
+            if rank > self.registers[i]:
+                self.registers[i] = rank
+        self._estimate = None
+
+    def count(self) -> int:
+        if self._estimate is None:
+            alpha = 0.7213 / (1 + 1.079 / self.m)
+            estimate = alpha * self.m * self.m / sum(2.0 ** -rank for rank in self.registers)
+            zeros = self.registers.count(0)
+            if estimate <= 2.5 * self.m and zeros:
+                # Linear counting is far more accurate for small cardinalities.
+                estimate = self.m * math.log(self.m / zeros)
+            self._estimate = int(round(estimate))
+        return self._estimate
+
+    def to_dict(self):
+        return {"p": self.precision, "r": base64.b64encode(bytes(self.registers)).decode()}
+
+    @classmethod
+    def from_dict(cls, data) -> "HyperLogLog":
+        return cls(data["p"], bytearray(base64.b64decode(data["r"])))
+
+
+class DDSketch:
+    # Quantile sketch with a relative-error guarantee: every quantile is
+    # within relative_accuracy of the true value, in log-spaced buckets.
+    def __init__(self, relative_accuracy: float = DWELL_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = defaultdict(int)
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float):
+        if value <= 0:
+            self.zero_count += 1
+        else:
+            self.bins[math.ceil(math.log(value) / self._log_gamma)] += 1
+        self.count += 1
+
+    def merge(self, other: "DDSketch"):
+        for key, count in other.bins.items():
+            self.bins[key] += count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        running = self.zero_count
+        if rank < running:
+            return 0.0
+        for key in sorted(self.bins):
+            running += self.bins[key]
+            if running > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {"a": self.relative_accuracy, "z": self.zero_count, "b": {str(k): v for k, v in self.bins.items()}}
+
+    @classmethod
+    def from_dict(cls, data) -> "DDSketch":
+        sketch = cls(data["a"])
+        sketch.zero_count = data["z"]
+        for key, count in data["b"].items():
+            sketch.bins[int(key)] = count
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
+
+
+class EventSketches:
+    def __init__(self):
+        self.hackers = HyperLogLog(12)
+        self.hackers_by_activity: Dict[int, HyperLogLog] = {}
+        self.activities_by_hacker: Dict[int, HyperLogLog] = {}
+        self.dwell = DDSketch()
+        self.dwell_by_activity: Dict[int, DDSketch] = {}
+        # user_id -> (seconds since epoch, activity_id) of their latest scan.
+        self.last_scan: Dict[int, Tuple[float, int]] = {}
+
+    def observe(self, user_id: int, activity_id: int, at: float):
+        self.hackers.add(user_id)
+        self.hackers_by_activity.setdefault(activity_id, HyperLogLog(12)).add(user_id)
+        self.activities_by_hacker.setdefault(user_id, HyperLogLog(8)).add(activity_id)
+
+        # Dwell at an activity is the gap until the hacker's next scan.
+        # Replayed or out-of-order scans don't move last_scan forward, which
+        # keeps replays from double counting gaps.
+        previous = self.last_scan.get(user_id)
+        if previous is not None and at <= previous[0]:
+            return
+        if previous is not None:
+            gap = at - previous[0]
+            if gap <= DWELL_MAX_GAP_SECONDS:
+                self.dwell.add(gap)
+                self.dwell_by_activity.setdefault(previous[1], DDSketch()).add(gap)
+        self.last_scan[user_id] = (at, activity_id)
+
+    def to_dict(self):
+        return {
+            "hackers": self.hackers.to_dict(),
+            "by_activity": {str(k): v.to_dict() for k, v in self.hackers_by_activity.items()},
+            "by_hacker": {str(k): v.to_dict() for k, v in self.activities_by_hacker.items()},
+            "dwell": self.dwell.to_dict(),
+            "dwell_by_activity": {str(k): v.to_dict() for k, v in self.dwell_by_activity.items()},
+            "last_scan": {str(k): list(v) for k, v in self.last_scan.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data) -> "EventSketches":
+        sketches = cls()
+        sketches.hackers = HyperLogLog.from_dict(data["hackers"])
+        sketches.hackers_by_activity = {int(k): HyperLogLog.from_dict(v) for k, v in data["by_activity"].items()}
+        sketches.activities_by_hacker = {int(k): HyperLogLog.from_dict(v) for k, v in data["by_hacker"].items()}
+        sketches.dwell = DDSketch.from_dict(data["dwell"])
+        sketches.dwell_by_activity = {int(k): DDSketch.from_dict(v) for k, v in data["dwell_by_activity"].items()}
+        sketches.last_scan = {int(k): (v[0], v[1]) for k, v in data["last_scan"].items()}
+        return sketches
+
+
+def _seconds(value) -> float:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return (value.replace(tzinfo=None) - EPOCH).total_seconds()
+
+
+class SketchAnalytics:
+    # Sketches are kept per event and updated from the change feed. The
+    # scheduler persists them every SKETCH_PERSIST_SECONDS along with the
+    # highest scan id they include, so a restart only replays newer scans and
+    # the ones scanned around the persist.
+    def __init__(self):
+        self._events: Dict[int, EventSketches] = defaultdict(EventSketches)
+        self._dirty = False
+        self.watermark = 0
+        self.persisted_at: Optional[datetime] = None
+        self.stats = {"observed": 0, "replayed": 0, "persists": 0, "last_persist_ms": 0.0}
+
+    def metrics(self):
+        return {**self.stats, "events": len(self._events), "watermark": self.watermark}
+
+    def event(self, event_id: int) -> EventSketches:
+        return self._events[event_id]
+
+    def observe(self, scan_id: int, event_id: int, user_id: int, activity_id: int, scanned_at):
+        self._events[event_id].observe(user_id, activity_id, _seconds(scanned_at))
+        self.watermark = max(self.watermark, scan_id)
+        self._dirty = True
+        self.stats["observed"] += 1
+
+    def on_scans(self, events: List[changefeed.ChangeEvent]):
+        # Deletes are ignored: sketches can't forget, and a deleted scan
+        # still happened as far as attendance goes.
+        for change in events:
+            if change.op == "insert" and change.row:
+                row = change.row
+                self.observe(row["id"], row["event_id"], row["user_id"], row["activity_id"], row["scanned_at"])
+
+    async def load(self):
+        async with AsyncSessionMaker() as db:
+            result = await db.execute(select(AnalyticsSketch))
+            for stored in result.scalars().all():
+                data = json.loads(zlib.decompress(stored.data))
+                self._events[stored.event_id] = EventSketches.from_dict(data)
+                self.watermark = max(self.watermark, stored.last_scan_id)
+                if self.persisted_at is None or stored.updated_at < self.persisted_at:
+                    self.persisted_at = stored.updated_at
+
+    async def replay(self):
+        watermark = self.watermark
+        async with AsyncSessionMaker() as db:
+            if self.persisted_at is not None:
+                # Only the recent partitions are read. Replaying a scan the
+                # sketches already include changes nothing.
+                result = await db.execute(
+                    select(Scan.id, Scan.event_id, Scan.user_id, Scan.activity_id, Scan.scanned_at)
+                    .filter(Scan.scanned_at >= self.persisted_at - timedelta(seconds=SKETCH_REPLAY_MARGIN_SECONDS))
+                    .filter(Scan.id <= watermark)
+                    .order_by(Scan.scanned_at)
+                )
+                rows = result.fetchall()
+                for row in rows:
+                    self.observe(*row)
+                self.stats["replayed"] += len(rows)
+            while True:
+                result = await db.execute(
+                    select(Scan.id, Scan.event_id, Scan.user_id, Scan.activity_id, Scan.scanned_at)
+                    .filter(Scan.id > self.watermark)
+                    .order_by(Scan.id)
+                    .limit(REPLAY_CHUNK)
+                )
+                rows = result.fetchall()
+                for row in rows:
+                    self.observe(*row)
+                self.stats["replayed"] += len(rows)
+                if len(rows) < REPLAY_CHUNK:
+                    return
+
+    async def persist(self):
+        if not self._dirty:
+            return
+        started = time.perf_counter()
+        self._dirty = False
+        now = datetime.utcnow()
+        rows = [
+            {
+                "event_id": event_id,
+                "data": zlib.compress(json.dumps(sketches.to_dict(), separators=(",", ":")).encode()),
+                "last_scan_id": self.watermark,
+                "updated_at": now,
+            }
+            for event_id, sketches in list(self._events.items())
+        ]
+        async with AsyncSessionMaker() as db:
+            statement = insert(AnalyticsSketch).values(rows)
+            await db.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["event_id"],
+                    set_={
+                        "data": statement.excluded.data,
+                        "last_scan_id": statement.excluded.last_scan_id,
+                        "updated_at": statement.excluded.updated_at,
+                    },
+                )
+            )
+            await db.commit()
+        self.persisted_at = now
+        self.stats["persists"] += 1
+        self.stats["last_persist_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    async def start(self):
+        await self.load()
+        # The change feed is already listening and holds back what arrives
+        # during the replay; sketches tolerate seeing the same scan twice.
+        changefeed.subscribe("scans", self.on_scans)
+        await self.replay()
+
+    async def stop(self):
+        changefeed.unsubscribe("scans", self.on_scans)
+        await self.persist()
+
+    def unique_hackers(self, event_id: int, activity_ids: Optional[Iterable[int]] = None) -> Dict[int, int]:
+        sketches = self._events[event_id].hackers_by_activity
+        ids = sketches.keys() if activity_ids is None else [i for i in activity_ids if i in sketches]
+        return {i: sketches[i].count() for i in ids}
+
+    def unique_activities(self, event_id: int, user_id: int) -> int:
+        sketch = self._events[event_id].activities_by_hacker.get(user_id)
+        return sketch.count() if sketch else 0
+
+    def dwell(self, event_id: int, activity_ids: Optional[Iterable[int]] = None) -> DDSketch:
+        sketches = self._events[event_id]
+        if activity_ids is None:
+            return sketches.dwell
+        merged = DDSketch()
+        for activity_id in activity_ids:
+            if activity_id in sketches.dwell_by_activity:
+                merged.merge(sketches.dwell_by_activity[activity_id])
+        return merged
+
+
+analytics = SketchAnalytics()
+metrics.register("sketches", analytics.metrics)
@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+import asyncpg
+
+from backend import partitions
+from backend.database import ASYNCPG_DSN
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is always available
+    zstandard = None
+
+# Everything a rehearsal needs to be coherent: scans and connections point at
+# events, activities and users, so those travel with them. Load order follows
+# the foreign keys even though triggers are off during the restore.
+SNAPSHOT_TABLES = ("events", "activities", "users", "user_tombstones", "event_registrations", "scans", "connections")
+# Sequences that no column owns, with the columns that draw from them.
+EXTRA_SEQUENCES = {"users_change_seq": (("users", "change_seq"), ("user_tombstones", "change_seq"))}
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+SNAPSHOT_MAINTENANCE_WORK_MEM = os.getenv("SNAPSHOT_MAINTENANCE_WORK_MEM", "512MB")
+SUFFIXES = {"none": ".copy", "gzip": ".copy.gz", "zstd": ".copy.zst"}
+
+
+def open_copy_file(path: str, mode: str, compression: str):
+    if compression == "gzip":
+        # Level 1: the dump is bound by the network and disk, not by size.
+        return gzip.open(path, mode, compresslevel=1) if "w" in mode else gzip.open(path, mode)
+    if compression == "zstd":
+        if zstandard is None:
+            raise SystemExit("❌ zstd snapshots need `pip install zstandard`")
+        return zstandard.open(path, mode)
+    return open(path, mode)
+
+
+async def table_columns(conn: asyncpg.Connection, table: str) -> List[str]:
+    rows = await conn.fetch(
+        "SELECT attname FROM pg_attribute "
+        "WHERE attrelid = $1::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = '' "
+        "ORDER BY attnum",
+        table,
+    )
+    return [row["attname"] for row in rows]
+
+
+async def schema_revision(conn: asyncpg.Connection) -> Optional[str]:
+    return await conn.fetchval("SELECT version_num FROM alembic_version LIMIT 1")
+
+
+async def dump(directory: str, compression: str = "none", dsn: str = ASYNCPG_DSN) -> Dict:
+    os.makedirs(directory, exist_ok=True)
+    conn = await asyncpg.connect(dsn)
+    started = time.perf_counter()
+    manifest = {"format": FORMAT_VERSION, "created_at": datetime.utcnow().isoformat(), "compression": compression, "tables": {}}
+    try:
+        # One repeatable-read transaction, so every table comes from the same
+        # moment even while scanners keep writing.
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            manifest["revision"] = await schema_revision(conn)
+            for table in SNAPSHOT_TABLES:
+                columns = await table_columns(conn, table)
+                path = os.path.join(directory, table + SUFFIXES[compression])
+                column_list = ", ".join(f'"{c}"' for c in columns)
+                with open_copy_file(path, "wb", compression) as output:
+                    # COPY TO doesn't read through a partitioned parent, a
+                    # query does.
+                    status = await conn.copy_from_query(f"SELECT {column_list} FROM {table}", output=output, format="binary")
+                manifest["tables"][table] = {
+                    "file": os.path.basename(path),
+                    "columns": columns,
+                    "rows": int(status.split()[-1]),
+                }
+            days = await conn.fetchrow("SELECT min(scanned_at)::date AS first, max(scanned_at)::date AS last FROM scans")
+            manifest["scan_days"] = [days["first"].isoformat(), days["last"].isoformat()] if days["first"] else None
+    finally:
+        await conn.close()
+    manifest["seconds"] = round(time.perf_counter() - started, 3)
+    with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+async def secondary_indexes(conn: asyncpg.Connection, table: str) -> List[asyncpg.Record]:
+    # Primary keys and unique constraints stay: they keep the load honest.
+    # For a partitioned table these are the parent indexes, and dropping one
+    # takes its partitions' indexes with it.
+    return await conn.fetch(
+        "SELECT i.indexrelid::regclass::text AS name, pg_get_indexdef(i.indexrelid) AS definition "
+        "FROM pg_index i "
+        "WHERE i.indrelid = $1::regclass "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)",
+        table,
+    )
+
+
+async def reset_sequences(conn: asyncpg.Connection, tables) -> List[str]:
+    fixed = []
+    for table in tables:
+        for column in await table_columns(conn, table):
+            sequence = await conn.fetchval("SELECT pg_get_serial_sequence($1, $2)", table, column)
+            if sequence:
+                await conn.execute(
+                    f"SELECT setval('{sequence}', COALESCE((SELECT max(\"{column}\") FROM {table}), 0) + 1, false)"
+                )
+                fixed.append(sequence)
+    for sequence, sources in EXTRA_SEQUENCES.items():
+        highest = ", ".join(f"(SELECT max({column}) FROM {table})" for table, column in sources)
+        await conn.execute(f"SELECT setval('{sequence}', COALESCE(GREATEST({highest}), 0) + 1, false)")
+        fixed.append(sequence)
+    return fixed
+
+
+async def restore(directory: str, dsn: str = ASYNCPG_DSN, force: bool = False) -> Dict:
+    with open(os.path.join(directory, MANIFEST), encoding="utf-8") as file:
+        manifest = json.load(file)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise SystemExit(f"❌ Unsupported snapshot format {manifest.get('format')}")
+    tables = manifest["tables"]
+
+    if manifest.get("scan_days"):
+        # Restored scans should land in their day partitions, not the default.
+        first, last = (date.fromisoformat(day) for day in manifest["scan_days"])
+        await partitions.ensure_partitions(days_ahead=(last - first).days, start=first)
+
+    conn = await asyncpg.connect(dsn)
+    timings = {}
+    try:
+        revision = await schema_revision(conn)
+        if revision != manifest.get("revision") and not force:
+            raise SystemExit(
+                f"❌ Snapshot is from schema {manifest.get('revision')}, database is at {revision}. "
+                "Run the migrations to match or pass --force."
+            )
+        async with conn.transaction():
+            # Replica mode skips FK checks and every ordinary trigger (change
+            # feed NOTIFYs, the roster sequence bump) for this transaction.
+            # It needs superuser or the session_replication_role privilege.
+            await conn.execute("SET LOCAL session_replication_role = replica")
+            await conn.execute(f"SET LOCAL maintenance_work_mem = '{SNAPSHOT_MAINTENANCE_WORK_MEM}'")
+
+            started = time.perf_counter()
+            # CASCADE also clears analytics_sketches and anything else keyed
+            # to these tables; it is derived state and gets rebuilt.
+            await conn.execute(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE")
+            indexes = []
+            for table in tables:
+                for index in await secondary_indexes(conn, table):
+                    indexes.append(index)
+                    await conn.execute(f"DROP INDEX {index['name']}")
+            timings["truncate_and_drop"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for table, info in tables.items():
+                path = os.path.join(directory, info["file"])
+                with open_copy_file(path, "rb", manifest["compression"]) as source:
+                    await conn.copy_to_table(table, source=source, columns=info["columns"], format="binary")
+            timings["copy"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for index in indexes:
+                await conn.execute(index["definition"])
+            timings["indexes"] = time.perf_counter() - started
+
+            sequences = await reset_sequences(conn, tables)
+
+        started = time.perf_counter()
+        for table in tables:
+            await conn.execute(f"ANALYZE {table}")
+        timings["analyze"] = time.perf_counter() - started
+    finally:
+        await conn.close()
+    return {
+        "rows": {table: info["rows"] for table, info in tables.items()},
+        "indexes": len(indexes),
+        "sequences": sequences,
+        "seconds": {step: round(seconds, 3) for step, seconds in timings.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot and restore event data with binary COPY")
+    commands = parser.add_subparsers(dest="command", required=True)
+    save = commands.add_parser("dump", help="Write users, scans, connections and their parents to a directory")
+    save.add_argument("directory")
+    save.add_argument("--compress", choices=sorted(SUFFIXES), default="none")
+    load = commands.add_parser("restore", help="Replace those tables with a snapshot (stop the API first)")
+    load.add_argument("directory")
+    load.add_argument("--force", action="store_true", help="Restore even if the schema revision differs")
+    args = parser.parse_args()
+
+    if args.command == "dump":
+        manifest = asyncio.run(dump(args.directory, args.compress))
+        print(f"✅ Snapshot written to {args.directory} in {manifest['seconds']}s")
+        for table, info in manifest["tables"].items():
+            print(f"   {table:<20} {info['rows']:>10} rows")
+    else:
+        result = asyncio.run(restore(args.directory, force=args.force))
+        print(f"✅ Restored {sum(result['rows'].values())} rows, rebuilt {result['indexes']} indexes")
+        for step, seconds in result["seconds"].items():
+            print(f"   {step:<20} {seconds:>9.3f}s")
+        print("   Restart the API so in-memory caches reload; scanners should resync from since=0.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.future import select
+
+from backend import changefeed, metrics
+from backend.database import AsyncSessionMaker
+from backend.models import Scan
+
+try:
+    import numpy as np
+except ImportError:  # optional; the SQL path is used without it
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# "sql" runs aggregates in Postgres, "vector" runs them over in-memory
+# NumPy columns. "vector" silently falls back to "sql" without NumPy.
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "sql")
+VECTOR_REFRESH_SECONDS = float(os.getenv("VECTOR_REFRESH_SECONDS", "2"))
+LOAD_CHUNK = 50000
+EPOCH = datetime(1970, 1, 1)
+MICROS_PER_HOUR = 3600 * 1_000_000
+
+
+def enabled() -> bool:
+    return ANALYTICS_ENGINE == "vector" and np is not None
+
+
+def to_micros(value: datetime) -> int:
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+class ScanColumns:
+    # One event's scans as parallel arrays. Timestamps are int64 microseconds
+    # since the epoch and activities are their integer catalog ids, so every
+    # aggregate is an array operation instead of a loop over row objects.
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.activity_ids = np.empty(0, dtype=np.int32)
+        self.scanned_at = np.empty(0, dtype=np.int64)
+        self.watermark = 0
+        self.refreshed_at = 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, ids, user_ids, activity_ids, scanned_at):
+        if len(ids) == 0:
+            return
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        self.user_ids = np.concatenate([self.user_ids, np.asarray(user_ids, dtype=np.int64)])
+        self.activity_ids = np.concatenate([self.activity_ids, np.asarray(activity_ids, dtype=np.int32)])
+        self.scanned_at = np.concatenate([self.scanned_at, np.asarray(scanned_at, dtype=np.int64)])
+        self.watermark = max(self.watermark, int(self.ids.max()))
+
+    def append_rows(self, rows: List[Tuple[int, int, int, datetime]]):
+        if rows:
+            ids, user_ids, activity_ids, scanned_at = zip(*rows)
+            self.append(ids, user_ids, activity_ids, [to_micros(at) for at in scanned_at])
+
+
+def window_mask(columns: ScanColumns, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    mask = np.ones(len(columns), dtype=bool)
+    if since is not None:
+        mask &= columns.scanned_at >= to_micros(since)
+    if until is not None:
+        mask &= columns.scanned_at < to_micros(until)
+    return mask
+
+
+def activity_counts(columns: ScanColumns, mask=None) -> Dict[int, int]:
+    activity_ids = columns.activity_ids if mask is None else columns.activity_ids[mask]
+    if len(activity_ids) == 0:
+        return {}
+    counts = np.bincount(activity_ids)
+    present = np.flatnonzero(counts)
+    return dict(zip(present.tolist(), counts[present].tolist()))
+
+
+def hourly_histogram(columns: ScanColumns, mask=None) -> List[Tuple[datetime, int]]:
+    scanned_at = columns.scanned_at if mask is None else columns.scanned_at[mask]
+    hours, counts = np.unique(scanned_at // MICROS_PER_HOUR, return_counts=True)
+    return [(from_micros(hour * MICROS_PER_HOUR), count) for hour, count in zip(hours.tolist(), counts.tolist())]
+
+
+def user_sequence(columns: ScanColumns, user_id: int) -> List[Tuple[int, datetime]]:
+    # A user's scans as (activity_id, scanned_at), ordered by (scanned_at, id).
+    rows = np.flatnonzero(columns.user_ids == user_id)
+    order = rows[np.lexsort((columns.ids[rows], columns.scanned_at[rows]))]
+    return [
+        (activity_id, from_micros(at))
+        for activity_id, at in zip(columns.activity_ids[order].tolist(), columns.scanned_at[order].tolist())
+    ]
+
+
+class VectorAnalytics:
+    # Keeps a ScanColumns snapshot per event. Reads refresh it incrementally
+    # (scans past the watermark) at most every VECTOR_REFRESH_SECONDS; updates
+    # and deletes reported by the change feed force a full reload instead.
+    def __init__(self):
+        self._snapshots: Dict[int, ScanColumns] = {}
+        self._late: Dict[int, List[Tuple[int, int, int, datetime]]] = {}
+        self._stale: Set[int] = set()
+        self._lock = asyncio.Lock()
+        self._subscribed = False
+        self.stats = {"full_loads": 0, "incremental_loads": 0, "rows_loaded": 0, "last_refresh_ms": 0.0}
+
+    def metrics(self):
+        return {
+            **self.stats,
+            "engine": ANALYTICS_ENGINE if enabled() else "sql",
+            "rows_cached": sum(len(columns) for columns in self._snapshots.values()),
+        }
+
+    def on_scans(self, events: List[changefeed.ChangeEvent]):
+        for change in events:
+            if change.op == "insert" and change.row:
+                row = change.row
+                columns = self._snapshots.get(row["event_id"])
+                # Write-behind scans can commit below the watermark; they are
+                # folded in on the next refresh instead of being skipped.
+                if columns is not None and row["id"] <= columns.watermark:
+                    self._late.setdefault(row["event_id"], []).append(
+                        (row["id"], row["user_id"], row["activity_id"], datetime.fromisoformat(row["scanned_at"]))
+                    )
+            else:
+                self._stale.update(self._snapshots)
+
+    async def snapshot(self, event_id: int) -> ScanColumns:
+        if not self._subscribed:
+            changefeed.subscribe("scans", self.on_scans)
+            self._subscribed = True
+        columns = self._snapshots.get(event_id)
+        if columns is not None and event_id not in self._stale and time.monotonic() - columns.refreshed_at < VECTOR_REFRESH_SECONDS:
+            return columns
+        async with self._lock:
+            columns = self._snapshots.get(event_id)
+            if columns is None or event_id in self._stale:
+                self._stale.discard(event_id)
+                self._late.pop(event_id, None)
+                columns = ScanColumns()
+                await self._load(event_id, columns)
+                self.stats["full_loads"] += 1
+                self._snapshots[event_id] = columns
+            elif time.monotonic() - columns.refreshed_at >= VECTOR_REFRESH_SECONDS:
+                late = self._late.pop(event_id, [])
+                if late:
+                    # A late notification can arrive after the row was already loaded.
+                    known = np.isin([row[0] for row in late], columns.ids)
+                    columns.append_rows([row for row, seen in zip(late, known) if not seen])
+                await self._load(event_id, columns)
+                self.stats["incremental_loads"] += 1
+        return columns
+
+    async def _load(self, event_id: int, columns: ScanColumns):
+        started = time.perf_counter()
+        loaded = []
+        after = columns.watermark
+        async with AsyncSessionMaker() as db:
+            while True:
+                result = await db.execute(
+                    select(Scan.id, Scan.user_id, Scan.activity_id, Scan.scanned_at)
+                    .filter(Scan.event_id == event_id, Scan.id > after)
+                    .order_by(Scan.id)
+                    .limit(LOAD_CHUNK)
+                )
+                rows = result.fetchall()
+                loaded.extend(rows)
+                if len(rows) < LOAD_CHUNK:
+                    break
+                after = rows[-1][0]
+        # One concatenate for the whole load rather than one per chunk.
+        columns.append_rows(loaded)
+        self.stats["rows_loaded"] += len(loaded)
+        columns.refreshed_at = time.monotonic()
+        self.stats["last_refresh_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+
+vector_analytics = VectorAnalytics()
+metrics.register("vector_analytics", vector_analytics.metrics)
@@ -0,0 +1,11 @@
+from backend.activities import ActivityCatalog
+from backend.changefeed import ChangeEvent
+
+
+def test_activities_created_on_other_workers_match_filters():
+    catalog = ActivityCatalog()
+    catalog.on_activities([
+        ChangeEvent("activities", "insert", 42, {"id": 42, "name": "Robotics", "category": "workshop"}),
+    ])
+    assert catalog._cached_ids(None, "workshop") == [42]
+    assert catalog.name_of(42) == ("Robotics", "workshop")
@@ -0,0 +1,17 @@
+from datetime import datetime
+
+from backend.badges import BadgeIndex
+from backend.changefeed import ChangeEvent
+
+
+def test_check_ins_from_other_workers_update_the_index():
+    index = BadgeIndex()
+    index.on_registrations([
+        ChangeEvent("event_registrations", "update", row={"event_id": 1, "user_id": 5, "checked_in_at": "2024-09-13T22:00:00.5"}),
+    ])
+    assert index.checked_in_at(1, 5) == datetime(2024, 9, 13, 22, 0, 0, 500000)
+
+    index.on_registrations([
+        ChangeEvent("event_registrations", "update", row={"event_id": 1, "user_id": 5, "checked_in_at": None}),
+    ])
+    assert index.checked_in_at(1, 5) is None
@@ -0,0 +1,31 @@
+import asyncio
+
+from backend.changefeed import ChangeEvent
+from backend.coattendance import CoAttendanceIndex
+
+
+def scan(user_id: int, activity_id: int) -> ChangeEvent:
+    return ChangeEvent("scans", "insert", row={"event_id": 1, "user_id": user_id, "activity_id": activity_id})
+
+
+def test_changes_during_the_background_build_are_applied_after_it(monkeypatch):
+    async def scenario():
+        index = CoAttendanceIndex()
+        built = asyncio.Event()
+
+        async def rebuild():
+            await built.wait()
+            index.stats["rebuilds"] += 1
+
+        monkeypatch.setattr(index, "rebuild", rebuild)
+        await index.start()
+        await index.on_scans([scan(1, 10), scan(2, 10)])
+        assert not index.ready
+        assert index.suggestions(1, 1, 5) == []
+
+        built.set()
+        await index._task
+        assert index.suggestions(1, 1, 5) == [(2, 1)]
+        index.stop()
+
+    asyncio.run(scenario())
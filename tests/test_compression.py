@@ -0,0 +1,22 @@
+from backend import compression
+from backend.compression import CachedResponse, ResponseCache
+
+
+def test_entry_goes_stale_after_first_change_despite_later_writes(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(compression.time, "monotonic", lambda: clock[0])
+    cache = ResponseCache()
+    cache.put("key", CachedResponse(200, [], b"{}", clock[0], cache.generation))
+
+    # A steady write stream: one change every half second.
+    for _ in range(4):
+        clock[0] += 0.5
+        cache.invalidate()
+    assert cache.get("key") is None
+
+
+def test_entry_is_served_within_stale_window():
+    cache = ResponseCache()
+    cache.put("key", CachedResponse(200, [], b"{}", compression.time.monotonic(), cache.generation))
+    cache.invalidate()
+    assert cache.get("key") is not None
@@ -0,0 +1,14 @@
+from datetime import datetime, timedelta, timezone
+
+from backend.crud import decode_history_cursor, encode_history_cursor
+from backend.schemas import EventCreate
+
+
+def test_aware_event_dates_become_naive_utc():
+    event = EventCreate(slug="htn", name="Hack the North", starts_at="2024-09-13T18:00:00-04:00")
+    assert event.starts_at == datetime(2024, 9, 13, 22, 0)
+
+
+def test_history_cursor_with_offset_decodes_to_naive_utc():
+    cursor = encode_history_cursor(datetime(2024, 9, 14, 1, 0, tzinfo=timezone(timedelta(hours=1))), 7)
+    assert decode_history_cursor(cursor) == (datetime(2024, 9, 14, 0, 0), 7)
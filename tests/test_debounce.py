@@ -0,0 +1,30 @@
+import asyncio
+
+from backend.debounce import ScanDebouncer
+
+
+def test_duplicate_of_a_cancelled_tap_writes_the_scan_itself():
+    async def scenario():
+        debouncer = ScanDebouncer(window=10, mode="merge")
+        writes = []
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        async def write():
+            writes.append(1)
+            return "scan"
+
+        first = asyncio.create_task(debouncer.record("key", hang))
+        await started.wait()
+        duplicate = asyncio.create_task(debouncer.record("key", write))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert await duplicate == "scan"
+        assert writes == [1]
+        assert debouncer.stats["dropped"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+from backend.idempotency import IdempotencyMiddleware, IdempotencyStore
+
+
+def responder(status: int = 201):
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(dict(scope["headers"]).get(b"authorization"))
+        body = json.dumps({"call": len(calls)}).encode()
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+    return app, calls
+
+
+def request(middleware, path: str = "/scan", token: bytes = b"Bearer a", key: bytes = b"k1", query: bytes = b""):
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "query_string": query,
+        "headers": [(b"idempotency-key", key), (b"authorization", token)],
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"{}", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return sent[0]["status"], json.loads(sent[1]["body"])
+
+
+def test_keys_are_scoped_per_caller():
+    app, calls = responder()
+    middleware = IdempotencyMiddleware(app, IdempotencyStore())
+
+    assert request(middleware, token=b"Bearer a") == (201, {"call": 1})
+    assert request(middleware, token=b"Bearer b") == (201, {"call": 2})
+    assert request(middleware, token=b"Bearer a") == (201, {"call": 1})
+    assert calls == [b"Bearer a", b"Bearer b"]
+
+
+def test_auth_failures_are_not_stored():
+    app, calls = responder(401)
+    middleware = IdempotencyMiddleware(app, IdempotencyStore())
+
+    request(middleware)
+    request(middleware)
+    assert len(calls) == 2
+
+
+def test_login_is_never_replayed():
+    app, calls = responder(200)
+    middleware = IdempotencyMiddleware(app, IdempotencyStore())
+
+    request(middleware, path="/login")
+    request(middleware, path="/login")
+    assert len(calls) == 2
+
+
+def test_keys_are_scoped_by_the_event_query_parameter():
+    app, calls = responder()
+    middleware = IdempotencyMiddleware(app, IdempotencyStore())
+
+    assert request(middleware, query=b"event=htn") == (201, {"call": 1})
+    assert request(middleware, query=b"event=hackathon-b") == (201, {"call": 2})
+    assert request(middleware, query=b"event=htn") == (201, {"call": 1})
@@ -0,0 +1,31 @@
+import asyncio
+
+from backend.changefeed import ChangeEvent
+from backend.occupancy import OccupancyTracker
+
+
+def registration(op: str, user_id: int, checked_in_at=None) -> ChangeEvent:
+    return ChangeEvent("event_registrations", op, row={"event_id": 1, "user_id": user_id, "checked_in_at": checked_in_at})
+
+
+def test_new_registration_without_check_in_is_not_a_check_out():
+    async def scenario():
+        tracker = OccupancyTracker()
+        await tracker.on_registrations([registration("update", 1, "2024-09-13T22:00:00")])
+        await tracker.on_registrations([registration("insert", 2)])
+        assert tracker.snapshot(1).in_venue == 1
+
+        await tracker.on_registrations([registration("update", 1)])
+        assert tracker.snapshot(1).in_venue == 0
+
+    asyncio.run(scenario())
+
+
+def test_replayed_check_in_is_counted_once():
+    async def scenario():
+        tracker = OccupancyTracker()
+        tracker.check_in(1, 7)
+        await tracker.on_registrations([registration("insert", 7, "2024-09-13T22:00:00")])
+        assert tracker.snapshot(1).in_venue == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,16 @@
+from passlib.hash import bcrypt
+
+from backend.passwords import PASSWORD_ROUNDS_TOLERANCE, PasswordService
+
+
+def test_hashes_near_the_target_cost_are_not_rehashed():
+    service = PasswordService(["bcrypt"])
+    service.configure(bcrypt_rounds=6)
+
+    def needs_update(rounds):
+        return service.context.needs_update(bcrypt.using(rounds=rounds).hash("secret"))
+
+    assert not needs_update(6 - PASSWORD_ROUNDS_TOLERANCE)
+    assert not needs_update(6 + PASSWORD_ROUNDS_TOLERANCE)
+    assert needs_update(6 - PASSWORD_ROUNDS_TOLERANCE - 1)
+    assert needs_update(6 + PASSWORD_ROUNDS_TOLERANCE + 1)
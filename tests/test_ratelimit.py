@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from backend import ratelimit
+
+
+def login(ip: str, username: str = "hacker@example.com"):
+    request = Request({"type": "http", "headers": [], "client": (ip, 1234)})
+    return ratelimit.enforce_login_limits(request, SimpleNamespace(username=username))
+
+
+@pytest.fixture(autouse=True)
+def fresh_counters(monkeypatch):
+    monkeypatch.setattr(ratelimit, "window_store", ratelimit.MemoryWindowStore())
+    monkeypatch.setattr(ratelimit, "LOGIN_RATE_PER_IP", (1000, 60.0))
+    monkeypatch.setattr(ratelimit, "LOGIN_RATE_PER_ACCOUNT", (3, 60.0))
+    monkeypatch.setattr(ratelimit, "LOGIN_FAILURES_PER_ACCOUNT", (5, 60.0))
+
+
+def test_guessing_from_one_address_does_not_lock_out_another():
+    async def scenario():
+        for _ in range(3):
+            await login("10.0.0.1")
+        with pytest.raises(HTTPException) as limited:
+            await login("10.0.0.1")
+        assert limited.value.status_code == 429
+        await login("10.0.0.2")
+
+    asyncio.run(scenario())
+
+
+def test_failures_from_many_addresses_hit_the_account_cap():
+    async def scenario():
+        for i in range(6):
+            await login(f"10.0.1.{i}")
+            await ratelimit.record_login_failure("Hacker@example.com")
+        with pytest.raises(HTTPException):
+            await login("10.0.2.1")
+
+    asyncio.run(scenario())
+
+
+def test_reading_the_failure_cap_does_not_count():
+    async def scenario():
+        store = ratelimit.window_store
+        await login("10.0.3.1")
+        assert not any(key.startswith("login:failures:") for key, _, _ in store._counters)
+
+    asyncio.run(scenario())
@@ -0,0 +1,92 @@
+import asyncio
+
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from backend import scan_buffer as scan_buffer_module
+from backend.scan_buffer import PendingScan, ScanBuffer
+from backend.schemas import ScanCreate
+
+
+class FailingSession:
+    # Batches fail on a bad row, the per-row retry loses the connection.
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, rows):
+        if len(rows) > 1:
+            raise IntegrityError("INSERT", {}, Exception("violates foreign key"))
+        raise OperationalError("INSERT", {}, Exception("connection was closed"))
+
+    async def commit(self):
+        pass
+
+
+def pending_scan(scan_id: int, loop) -> PendingScan:
+    return PendingScan(
+        id=scan_id, event_id=1, user_id=scan_id, activity_id=1,
+        activity_name="Lunch", activity_category="Food",
+        scanned_at=scan_buffer_module.datetime.utcnow(), future=loop.create_future(),
+    )
+
+
+def test_fallback_error_resolves_waiters_and_keeps_flusher_running(monkeypatch):
+    monkeypatch.setattr(scan_buffer_module, "AsyncSessionMaker", FailingSession)
+
+    async def scenario():
+        buffer = ScanBuffer()
+        await buffer.start()
+        loop = asyncio.get_running_loop()
+        batch = [pending_scan(i, loop) for i in (1, 2)]
+        for pending in batch:
+            buffer.queue.put_nowait(pending)
+
+        for pending in batch:
+            try:
+                await asyncio.wait_for(pending.future, 1)
+            except HTTPException as e:
+                assert e.status_code == 500
+            else:
+                raise AssertionError("scan should have failed")
+        assert buffer.stats["failed_rows"] == 2
+        assert buffer.running
+
+        await buffer.stop()
+
+    asyncio.run(scenario())
+
+
+def test_submit_racing_stop_is_refused_not_stranded(monkeypatch):
+    async def scenario():
+        buffer = ScanBuffer(durability="commit")
+        await buffer.start()
+        looked_up = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_next_id():
+            looked_up.set()
+            await release.wait()
+            return 1
+
+        async def resolve(name, category):
+            return 1
+
+        monkeypatch.setattr(buffer, "_next_id", slow_next_id)
+        monkeypatch.setattr(scan_buffer_module.catalog, "resolve", resolve)
+        submit = asyncio.create_task(buffer.submit(1, ScanCreate(activity_name="Lunch", activity_category="Food"), 1))
+        await looked_up.wait()
+        await buffer.stop()
+        release.set()
+
+        try:
+            await asyncio.wait_for(submit, 1)
+        except HTTPException as e:
+            assert e.status_code == 503
+        else:
+            raise AssertionError("submit should have been refused")
+        assert buffer.queue.empty()
+
+    asyncio.run(scenario())